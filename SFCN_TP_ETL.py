@@ -5,8 +5,8 @@
 
 # Code performs the following routines:
 # ETL the Data records from the TP lab EDD.  Defines Matching Metadata information (Site_ID, Event_ID, Event_Group_ID and Visit_Type)
-# performs data transformation and appends (ETL) TP records to the  'tbl_Lab_Data_TotalPhosphorus' via the
-# 'to_sql' functionality for dataframes using the sqlAlchemyh accesspackage.
+# performs data transformation and appends (ETL) TP records to the  'tbl_Lab_Data_TotalPhosphorus' via batched
+# transactional inserts (i.e. executemany) using the sqlAlchemyh accesspackage.
 
 #Processing-Workflow details
 # Extra_Sample and QAQC Samples will need to have the 'Site_ID_QCExtra' field in the table 'tbl_Event' defined.  Lab Duplicate records need to have information
@@ -49,6 +49,10 @@ hydroYear = 2021   #Hydrological year - field season for which processing is occ
 #Periphtyon Access Database location
 inDB = r'C:\SFCN\Monitoring\Periphyton\Data\SFCN_Periphyton_20230210v2.accdb'
 
+#Periphyton DB Backend - 'access' (Access ODBC driver via pyodbc), 'sqlite' (inDB is a SQLite database file) or 'url' (inDB is a sqlAlchemy URL
+#e.g. 'mssql+pyodbc://...').  None defines the backend from inDB (i.e. URL, .sqlite/.sqlite3/.db file or Access database)
+dbBackend = None
+
 #Directory Information
 workspace = r'C:\SFCN\Monitoring\Periphyton\Data\HY2021\Tp\workspace'  # Workspace Folder
 
@@ -69,570 +73,2099 @@ mdlValue = "0.0003% P by dry weight"
 
 #Lab Identifier - (LIMS number)
 labIDvalue = None
+
+#Prefix of the Lab fields in the 'phosphorusTable' (i.e. prefix + 'Name', 'SOP', 'ID' and 'MDL' defined by 'labName', 'labSOPName', 'labIDvalue' and 'mdlValue')
+labFieldPrefix = "TP_Lab_"
+
+#Measured value fields - EDD field name (i.e. 'fieldCrossWalk1') and 'phosphorusTable' field name (in table order)
+valueFieldMap = {'Bottle weight (g)': 'Bottle_Weight_g', 'Plant weight (g)': 'Plant_Weight_g', 'Sample wet weight (g)': 'Sample_Wet_Weight_g', 'TP µg/g': 'Total_Phosphorus'}
+
+#Record key (Guid) field of the 'phosphorusTable' (see 'recordKeys')
+recordKeyField = "TotalPhosphorus_Data_ID"
+
+#Lab Duplicate 'Type' in 'tbl_LabDuplicates' of the analyte
+labDuplicateType = "Total Phosphorus"
+
+#Validation of the EDD measurements before the load (see 'validateEDD') - 'report' (exceptions exported to the workspace), 'block' (exceptions
+#exported and the load is not performed) or 'off'
+validationMode = "report"
+
+#EDD wet weight fields - Sample (wet weight) + bottle weight, Bottle weight and Sample wet weight - the Sample wet weight must equal the
+#difference of the first two within 'weightTolerance' (grams).  None to not reconcile the weights
+wetWeightFields = ['Sample (wet weight) + bottle weight (g)', 'Bottle weight (g)', 'Sample wet weight (g)']
+weightTolerance = 0.001
+
+#Text Code Flags accepted (case insensitive) in place of a numeric value in the measured value fields (i.e. 'valueFieldMap')
+valueFlags = ['<MDL', 'BDL', 'ND', 'NS', 'NA', 'QNS']
+
+#EDD sample date field - validated as a date within the Hydro Year (i.e. 'hydroYearStartMonth' of the 'hydroYear' for 12 months)
+dateField = 'Date'
+hydroYearStartMonth = 5
+
+#Suggest the nearest matching Events for the records without an Event (i.e. 'RecordsNoEventinDB') - the 'Site ID' is matched (trigram index and
+#edit distance) to the Site_Name, Site_IDLab_QCExtra and LabSiteID values of the Hydro Year and the adjacent 'suggestionYears' Hydro Years.
+#The top 'suggestionCount' Events per record are exported to 'SuggestedEvents_{date}.csv' with their score and dates
+suggestMatches = True
+suggestionCount = 3
+suggestionYears = 1
+
+#Flag the measured values of 'outlierField' (table field of 'valueFieldMap') outside the history of the Site_ID/Visit_Type (prior Hydro Years) in
+#the 'Notes' field and the Outlier Review .csv file.  The per Site_ID/Visit_Type statistics (count, median, MAD and percentiles) are kept in the
+#workspace 'StatisticsCache' folder and refreshed per Hydro Year (only Hydro Years with changed records are queried).  Set to False (or --no-outlier-flags)
+#to not flag the values.  'outlierField' None does not flag the Target
+outlierFlagging = True
+outlierField = 'Total_Phosphorus'
+
+#Robust z-score (0.6745 * |value - median| / MAD) above which a value is flagged, and the minimum count of prior Site_ID/Visit_Type values
+outlierThreshold = 3.5
+outlierMinCount = 5
+
+#Compact Frames - the working datasets hold repeated text values (e.g. Lab fields, Visit_Type, DuplicateRecord) as categorical and the numeric EDD
+#fields as float, the duplicate 'Site_IDVisible' field is not added and pandas Copy-on-Write is enabled (pandas 2.x) so slices are not copied until changed.
+#The dataset memory is added to the Run Report stages.  Set to False to keep the object (text) fields of the EDD
+compactFrames = True
+
+#Streaming Mode - number of EDD records per chunk for very large EDDs.  The EDD rows are read from the workbook in chunks (spooled to the workspace
+#'StreamSpool' folder), each chunk is resolved against the Event index (built once) and appended, so the memory is bounded by the chunk size.
+#The records loaded are the same as the in memory load.  None processes the EDD in memory (Run Mode 'load' only - the Load Journal is not written)
+streamChunkSize = None
+
+#Crosswalk Config - JSON file defining the Targets (i.e. sheets/analytes) processed from the 'inputFile' workbook in one run (see 'readCrosswalkConfig').
+#The workbook is opened once and each Target is loaded to its table.  None processes the single Target defined by the parameters above.
+crosswalkConfig = None
+
+#Number of records appended per transaction (i.e. per executemany batch) to the 'phosphorusTable' - a failed batch is rolled back
+appendChunkSize = 500
+
+#Use the pyodbc 'fast_executemany' (i.e. parameter arrays) for the append batches - Access ODBC driver support varies, set to False if the append fails
+useFastExecuteMany = False
+
+#Reconcile each load - one aggregate query of the 'phosphorusTable' for the Hydro Year (records, Duplicate Records and the sums of the weight fields
+#per Event_ID) restricted to the Event_IDs loaded is compared to the records loaded and the mismatches are exported to 'ReconciliationMismatches_{date}.csv'.  Set to False (or --no-reconcile) to not reconcile
+reconcileLoad = True
+
+#Records with an Event_ID/DuplicateRecord already loaded with different values (e.g. corrected EDD) - 'skip' (report only),
+#'replace' (existing records are deleted in the same transaction) or 'insert' (loaded in addition to the existing records)
+conflictAction = "skip"
+
+#Append Mode - 'direct' (records appended to the 'phosphorusTable' in transactional batches) or 'staging' (records bulk loaded to a scratch
+#staging table, validated with SQL and promoted to the 'phosphorusTable' with one set-based INSERT ... SELECT - loaded in full or not at all)
+appendMode = "direct"
+
+#Suffix of the scratch staging table name (i.e. 'phosphorusTable' + suffix) used when 'appendMode' is 'staging'
+stagingTableSuffix = "_Staging"
+
+#Run Mode - 'load' (extract, define and append the records), 'plan' (extract and define the records and write the Load Plan file for review -
+#nothing is appended) or 'apply' (append the records of the Load Plan - the EDD is not parsed and the Event Catalog is not queried, the Load Plan
+#is refused when the Event Catalog or the EDD changed after the plan was defined)
+runMode = "load"
+
+#Load Plan file - written in 'plan' mode (None writes '{outName}_LoadPlan.jsonl' in the workspace) and read in 'apply' mode
+planFile = None
+
+#Load Journal - the final records are written to a Load Plan in the workspace 'LoadJournal' folder before the first append batch and each committed
+#batch is recorded (flushed to disk) in the journal.  An interrupted load (e.g. driver error or crash on batch N) is continued with 'resumeLoad'.
+#The Load Plan and the journal are deleted once the load completes.  Set to True (or --journal) to journal the load.  Not used in Batch/Service Mode
+loadJournal = False
+
+#Resume the interrupted load of a Load Journal - True resumes the latest incomplete journal in the workspace 'LoadJournal' folder, or the journal file.
+#The records after the last committed batch are appended from the journal Load Plan (the EDD is not parsed and the events are not resolved)
+resumeLoad = None
+
+#Batch Mode - Directory of EDDs (*.xls, *.xlsx) or Manifest .csv file (fields: inputFile, rawDataSheet, firstRow, hydroYear) processed in one run.
+#None processes the single 'inputFile'
+batchSource = None
+
+#Number of worker processes used to extract and define the EDDs in Batch Mode (None uses the processor count)
+batchWorkers = None
+
+#Service Mode - Inbox directory watched for new EDDs (*.xls, *.xlsx).  Each EDD is processed once its size/modification time is unchanged between
+#two polls and moved with its reports to the 'Done' (loaded) or 'Failed' folder of the inbox.  The DB connection and the Event Catalog stay warm
+#between EDDs.  None does not run the Service Mode
+watchFolder = None
+
+#Seconds between the Service Mode polls of the 'watchFolder' inbox
+watchInterval = 10
+
+#Minimum level of messages written to the log file (i.e. DEBUG, INFO, WARNING or ERROR)
+logLevel = "INFO"
+
+#Also write the log messages as JSON lines (i.e. '_logfile.jsonl') for parsing of the run history
+jsonLogFile = True
+
+#Interactive Mode - Message Boxes (tkinter) confirm the QAQC/Lab Duplicate definitions and display warnings.
+#Set to False (or --non-interactive) to run headless (e.g. scheduler) - tkinter is not loaded and warnings are only logged
+interactive = True
+
+#Cache the extracted EDD (i.e. Dataset to be defined) in the workspace 'EDDCache' folder - keyed by the content hash of the EDD workbook.
+#Reruns of an unchanged EDD skip the Excel parse.
+eddCache = True
+
+#Number of leading rows read when searching for the 'firstRow' header row (the search is widened if not found)
+headerScanRows = 50
+
+#Keep a local snapshot of the hydro year Event Catalog (tbl_Event, tbl_Event_Group, tbl_Site and tbl_LabDuplicates) in the workspace 'CatalogCache' folder.
+#The snapshot is reused without querying the database while the inDB file modification time/size is unchanged, otherwise the events are re-queried
+#(the probe does not cover the Event_ID/Site_ID mapping) and a row count/max ID probe defines whether the Lab Duplicates are refreshed.
+#Set to False (or --refresh-catalog) to always query the database.
+catalogCache = True
+
+#Prefetch the hydro year Event Catalog on a background thread while the EDD workbook is parsed - joined before the events are resolved and
+#cancelled when the EDD processing fails.  Set to False (or --no-prefetch) to fetch the Event Catalog before the EDD is parsed
+prefetchCatalog = True
+
+#Write the Run Report (i.e. '_RunReport_{time}.json' next to the log file) - wall time, records in/out, peak memory and DB round trips per stage.
+#Set to False (or --no-run-report) to not instrument the stages
+runReportFile = True
+
+#Trace the peak Python memory (tracemalloc) of each Run Report stage.  Set to True (or --trace-memory) when profiling - tracing slows the
+#allocation heavy stages several fold (e.g. a 20,000 record load about 5x)
+traceMemory = False
+
 #Get Current Date
-from datetime import date
+from datetime import date, datetime
 dateString = date.today().strftime("%Y%m%d")
 
 # Define Output Name for log file
 outName = "Periphyton_TP_HydroYear_" + str(hydroYear) + "_ETL_" + dateString  # Name given to the exported pre-processed
 
-#Logifile name
-logFileName = workspace + "\\" + outName + "_logfile.txt"
-
 #######################################
 ## Below are paths which are hard coded
 #######################################
 #Import Required Libraries
 import os
-import tkinter.messagebox
+import abc
+import argparse
+import atexit
+import concurrent.futures
+import contextlib
+import hashlib
+import importlib
+import itertools
+import json
+import queue
+import shutil
+import threading
+import time
 import traceback
-import pandas as pd
+import tracemalloc
 import sys
 import uuid
 
-import sqlalchemy as sa
+#Logifile name
+logFileName = os.path.join(workspace, outName + "_logfile.txt")
+jsonLogFileName = os.path.join(workspace, outName + "_logfile.jsonl")
 
-import tkinter as tk
-from tkinter import ttk
-from tkinter.messagebox import askyesno, askyesnocancel
 
-import pyodbc
-pyodbc.pooling = False  #So you can close pydobxthe connection
-##################################
+#Heavy Libraries (pandas, numpy, sqlAlchemy) are imported on first use - importing the script does not load them.
+#pyodbc is imported when the Access engine is created (see 'DBSession.createEngine') and tkinter only in Interactive Mode.
+class LazyModule:
 
+    def __init__(self, moduleName):
+        self.moduleName = moduleName
+        self.module = None
 
-##################################
-# Checking for directories and create Logfile
-##################################
-if os.path.exists(workspace):
-    pass
-else:
-    os.makedirs(workspace)
-
-# Check for logfile
-if os.path.exists(logFileName):
-    pass
-else:
-    logFile = open(logFileName, "w")  # Creating index file if it doesn't exist
-    logFile.close()
-#################################################
-##
+    def __getattr__(self, attrName):
+        if self.module is None:
+            self.module = importlib.import_module(self.moduleName)
+        return getattr(self.module, attrName)
 
-# Function to Get the Date/Time
-def timeFun():
-    from datetime import datetime
-    b = datetime.now()
-    messageTime = b.isoformat()
-    return messageTime
 
+pd = LazyModule("pandas")
+np = LazyModule("numpy")
+sa = LazyModule("sqlalchemy")
 
-def main():
-    try:
+#Shared Periphyton DB Session for the run - see 'getSession'
+dbSession = None
 
-        ###############
-        #Confirm the QAQC Records have been defined in the 'Site_ID_QCExtra' field in the table 'tbl_Event'
-        ############
+#Deterministic record key ('recordKeyField') - Guid namespace (the key is derived from the 'recordKeyFields')
+recordKeyNamespace = uuid.UUID("ed10f8d9-be27-5b39-83a6-54be58758a22")
 
-        #Create Message Box
-        root = tk.Tk()
-        root.geometry("300x300")
-        root.title('Message Box')
-        root.lift()
-        root.attributes('-topmost', True)
-        #root.after_idle(root.attributes, '-topmost', False)
-        #root.after(8000, root.destroy)
-
-        outButton = ttk.Button(root, text='Click Me', command=confirmDef(root))
-        outButton.pack()
-        #root.withdraw()  #To Hide the Root Window
-        root.destroy()  #Destory Root Message Box
-        #Exit tkniter routine
-        root.mainloop()
+#Content hash of the EDD files hashed in the run - keyed by path, modification time and size (see 'fileHash')
+fileHashes = {}
 
-        ###############
-        # Confirm the Lab Records have been defined in the 'tbl_LabDuplicates' table
-        ############
+#Catalog Snapshots read/written in the run - keyed by the snapshot path, the snapshot files are not re-read while the process runs (e.g. Service Mode)
+catalogSnapshots = {}
 
-        # Create Message Box
-        root = tk.Tk()
-        root.geometry("300x300")
-        root.title('Message Box')
-        root.lift()
-        root.attributes('-topmost', True)
-        # root.after_idle(root.attributes, '-topmost', False)
-        # root.after(8000, root.destroy)
-
-        outButton = ttk.Button(root, text='Click Me', command=confirmDefLabDup(root))
-        outButton.pack()
-        # root.withdraw()  #To Hide the Root Window
-        root.destroy()  # Destory Root Message Box
-        # Exit tkniter routine
-        root.mainloop()
+#Site Statistics Caches read/written in the run - keyed by the cache folder (see 'statisticsCachePath')
+statisticsCaches = {}
 
-        #####################
-        #Process the Raw Data defining the Dataset to be processed
-        #####################
+#Number of Event_IDs bound per statement in the existence check against 'phosphorusTable'
+existenceCheckChunkSize = 200
 
-        rawDataDf = pd.read_excel(inputFile, sheet_name=rawDataSheet)
+#Run Logger for the run - see 'logMessage'
+runLogger = None
 
-        # Find Record Index values with the 'firstRow' value  - This will be used to subset datasets one and two
-        indexDf = rawDataDf[rawDataDf.iloc[:, 0] == firstRow]
+#Run Report for the run - see 'stageSpan'
+runReport = None
 
-        # Define first Index Value  - This is the
-        indexFirst = indexDf.index.values[0]
-        indexFirstPlus1 = indexFirst + 1
+#Count of statements executed on the Periphyton DB (all sessions) - see 'countRoundTrip'
+dbRoundTrips = 0
+##################################
 
-         # Create Data Frame with Header Columns Removed - This will be Dataset One
-        rawDataDfOneNoHeader = rawDataDf[indexFirstPlus1:]
 
-        #Define number of Columns expected - pulling from cross-walk list
-        columnCount = len(fieldCrossWalk1)
+##################################
+# Script parameters which can be defined via the command line (see 'parseArguments') or when used as a library (see 'configure')
+##################################
+parameterNames = ['inputFile', 'rawDataSheet', 'firstRow', 'hydroYear', 'inDB', 'dbBackend', 'workspace', 'batchSource', 'batchWorkers',
+                  'appendChunkSize', 'useFastExecuteMany', 'logLevel', 'jsonLogFile', 'interactive', 'eddCache', 'headerScanRows',
+                  'catalogCache', 'conflictAction', 'runReportFile', 'traceMemory', 'appendMode', 'crosswalkConfig', 'fieldCrossWalk1',
+                  'phosphorusTable', 'labName', 'labSOPName', 'mdlValue', 'labIDvalue', 'labFieldPrefix', 'valueFieldMap', 'recordKeyField',
+                  'labDuplicateType', 'validationMode', 'wetWeightFields', 'weightTolerance', 'valueFlags', 'dateField', 'hydroYearStartMonth',
+                  'compactFrames', 'runMode', 'planFile', 'loadJournal', 'resumeLoad', 'prefetchCatalog', 'watchFolder', 'watchInterval',
+                  'suggestMatches', 'suggestionCount', 'suggestionYears', 'outlierFlagging', 'outlierField', 'outlierThreshold',
+                  'outlierMinCount', 'streamChunkSize', 'reconcileLoad']
 
-        # Check if imported Column List is > defined fields in 'fieldCrossWalk1'.
-        columnList = rawDataDfOneNoHeader.columns
-        # Get Count of Columns in imported DF
-        columnCountDf = len(columnList)
+#Parameters which can be defined per Target in the Crosswalk Config (see 'readCrosswalkConfig')
+targetParameterNames = ['rawDataSheet', 'firstRow', 'fieldCrossWalk1', 'phosphorusTable', 'labName', 'labSOPName', 'mdlValue', 'labIDvalue',
+                        'labFieldPrefix', 'valueFieldMap', 'recordKeyField', 'labDuplicateType', 'wetWeightFields', 'weightTolerance', 'valueFlags',
+                        'dateField', 'outlierField']
 
-        #Print Warning if imported column count isn't as defiend in 'fieldCrossWalk1
-        if columnCountDf > columnCount:
 
-            # #Define column after which should be truncated - removing blank fields - is the intention
-            truncateField = columnList[columnCount - 1]
-            print("WARNING - Truncating after field: " + str(truncateField))
+#Define the script parameters (i.e. in place of editing the parameters at the top of the script) - the Output/Log file names are redefined
+#parameters - Parameter Name and Value (see 'parameterNames') - None values are ignored
+def configure(**parameters):
+    global outName, logFileName, jsonLogFileName
+    for parameterName, parameterValue in parameters.items():
+        if parameterName not in parameterNames:
+            raise ValueError("Unknown parameter: " + parameterName)
+        if parameterValue is not None:
+            globals()[parameterName] = parameterValue
 
-            root = tk.Tk()
-            root.geometry("500x300")
-            root.title('Question Box')
-            root.lift()
-            root.attributes('-topmost', True)
+    outName = "Periphyton_TP_HydroYear_" + str(hydroYear) + "_ETL_" + dateString
+    logFileName = os.path.join(workspace, outName + "_logfile.txt")
+    jsonLogFileName = os.path.join(workspace, outName + "_logfile.jsonl")
 
-            tkinter.messagebox.showwarning("showwarning", "WARNING - Truncating Imported Dataset after field: " + str(truncateField))
-            root.destroy()
-            root.mainloop()
 
-            messageTime = timeFun()
-            scriptMsg = "WARNING - Truncating Imported Dataset after field: " + str(truncateField) + " - " + messageTime
-            print(scriptMsg)
-            logFile = open(logFileName, "a")
-            logFile.write(scriptMsg + "\n")
-            logFile.close()
+#Current script parameters - used to define the parameters in the Batch Mode worker processes
+def currentParameters():
+    return {parameterName: globals()[parameterName] for parameterName in parameterNames}
 
-            exit()
 
-        #############################
-        # Remove columns without Data
-        #############################
-        df_DatasetToDefine = rawDataDfOneNoHeader.drop(rawDataDfOneNoHeader.iloc[:, columnCount:], axis=1)
-        # Rename Header Columns
-        df_DatasetToDefine.columns = fieldCrossWalk1
-        del rawDataDfOneNoHeader
+#Define the script parameters for a Target - the base parameters (i.e. 'currentParameters') with the Target values.  Target None (null) values
+#are retained (e.g. 'wetWeightFields' or 'dateField' None to not validate the Target weights/dates)
+def applyTargetParameters(baseParameters, targetParameters):
+    globals().update(baseParameters)
+    configure(**targetParameters)
+    globals().update({parameterName: parameterValue for parameterName, parameterValue in targetParameters.items() if parameterValue is None})
 
-        # Add Metadata field which will be updated during processing
-        # Add Site_IDVisibile  - so can see Site_ID when being used as an Index
-        df_DatasetToDefine['Site_IDVisible'] = df_DatasetToDefine['Site ID']
-        df_DatasetToDefine['Event_ID'] = None
-        df_DatasetToDefine['Event_Group_ID'] = None
-        df_DatasetToDefine['Site_ID'] = None
-        df_DatasetToDefine['Visit_Type'] = None
-        df_DatasetToDefine['DuplicateRecord'] = None
 
-        #Reset Index
-        df_DatasetToDefine.reset_index(drop=True, inplace=True)
+#Read the Crosswalk Config - JSON file with the list of Targets (sheet/analyte) processed from the workbook, each Target defined by a 'name'
+#and the 'targetParameterNames' values (values not defined use the script parameters) e.g.
+#{"targets": [{"name": "TP", "rawDataSheet": "datasheet", "firstRow": "Sampling", "fieldCrossWalk1": ["Sampling", "Site ID", ...],
+#              "phosphorusTable": "tbl_Lab_Data_TotalPhosphorus", "labName": "...", "valueFieldMap": {"TP µg/g": "Total_Phosphorus", ...}}]}
+#inConfig - Crosswalk Config .json file
+#Returns list of (Target Name, Target Parameters)
+def readCrosswalkConfig(inConfig):
+    with open(inConfig, "r", encoding="utf-8") as configFile:
+        configDict = json.load(configFile)
 
-        # Set Index to the 'Site ID' field
-        df_DatasetToDefine.set_index('Site ID', inplace=True)
+    targetList = []
+    for targetNumber, targetDict in enumerate(configDict['targets']):
+        targetParameters = dict(targetDict)
+        targetName = str(targetParameters.pop('name', "Target" + str(targetNumber + 1)))
+        for parameterName in targetParameters:
+            if parameterName not in targetParameterNames:
+                raise ValueError("Unknown Target parameter: " + parameterName + " - Target: " + targetName + " - " + inConfig)
+        targetList.append((targetName, targetParameters))
 
+    targetNames = [targetName for targetName, targetParameters in targetList]
+    if len(targetList) == 0 or len(set(targetNames)) != len(targetNames):
+        raise ValueError("Crosswalk Config must define one or more Targets with unique names - " + inConfig)
 
-        ###############################
-        # Identify the Records with a Visti Type of 'Standard' and a 1 to 1 relationship via a join on Site Name by hydro year via query to tlu_Sites and tbl_Events
-        ##############################
-        outVal = defineRecords (df_DatasetToDefine, hydroYear, "Standard")
-        if outVal[0].lower() != "success function":
-            print("WARNING - Function defineVisitType - Failed - Exiting Script")
-            exit()
-        else:
-            print("Success - Function defineVisitType")
-            outDF_1to1 = outVal[1]
+    return targetList
 
-        #Update records in 'df_DatasetToDefine' with records in 'outDF_Standard'  (i.e. Standard Events with 1 to 1 in defined field year
-        outVal = update_definedRecords(outDF_1to1, df_DatasetToDefine, "No")
-        if outVal.lower() != "success function":
-            print("WARNING - Function update_definedRecords - Standard - Failed - Exiting Script")
-            exit()
-        else:
-            print("Success - Function update_definedRecords - Standard")
 
+#Record key fields - the Event_ID, DuplicateRecord and the measured value fields (i.e. 'valueFieldMap') the 'recordKeyField' is derived from
+def recordKeyFields():
+    return ['Event_ID', 'DuplicateRecord'] + list(valueFieldMap.values())
 
-        #Identify Count where 'Event_ID' is null
-        recCountNull = df_DatasetToDefine['Event_ID'].isnull().sum()
-        print("Count of records with Null 'Event_ID' values after Processing 'Standard' events:" + str(recCountNull))
 
-        ###############################
-        # Identify the Records with a Visit Type of 'Extra Sample' and a 1 to 1 relationship via a join on Site Name by hydro year via query to tlu_Sites and tbl_Events
-        ##############################
-        outVal = defineRecords(df_DatasetToDefine, hydroYear, "Extra Sample")
-        if outVal[0].lower() != "success function":
-            print("WARNING - Function defineVisitType - Extra Sample - Failed - Exiting Script")
-            exit()
-        else:
-            print("Success - Function defineVisitType")
-            outDF_1to1 = outVal[1]
+#Lab fields of the 'phosphorusTable' and their values - 'labFieldPrefix' + Name, SOP, ID and MDL
+def labFields():
+    return {labFieldPrefix + 'Name': labName, labFieldPrefix + 'SOP': labSOPName, labFieldPrefix + 'ID': labIDvalue, labFieldPrefix + 'MDL': mdlValue}
 
-        #Update records in 'df_DatasetToDefine' with records in 'outDF_Standard'  (i.e. Standard Events with 1 to 1 in defined field year
-        outVal = update_definedRecords(outDF_1to1, df_DatasetToDefine, "No")
-        if outVal.lower() != "success function":
-            print("WARNING - Function update_definedRecords - Extra Sample - Failed - Exiting Script")
-            exit()
-        else:
-            print("Success - Function update_definedRecords - Extra Sample")
 
+##################################
+# Checking for directories and create Logfile - called at the start of the run (not on import)
+##################################
+def setupWorkspace():
+    if os.path.exists(workspace):
+        pass
+    else:
+        os.makedirs(workspace)
 
-        # Identify Count where 'Event_ID' is null
-        recCountNull = df_DatasetToDefine['Event_ID'].isnull().sum()
-        print("Count of records with Null 'Event_ID' values after Processing 'Standard and Extra Sample' events:" + str(recCountNull))
+    # Check for logfile
+    if os.path.exists(logFileName):
+        pass
+    else:
+        logFile = open(logFileName, "w")  # Creating index file if it doesn't exist
+        logFile.close()
+#################################################
+##
 
-        ###############################
-        # Identify the Records with a Visit Type of 'Pilot-Spatial' and a 1 to 1 relationship via a join on Site Name by hydro year via query to tlu_Sites and tbl_Events
-        ##############################
-        outVal = defineRecords(df_DatasetToDefine, hydroYear, "Pilot - Spatial")
-        if outVal[0].lower() != "success function":
-            print("WARNING - Function defineVisitType - Pilot - Spatial - Failed - Exiting Script")
-            exit()
-        else:
-            print("Success - Function defineVisitType")
-            outDF_1to1 = outVal[1]
+# Function to Get the Date/Time
+def timeFun():
+    b = datetime.now()
+    messageTime = b.isoformat()
+    return messageTime
 
-        # Update records in 'df_DatasetToDefine' with records in 'outDF_Standard'  (i.e. Standard Events with 1 to 1 in defined field year
-        outVal = update_definedRecords(outDF_1to1, df_DatasetToDefine, "No")
-        if outVal.lower() != "success function":
-            print("WARNING - Function update_definedRecords - Pilot - Spatial - Failed - Exiting Script")
-            exit()
-        else:
-            print("Success - Function update_definedRecords - Pilot - Spatial")
 
+#Run Logger - keeps the log file (and optional JSON lines file) open for the run with buffered writes.
+#Buffers are flushed on 'flush'/'close' (i.e. at exit, on an exception and at the end of the run).
+#logFileName - Text log file
+#jsonLogFileName - JSON lines log file (None to not write the JSON lines)
+#level - Minimum level of messages written (i.e. DEBUG, INFO, WARNING or ERROR)
+class RunLogger:
+
+    levels = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+    def __init__(self, logFileName, jsonLogFileName=None, level="INFO", bufferSize=65536):
+        self.minLevel = self.levels[level.upper()]
+        self.logFile = open(logFileName, "a", buffering=bufferSize)
+        self.jsonFile = None
+        if jsonLogFileName is not None:
+            self.jsonFile = open(jsonLogFileName, "a", buffering=bufferSize, encoding="utf-8")
+
+    #Write message to the log - 'fields' are added to the JSON line (e.g. function name, record counts)
+    def log(self, scriptMsg, level="INFO", **fields):
+        level = level.upper()
+        if self.levels[level] < self.minLevel:
+            return
+
+        self.logFile.write(scriptMsg + "\n")
+        if self.jsonFile is not None:
+            jsonRecord = {"time": timeFun(), "level": level, "message": scriptMsg}
+            jsonRecord.update(fields)
+            self.jsonFile.write(json.dumps(jsonRecord, default=str) + "\n")
+
+    def flush(self):
+        self.logFile.flush()
+        if self.jsonFile is not None:
+            self.jsonFile.flush()
+
+    def close(self):
+        self.logFile.close()
+        if self.jsonFile is not None:
+            self.jsonFile.close()
+
+
+#Write message to the Run Logger - the Run Logger is created on first call and closed at exit
+#scriptMsg - Message written to the log file
+#level - Message Level (i.e. DEBUG, INFO, WARNING or ERROR)
+#fields - Additional values added to the JSON line
+def logMessage(scriptMsg, level="INFO", **fields):
+    global runLogger
+    if runLogger is None:
+        runLogger = RunLogger(logFileName, jsonLogFileName if jsonLogFile else None, logLevel)
+        atexit.register(closeRunLogger)
+
+    runLogger.log(scriptMsg, level, **fields)
+
+
+#Refresh the run date - 'dateString' and the names derived from it ('outName' and the log files) are recomputed when the date has changed
+#since they were defined (e.g. Service Mode running past midnight) and the Run Logger is rotated to the log files of the new date
+#Returns True when the date changed
+def refreshRunDate():
+    global dateString
+    todayString = date.today().strftime("%Y%m%d")
+    if todayString == dateString:
+        return False
+
+    priorLogFile = logFileName
+    closeRunLogger()
+    dateString = todayString
+    configure()
+    setupWorkspace()
+    logMessage("Run date changed to " + dateString + " - log continued from: " + priorLogFile + " - " + timeFun(), "INFO", function="refreshRunDate",
+               priorLogFile=priorLogFile)
+    return True
+
+
+#Flush the Run Logger buffers to the log files
+def flushRunLogger():
+    if runLogger is not None:
+        runLogger.flush()
+
+
+#Close the Run Logger - flushing the buffers
+def closeRunLogger():
+    global runLogger
+    if runLogger is not None:
+        runLogger.close()
+        runLogger = None
+
+
+#Run Report - one span per stage (i.e. Excel read, header scan, each DB query, each resolution pass, append) with the wall time,
+#records in/out, peak traced memory and DB round trips.  Spans may be nested - the open spans are kept per thread (Batch Mode writer thread).
+class RunReport:
+
+    def __init__(self):
+        self.startTime = timeFun()
+        self.startCounter = time.perf_counter()
+        self.spans = []
+        self.spanLock = threading.Lock()
+        self.threadState = threading.local()
+        self.startedTracing = False
+
+    #Open spans of the current thread
+    def openSpans(self):
+        if not hasattr(self.threadState, "openSpans"):
+            self.threadState.openSpans = []
+        return self.threadState.openSpans
+
+    def openSpan(self, span):
+        openSpans = self.openSpans()
+        span['parent'] = openSpans[-1][0]['stage'] if len(openSpans) > 0 else None
+        span['depth'] = len(openSpans)
+        span['startTime'] = timeFun()
+        spanState = {'counter': time.perf_counter(), 'roundTrips': dbRoundTrips, 'memoryStart': None, 'peak': 0}
+
+        if traceMemory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.startedTracing = True
+            #The traced peak is reset for the span - the peak so far is kept by the parent span
+            if len(openSpans) > 0:
+                openSpans[-1][1]['peak'] = max(openSpans[-1][1]['peak'], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            spanState['memoryStart'] = tracemalloc.get_traced_memory()[0]
+
+        openSpans.append((span, spanState))
+
+    def closeSpan(self):
+        openSpans = self.openSpans()
+        span, spanState = openSpans.pop()
+        span['seconds'] = round(time.perf_counter() - spanState['counter'], 6)
+        span['dbRoundTrips'] = dbRoundTrips - spanState['roundTrips']
+
+        if spanState['memoryStart'] is not None and tracemalloc.is_tracing():
+            memoryCurrent, memoryPeak = tracemalloc.get_traced_memory()
+            memoryPeak = max(memoryPeak, spanState['peak'])
+            span['peakMemoryMB'] = round(memoryPeak / 1048576, 3)
+            span['memoryChangeMB'] = round((memoryCurrent - spanState['memoryStart']) / 1048576, 3)
+            if len(openSpans) > 0:
+                openSpans[-1][1]['peak'] = max(openSpans[-1][1]['peak'], memoryPeak)
+
+        with self.spanLock:
+            self.spans.append(span)
+
+    #Add spans recorded in another process (i.e. Batch Mode workers) - 'fields' are added to each span (e.g. inputFile)
+    def addSpans(self, spanList, **fields):
+        with self.spanLock:
+            self.spans.extend(dict(span, **fields) for span in spanList)
+
+    #Return and clear the closed spans
+    def takeSpans(self):
+        with self.spanLock:
+            spanList = self.spans
+            self.spans = []
+        return spanList
+
+    #Totals by stage name (count, seconds, records in/out, DB round trips and max peak memory)
+    def stageTotals(self):
+        totals = {}
+        for span in self.spans:
+            stageTotal = totals.setdefault(span['stage'], {'count': 0, 'seconds': 0.0, 'rowsIn': 0, 'rowsOut': 0, 'dbRoundTrips': 0, 'peakMemoryMB': None})
+            stageTotal['count'] += 1
+            stageTotal['seconds'] = round(stageTotal['seconds'] + span['seconds'], 6)
+            stageTotal['rowsIn'] += span['rowsIn'] or 0
+            stageTotal['rowsOut'] += span['rowsOut'] or 0
+            stageTotal['dbRoundTrips'] += span['dbRoundTrips']
+            if span.get('peakMemoryMB') is not None:
+                stageTotal['peakMemoryMB'] = max(stageTotal['peakMemoryMB'] or 0, span['peakMemoryMB'])
+        return totals
+
+    #Write the Run Report .json file
+    def write(self, outFull, **fields):
+        reportDict = {'script': "SFCN_TP_ETL.py", 'startTime': self.startTime, 'endTime': timeFun(),
+                      'seconds': round(time.perf_counter() - self.startCounter, 6), 'dbRoundTrips': dbRoundTrips}
+        reportDict.update(fields)
+        reportDict['stageTotals'] = self.stageTotals()
+        reportDict['spans'] = sorted(self.spans, key=lambda span: span['startTime'])
+
+        with open(outFull, "w", encoding="utf-8") as reportFile:
+            json.dump(reportDict, reportFile, indent=2, default=str)
+
+    def close(self):
+        if self.startedTracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+#Get the Run Report for the run - created on first call
+def getRunReport():
+    global runReport
+    if runReport is None:
+        runReport = RunReport()
+
+    return runReport
+
+
+#Record a Run Report span for the stage (no-op when 'runReportFile' is False).  The yielded span dictionary can be updated by the
+#stage (e.g. span['rowsOut'] = len(outDf)) - the status is 'success', 'failed' (exception raised) or 'exited' (exit() called).
+#stageName - Stage name (totaled by name in the report)
+#rowsIn - Records into the stage
+#fields - Additional values added to the span (e.g. passType)
+@contextlib.contextmanager
+def stageSpan(stageName, rowsIn=None, **fields):
+    span = {'stage': stageName, 'rowsIn': rowsIn, 'rowsOut': None, 'status': "success"}
+    span.update(fields)
+    if not runReportFile:
+        yield span
+        return
+
+    report = getRunReport()
+    report.openSpan(span)
+    try:
+        yield span
+    except SystemExit:
+        span['status'] = "exited"
+        raise
+    except BaseException:
+        span['status'] = "failed"
+        raise
+    finally:
+        report.closeSpan()
+
+
+#Write the Run Report for the run to the workspace (next to the log file) and close it
+#runStatus - Outcome of the run (e.g. "success function")
+#fields - Additional values added to the report (e.g. inputFile)
+#Returns the Run Report file (None when not written)
+def writeRunReport(runStatus, **fields):
+    global runReport
+    if runReport is None:
+        return
 
-        # Identify Count where 'Event_ID' is null
-        recCountNull = df_DatasetToDefine['Event_ID'].isnull().sum()
-        print("Count of records with Null 'Event_ID' values after Processing Standard, Extra Sample and Pilot-Spatial events:" + str(recCountNull))
+    try:
+        outFull = os.path.join(workspace, outName + "_RunReport_" + datetime.now().strftime("%H%M%S") + ".json")
+        runReport.write(outFull, status=runStatus, hydroYear=hydroYear, **fields)
 
+        messageTime = timeFun()
+        scriptMsg = "Run Report exported: " + outFull + " - " + messageTime
+        print(scriptMsg)
+        logMessage(scriptMsg, "INFO", function="writeRunReport", outFile=outFull)
+        return outFull
+    except:
+        messageTime = timeFun()
+        print("Error on writeRunReport Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return None
+    finally:
+        runReport.close()
+        runReport = None
+
+
+#Count the statements executed on the Periphyton DB - sqlAlchemy 'before_cursor_execute' listener (an executemany batch is one round trip)
+def countRoundTrip(conn, cursor, statement, parameters, context, executemany):
+    global dbRoundTrips
+    dbRoundTrips += 1
+
+
+#Confirm the QAQC/Field Duplicate and Lab Duplicate Records have been defined in the Periphyton DB - via Message Boxes (Interactive Mode)
+def confirmPrerequisites():
+
+    import tkinter as tk
+    from tkinter import ttk
+
+    ###############
+    #Confirm the QAQC Records have been defined in the 'Site_ID_QCExtra' field in the table 'tbl_Event'
+    ############
+
+    #Create Message Box
+    root = tk.Tk()
+    root.geometry("300x300")
+    root.title('Message Box')
+    root.lift()
+    root.attributes('-topmost', True)
+    #root.after_idle(root.attributes, '-topmost', False)
+    #root.after(8000, root.destroy)
+
+    outButton = ttk.Button(root, text='Click Me', command=confirmDef(root))
+    outButton.pack()
+    #root.withdraw()  #To Hide the Root Window
+    root.destroy()  #Destory Root Message Box
+    #Exit tkniter routine
+    root.mainloop()
+
+    ###############
+    # Confirm the Lab Records have been defined in the 'tbl_LabDuplicates' table
+    ############
+
+    # Create Message Box
+    root = tk.Tk()
+    root.geometry("300x300")
+    root.title('Message Box')
+    root.lift()
+    root.attributes('-topmost', True)
+    # root.after_idle(root.attributes, '-topmost', False)
+    # root.after(8000, root.destroy)
+
+    outButton = ttk.Button(root, text='Click Me', command=confirmDefLabDup(root))
+    outButton.pack()
+    # root.withdraw()  #To Hide the Root Window
+    root.destroy()  # Destory Root Message Box
+    # Exit tkniter routine
+    root.mainloop()
+
+
+#Process the single EDD 'inputFile' - Returns "success function" or "failed function"
+def main():
+    runStatus = "failed function"
+    baseParameters = currentParameters()
+    try:
 
-        ###############################
-        # Identify the Records with a Visit Type of 'QAQC' and a 1 to 1 relationship via a join on Site Name by hydro year via query to tlu_Sites and tbl_Events
-        ##############################
-        outVal = defineRecords_Site_IDLab_QCExtra(df_DatasetToDefine, hydroYear, "QAQC")
-        if outVal[0].lower() != "success function":
-            print("WARNING - Function defineVisitType - QAQC - Failed - Exiting Script")
-            exit()
-        else:
-            print("Success - Function defineVisitType - QAQC")
-            outDF_1to1 = outVal[1]
+        setupWorkspace()
+        enableCopyOnWrite()
 
-        # Update records in 'df_DatasetToDefine' with records in 'outDF_Standard'  (i.e. Standard Events with 1 to 1 in defined field year
-        outVal = update_definedRecords(outDF_1to1, df_DatasetToDefine, "No")
-        if outVal.lower() != "success function":
-            print("WARNING - Function update_definedRecords - Standard - Failed - Exiting Script")
-            exit()
+        #Confirm the QAQC/Field Duplicate and Lab Duplicate Records have been defined
+        if interactive:
+            confirmPrerequisites()
         else:
-            print("Success - Function update_definedRecords - QAQC")
-
-        # Identify Count where 'Event_ID' is null
-        recCountNull = df_DatasetToDefine['Event_ID'].isnull().sum()
-        print("Count of records with Null 'Event_ID' values after Processing 'Standard, Extra Sample, Pilot-Spatial and QAQC' events:" + str(recCountNull))
+            logMessage("Non-Interactive Mode - QAQC/Field Duplicate and Lab Duplicate definitions not confirmed - " + timeFun(), "INFO", function="main")
 
-        ############################### - Replace with Lab Duplicate Processing and
-        # Identify the Records with a LabDuplicate = 'Yes' value.  via query to tlu_Sites, tbl_Events and the 'tbl_LabDuplicates' table and 'LabDupSuffix' field.
+        ###############################
+        # Prefetch the Hydro Year Event Catalog (tbl_Event, tbl_Event_Group, tbl_Site and tbl_LabDuplicates) in one connection.
+        # The Standard, Extra Sample, Pilot - Spatial, QAQC and Lab Duplicate resolution of every Target runs against this snapshot.
+        # With 'prefetchCatalog' the catalog is fetched on a background thread while the Target sheets are parsed (see 'CatalogPrefetch').
         ##############################
-        outVal = defineRecords_LabDuplicates(df_DatasetToDefine, hydroYear, "Total Phosphorus")
-        if outVal[0].lower() != "success function":
-            print("WARNING - Function defineRecords_LabDuplicates - Failed - Exiting Script")
-            exit()
-        else:
-            print("Success - Function defineRecords_LabDuplicates")
-            outDF_1to1 = outVal[1]
-
-        # Update records in 'df_DatasetToDefine' with records in 'outDF_Standard'  (i.e. Standard Events with 1 to 1 in defined field year
-        outVal = update_definedRecords(outDF_1to1, df_DatasetToDefine, "Yes")
-        if outVal.lower() != "success function":
-            print("WARNING - Function update_definedRecords - Lab Duplicate - Failed - Exiting Script")
-            exit()
+        eventCatalog = None
+        catalogPrefetch = None
+        if prefetchCatalog:
+            catalogPrefetch = CatalogPrefetch(hydroYear)
         else:
-            print("Success - Function update_definedRecords - Lab Duplicate")
-
-        # Identify Count where 'Event_ID' is null
-        recCountNull = df_DatasetToDefine['Event_ID'].isnull().sum()
-        print("Count of records with Null 'Event_ID' values after Processing Standard, Extra Sample, Pilot-Spatial,"\
-                "QAQC and Lab Duplicate events:" + str(recCountNull))
-
-        #If Undefined Records Exit Script these need to be defined:
-        if recCountNull > 0:
-
-            outVal = nullRecordsGt0(recCountNull, df_DatasetToDefine)
-            if outVal.lower() != "success function":
-                print("WARNING - Function nullRecordsGt0 - Failed - Exiting Script")
-
+            outVal = CatalogPrefetch.fetch(hydroYear)
+            if outVal[0].lower() != "success function":
+                print("WARNING - Function fetchEventCatalog - Failed - Exiting Script")
+                exit()
             else:
-                print("Success - Function nullRecordsGt0")
-
-            exit()
+                print("Success - Function fetchEventCatalog")
+                eventCatalog = outVal[1]
 
-        #Add the following fields with defined values: 'TP_Lab_Name','TP_Lab_SOP','TP_Lab_ID','TP_Lab_MDL' in script above
-        df_DatasetToDefine['TP_Lab_Name'] = labName
-        df_DatasetToDefine['TP_Lab_SOP'] = labSOPName
-        df_DatasetToDefine['TP_Lab_ID'] = labIDvalue
-        df_DatasetToDefine['TP_Lab_MDL'] = mdlValue
-        df_DatasetToDefine['Notes'] = None
+        #Targets (sheet/analyte) processed from the workbook - the script parameters when 'crosswalkConfig' is None
+        targetList = readCrosswalkConfig(crosswalkConfig) if crosswalkConfig is not None else [(None, {})]
+        workbook = EDDWorkbook(inputFile)
+        resolvedList = []
+        try:
+            for targetName, targetParameters in targetList:
+                applyTargetParameters(baseParameters, targetParameters)
+                targetSuffix = "" if targetName is None else "_" + targetName
+
+                #####################
+                #Process the Raw Data defining the Dataset to be processed
+                #####################
+                with stageSpan("extractEDD", target=targetName) as span:
+                    outVal = extractEDD(inputFile, rawDataSheet, firstRow, workbook)
+                    span['rowsOut'] = len(outVal[1]) if outVal[0].lower() == "success function" else None
+                    if runReportFile and outVal[0].lower() == "success function":
+                        span['frameMemoryMB'] = frameMemoryMB(outVal[1])
+                if outVal[0].lower() == "truncate warning":
+                    truncateWarning(outVal[1], targetName)
+                    exit()
+
+                elif outVal[0].lower() != "success function":
+                    print("WARNING - Function extractEDD - Failed - Exiting Script")
+                    exit()
+                else:
+                    print("Success - Function extractEDD - Sheet: " + rawDataSheet)
+                    df_DatasetToDefine = outVal[1]
+
+                #Prefetched Event Catalog failed - the remaining Targets are not processed
+                if catalogPrefetch is not None and catalogPrefetch.failed():
+                    print("WARNING - Function fetchEventCatalog - Failed - Exiting Script")
+                    exit()
+
+                #Validate the EDD measurements - Exit Script when exceptions are found and 'validationMode' is 'block'
+                if validationMode != "off":
+                    outExceptionsCSV = os.path.join(workspace, "ValidationExceptions" + targetSuffix + "_" + dateString + ".csv")
+                    with stageSpan("validateEDD", rowsIn=len(df_DatasetToDefine), target=targetName) as span:
+                        outVal = validateEDD(df_DatasetToDefine, outExceptionsCSV)
+                        span['rowsOut'] = outVal[1] if outVal[0].lower() == "success function" else None
+                    if outVal[0].lower() != "success function":
+                        print("WARNING - Function validateEDD - Failed - Exiting Script")
+                        exit()
+                    elif outVal[1] > 0 and validationMode == "block":
+                        messageTime = timeFun()
+                        scriptMsg = "WARNING - " + str(outVal[1]) + " - Validation Exceptions - Sheet: " + rawDataSheet + " - Load blocked (validationMode 'block') - Exiting Script - " + messageTime
+                        print(scriptMsg)
+                        logMessage(scriptMsg, "WARNING", function="main", exceptions=outVal[1], target=targetName, outFile=outExceptionsCSV)
+                        exit()
+                    else:
+                        print("Success - Function validateEDD")
+
+                #Join the prefetched Event Catalog (first Target)
+                if eventCatalog is None:
+                    outVal = catalogPrefetch.result()
+                    if outVal[0].lower() != "success function":
+                        print("WARNING - Function fetchEventCatalog - Failed - Exiting Script")
+                        exit()
+                    else:
+                        print("Success - Function fetchEventCatalog")
+                        eventCatalog = outVal[1]
+
+                ###############################
+                # Define the Event_ID, Event_Group_ID, Site_ID, Visit_Type and DuplicateRecord fields - Standard, Extra Sample, Pilot - Spatial, QAQC and Lab Duplicate priority
+                ##############################
+                outAmbiguousCSV = os.path.join(workspace, "AmbiguousMatches" + targetSuffix + "_" + dateString + ".csv")
+                with stageSpan("resolveEvents", rowsIn=len(df_DatasetToDefine), target=targetName) as span:
+                    outVal = resolveEvents(df_DatasetToDefine, eventCatalog, outAmbiguousCSV)
+                    span['rowsOut'] = len(df_DatasetToDefine) - outVal[1] if outVal[0].lower() == "success function" else None
+                    if runReportFile:
+                        span['frameMemoryMB'] = frameMemoryMB(df_DatasetToDefine)
+                if outVal[0].lower() != "success function":
+                    print("WARNING - Function resolveEvents - Failed - Exiting Script")
+                    exit()
+                else:
+                    print("Success - Function resolveEvents")
+                    resolvedList.append((targetName, targetParameters, df_DatasetToDefine, outVal[1]))
+
+        finally:
+            workbook.close()
+            #Cancel the Event Catalog prefetch (when the EDD processing failed) and wait for the thread before the DB session is closed
+            if catalogPrefetch is not None:
+                catalogPrefetch.close()
+
+        #If Undefined Records (any Target) Exit Script these need to be defined - no Target is appended
+        with stageSpan("nullRecordCheck", rowsIn=sum(len(resolvedItem[2]) for resolvedItem in resolvedList)) as span:
+            span['rowsOut'] = sum(resolvedItem[3] for resolvedItem in resolvedList)
+            if span['rowsOut'] > 0:
+
+                catalogList = None
+                for targetName, targetParameters, df_DatasetToDefine, recCountNull in resolvedList:
+                    if recCountNull == 0:
+                        continue
+
+                    targetSuffix = "" if targetName is None else "_" + targetName
+                    outFull = os.path.join(workspace, "RecordsNoEventinDB" + targetSuffix + "_" + dateString + ".csv")
+                    outVal = nullRecordsGt0(recCountNull, df_DatasetToDefine, outFull)
+                    if outVal.lower() != "success function":
+                        print("WARNING - Function nullRecordsGt0 - Failed - Exiting Script")
+
+                    else:
+                        print("Success - Function nullRecordsGt0")
+
+                    #Nearest matching Events for the records - Hydro Year and adjacent Hydro Years (fetched once for the Targets)
+                    if suggestMatches:
+                        if catalogList is None:
+                            catalogList = suggestionCatalogs(hydroYear, eventCatalog)
+                        outSuggestCSV = os.path.join(workspace, "SuggestedEvents" + targetSuffix + "_" + dateString + ".csv")
+                        with stageSpan("suggestEvents", rowsIn=recCountNull, target=targetName) as span:
+                            outVal = suggestEvents(df_DatasetToDefine, catalogList, outSuggestCSV)
+                            span['rowsOut'] = outVal[1] if outVal[0].lower() == "success function" else None
+
+                exit()
+
+        planTargets = []
+        for targetName, targetParameters, df_DatasetToDefine, recCountNull in resolvedList:
+            applyTargetParameters(baseParameters, targetParameters)
+            targetSuffix = "" if targetName is None else "_" + targetName
+
+            #Add the Lab fields with defined values (e.g. 'TP_Lab_Name','TP_Lab_SOP','TP_Lab_ID','TP_Lab_MDL')
+            defineLabFields(df_DatasetToDefine)
+
+            #Flag the values outside the Site_ID/Visit_Type history in the 'Notes' field - the records are loaded (review report only)
+            if outlierFlagging and outlierField is not None:
+                outReviewCSV = os.path.join(workspace, "OutlierReview" + targetSuffix + "_" + dateString + ".csv")
+                with stageSpan("flagOutliers", rowsIn=len(df_DatasetToDefine), target=targetName) as span:
+                    outVal = flagOutliers(df_DatasetToDefine, hydroYear, outReviewCSV)
+                    span['rowsOut'] = outVal[1] if outVal[0].lower() == "success function" else None
+                if outVal[0].lower() != "success function":
+                    print("WARNING - Function flagOutliers - Failed - values not flagged")
+
+            #Run Mode 'plan' - the final records of the Target are written to the Load Plan (nothing is appended).  With 'loadJournal' the
+            #Load Plan is written to the Load Journal folder and appended once all Targets are defined (see 'appendPlanTargets')
+            if runMode == "plan" or loadJournal:
+                with stageSpan("defineAppendRecords", rowsIn=len(df_DatasetToDefine), target=targetName) as span:
+                    planTargets.append((targetName, {parameterName: globals()[parameterName] for parameterName in targetParameterNames},
+                                        defineAppendRecords(df_DatasetToDefine)))
+                    span['rowsOut'] = len(planTargets[-1][2])
+                continue
+
+            #Appended dataframe 'df_DatasetToDefine' records to the Target table (i.e. 'phosphorusTable')
+            with stageSpan("appendRecords", rowsIn=len(df_DatasetToDefine), target=targetName) as span:
+                if runReportFile:
+                    span['frameMemoryMB'] = frameMemoryMB(df_DatasetToDefine)
+                outVal = appendRecords(df_DatasetToDefine, os.path.join(workspace, "DataFrameAppended" + targetSuffix + ".csv"))
+                span['rowsOut'] = outVal[1]['inserted'] if outVal[0].lower() == "success function" else None
+            if outVal[0].lower() != "success function":
+                print("WARNING - Function appendRecords - Failed - Exiting Script")
+                exit()
+
+            print("Success - Function appendRecords")
+
+            shapeDf = df_DatasetToDefine.shape
+            numRecs = shapeDf[0]
 
-        #Appended dataframe 'df_DatasetToDefine' records to table - 'tbl_Lab_Data_TotalPhosphorus'
-        outVal = appendRecords(df_DatasetToDefine)
-        if outVal.lower() != "success function":
-            print("WARNING - Function appendRecords - Failed - Exiting Script")
-            exit()
 
-        print("Success - Function appendRecords")
+            messageTime = timeFun()
+            scriptMsg = "Successfully processed: " + str(numRecs) + " - Records in table - " + phosphorusTable + " - " + inputFile + " - " + messageTime
+            print(scriptMsg)
+            logMessage(scriptMsg, "INFO", function="main", records=numRecs, inputFile=inputFile, target=targetName, targetTable=phosphorusTable)
 
-        shapeDf = df_DatasetToDefine.shape
-        numRecs = shapeDf[0]
+        del (resolvedList)
 
+        if runMode == "plan":
+            outPlan = planFile if planFile is not None else os.path.join(workspace, outName + "_LoadPlan.jsonl")
+            with stageSpan("writeLoadPlan", rowsIn=sum(len(planTarget[2]) for planTarget in planTargets)) as span:
+                outVal = writeLoadPlan(planTargets, eventCatalog, outPlan)
+            if outVal.lower() != "success function":
+                print("WARNING - Function writeLoadPlan - Failed - Exiting Script")
+                exit()
+            else:
+                print("Success - Function writeLoadPlan")
+
+        #Journaled load - the Load Plan is written to the Load Journal folder and appended with each committed batch recorded in the Load Journal
+        elif loadJournal:
+            journalName = outName + "_" + datetime.now().strftime("%H%M%S")
+            outPlan = os.path.join(loadJournalFolder(), journalName + "_LoadPlan.jsonl")
+            os.makedirs(loadJournalFolder(), exist_ok=True)
+            with stageSpan("writeLoadPlan", rowsIn=sum(len(planTarget[2]) for planTarget in planTargets)) as span:
+                outVal = writeLoadPlan(planTargets, eventCatalog, outPlan)
+            if outVal.lower() != "success function":
+                print("WARNING - Function writeLoadPlan - Failed - Exiting Script")
+                exit()
 
-        messageTime = timeFun()
-        scriptMsg = "Successfully processed: " + str(numRecs) + " - Records in table - " + inputFile + " - " + messageTime
-        print(scriptMsg)
-        logFile = open(logFileName, "a")
-        logFile.write(scriptMsg + "\n")
-        logFile.close()
+            journal = LoadJournal.create(os.path.join(loadJournalFolder(), journalName + "_LoadJournal.jsonl"), outPlan)
+            outVal = appendPlanTargets([({'name': targetName, 'parameters': targetParameters}, df_ToAppendFinal) for targetName, targetParameters, df_ToAppendFinal in planTargets],
+                                       baseParameters, inputFile, journal)
+            if outVal.lower() != "success function":
+                print("WARNING - Function appendPlanTargets - Failed - Exiting Script")
+                exit()
+            else:
+                print("Success - Function appendPlanTargets")
+            journal.complete()
 
-        del (df_DatasetToDefine)
+        runStatus = "success function"
+        return runStatus
 
     except:
 
         messageTime = timeFun()
         scriptMsg = "SCFN_TP_ETL.py - " + messageTime
         print (scriptMsg)
-        logFile = open(logFileName, "a")
-        logFile.write(scriptMsg + "\n")
+        logMessage(scriptMsg, "ERROR", function="main", traceback=traceback.format_exc())
         traceback.print_exc(file=sys.stdout)
-        logFile.close()
+        flushRunLogger()
+        return "failed function"
 
+    finally:
+        #Restore the script parameters (i.e. of the last Target), close the shared Periphyton DB connection, write the Run Report and flush the log
+        applyTargetParameters(baseParameters, {})
+        closeSession()
+        writeRunReport(runStatus, inputFile=inputFile)
+        flushRunLogger()
 
 
+#Notify (Message Box in Interactive Mode) that the EDD has more columns than 'fieldCrossWalk1' - the script exits
+#truncateField - Field after which the EDD would be truncated
+#targetName - Target (see 'readCrosswalkConfig') - None for the script parameters
+def truncateWarning(truncateField, targetName=None):
+    print("WARNING - Truncating after field: " + str(truncateField))
 
+    if interactive:
+        import tkinter as tk
+        import tkinter.messagebox
 
-#Identify Record Events with a 1 to 1 relationship based on Index: 'Site Name' via connection with the tlu_Sites and tbl_events tables in Periphtyon DB
-# Will be used to create a DF that will subsequently be update the Event_Group_ID, Event_ID, Site_ID and Visit Type fields via connection with the tlu_Sites and tbl_events tables in Periphtyon DB
-#inDf - dataframe being processes
-#inYear - Field Year being processed
-#visitType = 'Subset Cretria for Visit Type (e.g. Standard, Extra Sample, QAQC, or Pilot-Spatial)
-def defineRecords(inDF, inYear, visitType):
+        root = tk.Tk()
+        root.geometry("500x300")
+        root.title('Question Box')
+        root.lift()
+        root.attributes('-topmost', True)
+
+        tkinter.messagebox.showwarning("showwarning", "WARNING - Truncating Imported Dataset after field: " + str(truncateField))
+        root.destroy()
+        root.mainloop()
+
+    messageTime = timeFun()
+    scriptMsg = "WARNING - Truncating Imported Dataset after field: " + str(truncateField) + " - Sheet: " + rawDataSheet + " - " + messageTime
+    print(scriptMsg)
+    logMessage(scriptMsg, "WARNING", function="truncateWarning", truncateField=truncateField, target=targetName)
+
+
+#Extract the Data records from the EDD - removes the header rows (i.e. rows above 'firstRow') and renames the fields via 'fieldCrossWalk1'
+#The 'firstRow' header row is located by reading only the leading rows, then only the 'fieldCrossWalk1' columns below it are parsed.
+#When 'eddCache' is True the extracted dataset is cached in the workspace (see 'eddCachePath') and reused while the EDD is unchanged.
+#inFile - Excel EDD from the lab
+#inSheet - Name of the Raw Data Sheet in the inFile
+#inFirstRow - Text value in the First Row and First Column of the sheet that should be retained
+#workbook - Optional EDD Workbook (see 'EDDWorkbook') - the workbook opened once and shared by the Target sheets
+#Returns the Dataset to be defined (indexed on 'Site ID' with the metadata fields added), or 'truncate warning' and the truncate field
+#when the EDD has more columns than 'fieldCrossWalk1'
+def extractEDD(inFile, inSheet, inFirstRow, workbook=None):
     try:
-        inQuery = "SELECT tbl_Event.Event_Group_ID, tbl_Event.Event_ID, tbl_Event_Group.Hydrologic_Year, tbl_Event.Start_Date, tbl_Event.Site_ID, tbl_Site.Site_Name,"\
-                    "tbl_Event.Site_IDLab_QCExtra, tbl_Event.Visit_Type FROM tbl_Site RIGHT JOIN (tbl_Event_Group RIGHT JOIN tbl_Event"\
-                    " ON tbl_Event_Group.Event_Group_ID = tbl_Event.Event_Group_ID)"\
-                    "ON tbl_Site.Site_ID = tbl_Event.Site_ID WHERE tbl_Event_Group.Hydrologic_Year=" + str(inYear) + ""\
-                    " AND tbl_Event.Visit_Type = '" + visitType + "' ORDER BY tbl_Event.Start_Date, tbl_Site.Site_Name, tbl_Event.Visit_Type;"
+        if eddCache:
+            with stageSpan("eddCacheRead") as span:
+                cachePath = eddCachePath(inFile, inSheet, inFirstRow)
+                df_DatasetToDefine = readEDDCache(cachePath)
+                span['rowsOut'] = None if df_DatasetToDefine is None else len(df_DatasetToDefine)
+            if df_DatasetToDefine is not None:
+                messageTime = timeFun()
+                print("Success - Extracted EDD read from cache: " + cachePath + " - " + messageTime)
+                return "success function", df_DatasetToDefine
 
-        outVal = connect_to_AcessDB(inQuery, inDB)
+        #Find the sheet row with the 'firstRow' value - Return Warning if the column count is > defined fields in 'fieldCrossWalk1'
+        excelSource = workbook.open() if workbook is not None else inFile
+        outVal = locateFirstRow(excelSource, inSheet, inFirstRow)
         if outVal[0].lower() != "success function":
-            messageTime = timeFun()
-            print("WARNING - Function connect_to_AcessDB - " + messageTime + " - Failed - Exiting Script")
-            exit()
-        else:
+            return outVal
+        indexFirst = outVal[1]
 
-            outDf = outVal[1]
-            messageTime = timeFun()
-            scriptMsg = "Success:  connect_to_AcessDB - defineVisitType" + messageTime
-            print(scriptMsg)
+        #############################
+        # Parse the records below the 'firstRow' row - only the 'fieldCrossWalk1' columns with the Header Columns Renamed
+        #############################
+        with stageSpan("excelRead") as span:
+            df_DatasetToDefine = pd.read_excel(excelSource, sheet_name=inSheet, header=None, skiprows=indexFirst + 1,
+                                               usecols=list(range(len(fieldCrossWalk1))), names=fieldCrossWalk1)
+            span['rowsOut'] = len(df_DatasetToDefine)
 
-            #Define the Event_Group_ID, Event_ID, Site_ID and Visit Type fields via a join on 'Site_Name and Site ID fields
-            outDF_1to1 = pd.merge(inDF, outDf, how='inner', left_on='Site ID', right_on='Site_Name', suffixes=("", "_metadata"))
+        #Numeric EDD fields as float (with 'compactFrames')
+        df_DatasetToDefine = defineDataset(df_DatasetToDefine, numericFields=(wetWeightFields or []) + list(valueFieldMap))
 
-            del (outDf)
-            return "success function", outDF_1to1
+        if eddCache:
+            writeEDDCache(df_DatasetToDefine, cachePath)
+
+        return "success function", df_DatasetToDefine
 
     except:
         messageTime = timeFun()
-        print("Error on defineRecords Function - " + visitType + " - " + messageTime)
+        print("Error on extractEDD Function - " + str(inFile) + " - " + messageTime)
         traceback.print_exc(file=sys.stdout)
-        return "Failed function - 'defineRecords'"
+        return "Failed function - 'extractEDD'"
+
+
+#Find the sheet row with the 'firstRow' value - reading only the leading rows (widened until found or the end of the sheet)
+#excelSource - EDD file or open workbook (pandas ExcelFile)
+#Returns "success function" and the sheet row index (0 based) of the 'firstRow' value, or 'truncate warning' and the truncate field when the
+#EDD has more columns than 'fieldCrossWalk1'
+def locateFirstRow(excelSource, inSheet, inFirstRow):
+    #Define number of Columns expected - pulling from cross-walk list
+    columnCount = len(fieldCrossWalk1)
+
+    scanRows = headerScanRows
+    with stageSpan("headerScan") as span:
+        while True:
+            headDf = pd.read_excel(excelSource, sheet_name=inSheet, header=None, nrows=scanRows)
+            indexDf = headDf[headDf.iloc[:, 0] == inFirstRow]
+            if len(indexDf) > 0 or len(headDf) < scanRows:
+                break
+            scanRows = scanRows * 4
+        span['rowsIn'] = len(headDf)
+        span['rowsOut'] = len(indexDf)
+
+    # Define first Index Value  - sheet row of the 'firstRow' value
+    indexFirst = indexDf.index.values[0]
+
+    # Check if the Column count (header row and leading rows) is > defined fields in 'fieldCrossWalk1'.
+    columnCountDf = int(headDf.iloc[indexFirst:].notna().any(axis=0).values.nonzero()[0].max()) + 1
+
+    #Return Warning if imported column count isn't as defiend in 'fieldCrossWalk1
+    if columnCountDf > columnCount:
+
+        # #Define column after which should be truncated - removing blank fields - is the intention
+        truncateField = headDf.iloc[indexFirst, columnCount - 1]
+        return "truncate warning", truncateField
+
+    return "success function", indexFirst
+
+
+#Define the Dataset to be defined from the parsed EDD records ('fieldCrossWalk1' fields) - the metadata fields are added and the dataset is
+#indexed on 'Site ID'
+#numericFields - Fields held as float with 'compactFrames' (see 'compactDataset')
+#Returns the Dataset to be defined
+def defineDataset(df_DatasetToDefine, numericFields=()):
+    # Add Metadata field which will be updated during processing
+    # Add Site_IDVisibile  - so can see Site_ID when being used as an Index (not added with 'compactFrames')
+    if not compactFrames:
+        df_DatasetToDefine['Site_IDVisible'] = df_DatasetToDefine['Site ID']
+    df_DatasetToDefine['Event_ID'] = None
+    df_DatasetToDefine['Event_Group_ID'] = None
+    df_DatasetToDefine['Site_ID'] = None
+    df_DatasetToDefine['Visit_Type'] = None
+    df_DatasetToDefine['DuplicateRecord'] = None
 
-#Update the Metadata fields in 'df_DatasetToDefine' with output from 'outDF_Standard' (i.e. records defined as Standard records in the database via a join in Site_ID by year
-def update_definedRecords(inDef, df_DatasetToDefine, duplicateYesNo):
-    try:
+    #Reset Index
+    df_DatasetToDefine.reset_index(drop=True, inplace=True)
 
-        if duplicateYesNo.lower() == "no":
-            #Create Data Frame to be updated with only the 'Event_Group_ID, Event_ID, Site_ID and Visit Type
-            outDF_1to1_Trimmed = inDef[['Site_IDVisible','Event_Group_ID_metadata','Event_ID_metadata','Site_ID_metadata','Visit_Type_metadata']]
-        else:
-            outDF_1to1_Trimmed = inDef[['Site_IDVisible', 'Event_Group_ID_metadata', 'Event_ID_metadata', 'Site_ID_metadata','Visit_Type_metadata','DuplicateRecord']]
+    # Set Index to the 'Site ID' field
+    df_DatasetToDefine.set_index('Site ID', inplace=True)
 
-        #Rename
-        outDF_1to1_Trimmed.rename(columns={'Event_Group_ID_metadata': 'Event_Group_ID', 'Event_ID_metadata':'Event_ID','Site_ID_metadata':'Site_ID', 'Visit_Type_metadata':'Visit_Type'}, inplace=True)
+    #Numeric EDD fields as float and the first field (i.e. 'Sampling' - Park) as categorical
+    if compactFrames:
+        compactDataset(df_DatasetToDefine, categoryFields=fieldCrossWalk1[:1], numericFields=numericFields)
 
-        #Reset Index
-        outDF_1to1_Trimmed.reset_index(drop=True, inplace=True)
+    return df_DatasetToDefine
 
-        # Set Index to the 'Site ID' field
-        outDF_1to1_Trimmed.set_index('Site_IDVisible', inplace=True)
 
-        #Update the Standard Events in 'df_DatasetToDefine' via the identified 1 to 1 matches in 'outDF_Standard'  - If values already present will not overwrite
-        df_DatasetToDefine.update(outDF_1to1_Trimmed, overwrite=False)
+#Workbook formats read in chunks in Streaming Mode - .xls workbooks (xlrd) are read whole and are not streamed
+streamWorkbookTypes = (".xlsx", ".xlsm")
 
-        return "success function"
-    except:
 
+#Read the EDD rows below the 'firstRow' row in chunks of 'streamChunkSize' rows (Streaming Mode) - the rows are read from the read-only workbook
+#(openpyxl) with the cell values converted as by 'extractEDD' (pandas) and the trailing blank rows are dropped.  .xlsx/.xlsm workbooks only
+#(see 'streamWorkbookTypes').
+#inFile - Excel EDD from the lab
+#inSheet - Name of the Raw Data Sheet in the inFile
+#indexFirst - Sheet row index (0 based) of the 'firstRow' value (see 'locateFirstRow')
+#Yields the list of the row values ('fieldCrossWalk1' columns) of each chunk
+def readEDDChunks(inFile, inSheet, indexFirst):
+    columnCount = len(fieldCrossWalk1)
+    import openpyxl
+    workbook = openpyxl.load_workbook(inFile, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook[inSheet]
+        sheet.reset_dimensions()
+        rowList = []
+        blankList = []
+        for row in sheet.iter_rows(min_row=indexFirst + 2):
+            rowValues = [excelCellValue(cell) for cell in row]
+            #Blank rows are kept once a row with values follows (i.e. trailing blank rows are not records)
+            if all(cellValue == "" for cellValue in rowValues):
+                blankList.append([""] * columnCount)
+                continue
+            rowList.extend(blankList)
+            blankList = []
+            rowList.append((rowValues + [""] * columnCount)[:columnCount])
+            if len(rowList) >= streamChunkSize:
+                yield rowList
+                rowList = []
+
+        if len(rowList) > 0:
+            yield rowList
+    finally:
+        workbook.close()
+
+
+#Cell value as converted by pandas (openpyxl) - empty cells as "", error cells as NaN and whole numbers as int
+def excelCellValue(cell):
+    if cell.value is None:
+        return ""
+    if cell.data_type == "e":
+        return np.nan
+    if cell.data_type == "n":
+        intValue = int(cell.value)
+        return intValue if intValue == cell.value else float(cell.value)
+    return cell.value
+
+
+#Parse the rows of an EDD chunk (see 'readEDDChunks') to the 'fieldCrossWalk1' fields - the field types are inferred as by 'extractEDD'
+#asObject - True keeps the values as read (object fields)
+def parseEDDChunk(rowList, asObject=False):
+    from pandas.io.parsers import TextParser
+
+    return TextParser(rowList, header=None, names=fieldCrossWalk1, dtype=object if asObject else None).read()
+
+
+#Spool the EDD chunks (Streaming Mode) - the rows of each chunk are written to the workspace 'StreamSpool' folder with the field types of the chunk
+#inFile - Excel EDD from the lab
+#inSheet - Name of the Raw Data Sheet in the inFile
+#inFirstRow - Text value in the First Row and First Column of the sheet that should be retained
+#excelSource - EDD file or open workbook (pandas ExcelFile) - the 'firstRow' row is located in the leading rows
+#spoolPath - Path (without extension) of the chunk files
+#Returns "success function" and dictionary of the chunk files (file, records), the EDD 'records', the 'fieldTypes' (see 'streamFieldTypes') and
+#the 'compactFields' (numeric EDD fields held as float with 'compactFrames'), or 'truncate warning' and the truncate field as 'extractEDD'
+def spoolEDD(inFile, inSheet, inFirstRow, excelSource, spoolPath):
+    try:
+        outVal = locateFirstRow(excelSource, inSheet, inFirstRow)
+        if outVal[0].lower() != "success function":
+            return outVal
+
+        #Numeric EDD fields are held as float when all values of the sheet are numeric (see 'compactDataset')
+        compactFields = [fieldName for fieldName in (wetWeightFields or []) + list(valueFieldMap) if fieldName in fieldCrossWalk1] if compactFrames else []
+        chunkList = []
+        chunkTypes = []
+        for rowList in readEDDChunks(inFile, inSheet, outVal[1]):
+            chunkDf = parseEDDChunk(rowList)
+            chunkTypes.append({fieldName: None if chunkDf[fieldName].isna().all() else chunkDf[fieldName].dtype for fieldName in fieldCrossWalk1})
+            for fieldName in list(compactFields):
+                if not pd.api.types.is_numeric_dtype(chunkDf[fieldName].dtype):
+                    try:
+                        pd.to_numeric(chunkDf[fieldName])
+                    except (TypeError, ValueError):
+                        compactFields.remove(fieldName)
+
+            chunkFile = spoolPath + "_" + str(len(chunkList)) + ".pkl"
+            pd.to_pickle(rowList, chunkFile)
+            chunkList.append((chunkFile, len(rowList)))
+            del (rowList, chunkDf)
+
+        return "success function", {'chunks': chunkList, 'records': sum(chunkRecords for chunkFile, chunkRecords in chunkList),
+                                    'fieldTypes': streamFieldTypes(chunkTypes), 'compactFields': compactFields}
+
+    except:
         messageTime = timeFun()
-        print("Error on update_definedRecords Function - " + messageTime)
+        print("Error on spoolEDD Function - " + str(inFile) + " - " + messageTime)
         traceback.print_exc(file=sys.stdout)
-        return "Failed function - 'update_Standard'"
+        return "Failed function - 'spoolEDD'"
+
+
+#Field types of the EDD in Streaming Mode - the field types of the chunks are reconciled to the type the whole sheet is parsed to by 'extractEDD':
+#the type of the chunks (blank chunks take the type of the other chunks), float when integer, float or blank chunks are mixed, and the values as
+#read (object) when other types are mixed
+#chunkTypes - List (per chunk) of dictionaries of the field and its type (None when the field is blank in the chunk)
+#Returns dictionary of the field and the type the chunks are cast to (None - the values as read)
+def streamFieldTypes(chunkTypes):
+    fieldTypes = {}
+    for fieldName in fieldCrossWalk1:
+        typeList = [chunkType[fieldName] for chunkType in chunkTypes]
+        typeSet = set(fieldType for fieldType in typeList if fieldType is not None)
+        blankChunk = None in typeList
+        if len(typeSet) == 0:
+            fieldTypes[fieldName] = np.dtype("float64")
+        elif all(fieldType.kind in "iuf" for fieldType in typeSet) and (blankChunk or len(typeSet) > 1 or next(iter(typeSet)).kind == "f"):
+            fieldTypes[fieldName] = np.dtype("float64")
+        elif len(typeSet) == 1 and not (blankChunk and next(iter(typeSet)).kind == "b"):
+            fieldTypes[fieldName] = next(iter(typeSet))
+        else:
+            fieldTypes[fieldName] = None
 
+    return fieldTypes
 
 
-#Identify Record Events with a 1 to 1 relationship based on Index: 'Site Name' via connection with the tlu_Sites and tbl_events tables in Periphtyon DB
-# Will be used to create a DF that will subsequently be update the Event_Group_ID, Event_ID, Site_ID and Visit Type fields via connection with the tlu_Sites and tbl_events tables in Periphtyon DB
-#inDf - dataframe being processes
-#inYear - Field Year being processed
-#visitType = 'Subset Cretria for Visit Type (e.g. Standard, Extra Sample, QAQC, or Pilot-Spatial)
-# Function joins on the 'Site_IDLab_QCExtra' field in Query from database for QAQC Samples
-def defineRecords_Site_IDLab_QCExtra(inDF, inYear, visitType):
-    try:
-        inQuery = "SELECT tbl_Event.Event_Group_ID, tbl_Event.Event_ID, tbl_Event_Group.Hydrologic_Year, tbl_Event.Start_Date, tbl_Event.Site_ID, tbl_Site.Site_Name,"\
-                    "tbl_Event.Site_IDLab_QCExtra, tbl_Event.Visit_Type FROM tbl_Site RIGHT JOIN (tbl_Event_Group RIGHT JOIN tbl_Event"\
-                    " ON tbl_Event_Group.Event_Group_ID = tbl_Event.Event_Group_ID)"\
-                    "ON tbl_Site.Site_ID = tbl_Event.Site_ID WHERE tbl_Event_Group.Hydrologic_Year=" + str(inYear) + ""\
-                    " AND tbl_Event.Visit_Type = '" + visitType + "' ORDER BY tbl_Event.Start_Date, tbl_Site.Site_Name, tbl_Event.Visit_Type;"
+#Dataset of a spooled EDD chunk (see 'spoolEDD') - the fields are cast to the types of the whole sheet and the dataset is defined as by 'extractEDD'
+#spoolInfo - Spooled EDD from 'spoolEDD'
+#Returns the Dataset to be defined of the chunk
+def readStreamChunk(chunkFile, spoolInfo):
+    rowList = pd.read_pickle(chunkFile)
+    chunkDf = parseEDDChunk(rowList)
+    fieldTypes = spoolInfo['fieldTypes']
 
-        outVal = connect_to_AcessDB(inQuery, inDB)
-        if outVal[0].lower() != "success function":
-            messageTime = timeFun()
-            print("WARNING - Function connect_to_AcessDB - " + messageTime + " - Failed - Exiting Script")
-            exit()
-        else:
+    objectFields = [fieldName for fieldName, fieldType in fieldTypes.items() if fieldType is None and chunkDf[fieldName].dtype != object]
+    if len(objectFields) > 0:
+        objectDf = parseEDDChunk(rowList, asObject=True)
+        for fieldName in objectFields:
+            chunkDf[fieldName] = objectDf[fieldName]
+    for fieldName, fieldType in fieldTypes.items():
+        if fieldType is not None and chunkDf[fieldName].dtype != fieldType:
+            chunkDf[fieldName] = chunkDf[fieldName].astype(fieldType)
 
-            outDf = outVal[1]
-            messageTime = timeFun()
-            scriptMsg = "Success:  connect_to_AcessDB - defineVisitType" + messageTime
-            print(scriptMsg)
+    return defineDataset(chunkDf, numericFields=spoolInfo['compactFields'])
 
-            #Define the Event_Group_ID, Event_ID, Site_ID and Visit Type fields via a join on 'Site_Name and Site ID fields
-            outDF_1to1 = pd.merge(inDF, outDf, how='inner', left_on='Site ID', right_on='Site_IDLab_QCExtra', suffixes=("", "_metadata"))
 
-            del (outDf)
-            return "success function", outDF_1to1
+#Content hash (sha256) of a file - read in blocks, hashed once per run while the file is unchanged (i.e. for each Target sheet)
+def fileHash(inFile):
+    fileStat = os.stat(inFile)
+    fileKey = (os.path.abspath(inFile), fileStat.st_mtime, fileStat.st_size)
+    if fileKey not in fileHashes:
+        hashValue = hashlib.sha256()
+        with open(inFile, "rb") as hashFile:
+            for block in iter(lambda: hashFile.read(1048576), b""):
+                hashValue.update(block)
+        fileHashes[fileKey] = hashValue.hexdigest()
 
-    except:
-        messageTime = timeFun()
-        print("Error on defineRecords_Site_IDLab_QCExtra Function - " + visitType + " - " + messageTime)
-        traceback.print_exc(file=sys.stdout)
-        return "Failed function - 'defineRecords_Site_IDLab_QCExtra'"
+    return fileHashes[fileKey]
 
-#To be Updated
-def defineRecords_LabDuplicates(inDF, inYear, dupType):
-    try:
-        inQuery = "SELECT tbl_Event.Event_Group_ID, tbl_Event.Event_ID, tbl_Event_Group.Hydrologic_Year, tbl_Event.Start_Date, tbl_Event.Site_ID,"\
-            " tbl_LabDuplicates.LabSiteID, tbl_Event.Site_IDLab_QCExtra, tbl_Event.Visit_Type"\
-            " FROM tbl_Site RIGHT JOIN ((tbl_Event_Group RIGHT JOIN tbl_Event ON tbl_Event_Group.Event_Group_ID = tbl_Event.Event_Group_ID)"\
-            " INNER JOIN tbl_LabDuplicates ON tbl_Event.Event_ID = tbl_LabDuplicates.Event_ID) ON tbl_Site.Site_ID = tbl_Event.Site_ID"\
-            " WHERE (((tbl_Event_Group.Hydrologic_Year)=" + str(inYear) + ") AND ((tbl_LabDuplicates.Type)= '" + dupType + "'))"\
-            " ORDER BY tbl_Event.Start_Date, tbl_LabDuplicates.LabSiteID, tbl_Event.Visit_Type;"
 
-        outVal = connect_to_AcessDB(inQuery, inDB)
-        if outVal[0].lower() != "success function":
-            messageTime = timeFun()
-            print("WARNING - Function connect_to_AcessDB - " + messageTime + " - Failed - Exiting Script")
-            exit()
-        else:
+#EDD Workbook - the Excel workbook opened once (on first read) and shared by the Target sheets read in the run
+#inFile - Excel EDD from the lab
+class EDDWorkbook:
 
-            outDf = outVal[1]
-            messageTime = timeFun()
-            scriptMsg = "Success:  connect_to_AcessDB - defineVisitType" + messageTime
-            print(scriptMsg)
+    def __init__(self, inFile):
+        self.inFile = inFile
+        self.excelFile = None
 
-            #Define the Event_Group_ID, Event_ID, Site_ID and Visit Type fields via a join on 'Site_Name and Site ID fields
-            outDF_1to1 = pd.merge(inDF, outDf, how='inner', left_on='Site ID', right_on='LabSiteID', suffixes=("", "_metadata"))
+    #Return the open workbook (pandas ExcelFile) - opening it on first use
+    def open(self):
+        if self.excelFile is None:
+            self.excelFile = pd.ExcelFile(self.inFile)
+        return self.excelFile
 
-            del (outDf)
-            #Add Duplicate Record Field
-            outDF_1to1['DuplicateRecord'] = 'Yes'
+    def close(self):
+        if self.excelFile is not None:
+            self.excelFile.close()
+            self.excelFile = None
 
-            return "success function", outDF_1to1
 
+#Path (without extension) of the cached extracted EDD - keyed by the EDD content hash, sheet name, 'firstRow' value, 'fieldCrossWalk1' and 'compactFrames'
+def eddCachePath(inFile, inSheet, inFirstRow):
+    keyValue = hashlib.sha256(json.dumps([fileHash(inFile), inSheet, inFirstRow, fieldCrossWalk1, compactFrames], default=str).encode("utf-8")).hexdigest()
+    eddName = os.path.splitext(os.path.basename(inFile))[0]
+
+    return os.path.join(workspace, "EDDCache", eddName + "_" + keyValue[:16])
+
+
+#Read the cached extracted EDD - Returns None when not cached
+def readEDDCache(cachePath):
+    try:
+        if os.path.exists(cachePath + ".parquet"):
+            return pd.read_parquet(cachePath + ".parquet")
+        if os.path.exists(cachePath + ".pkl"):
+            return pd.read_pickle(cachePath + ".pkl")
     except:
         messageTime = timeFun()
-        print("Error on defineRecords_Site_IDLab_QCExtra Function - " + visitType + " - " + messageTime)
-        traceback.print_exc(file=sys.stdout)
-        return "Failed function - 'defineRecords_Site_IDLab_QCExtra'"
+        print("WARNING - Unable to read EDD cache: " + cachePath + " - " + messageTime)
 
+    return None
 
-#Connect to Access DB and perform defined query - return query in a dataframe
-def connect_to_AcessDB(query, inDB):
 
+#Write the extracted EDD to the cache - columnar parquet file, pickle when the parquet engine (pyarrow) is not installed or the
+#dataset has mixed type columns (e.g. 'TP µg/g' text code flags)
+def writeEDDCache(inDF, cachePath):
+    try:
+        os.makedirs(os.path.dirname(cachePath), exist_ok=True)
+        try:
+            inDF.to_parquet(cachePath + ".parquet")
+        except (ImportError, TypeError, ValueError, NotImplementedError):
+            if os.path.exists(cachePath + ".parquet"):
+                os.remove(cachePath + ".parquet")
+            inDF.to_pickle(cachePath + ".pkl")
+    except:
+        messageTime = timeFun()
+        print("WARNING - Unable to write EDD cache: " + cachePath + " - " + messageTime)
+
+
+#Validate the EDD measurements - vectorized checks over the whole dataset (no per record loops):
+#Missing/Non-Numeric (not a 'valueFlags' Text Code Flag)/Negative values in the measured value fields (i.e. 'valueFieldMap'), Wet Weight Mismatch
+#('wetWeightFields' beyond 'weightTolerance') and Missing/Invalid/Outside Hydro Year dates ('dateField')
+#df_DatasetToDefine - Dataset extracted from the EDD (see 'extractEDD')
+#outExceptionsCSV - Validation Exceptions export .csv file (default 'ValidationExceptions_{date}.csv' in the workspace) - exported when exceptions are found
+#inYear - Hydro Year of the EDD (default 'hydroYear')
+#stream - Optional Stream State of the chunk being validated (Streaming Mode - see 'StreamState')
+#Returns "success function" and the count of exceptions
+def validateEDD(df_DatasetToDefine, outExceptionsCSV=None, inYear=None, stream=None):
     try:
-        connStr = (r"DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};DBQ=" + inDB + ";")
-        cnxn = pyodbc.connect(connStr)
-        queryDf = pd.read_sql(query, cnxn)
-        cnxn.close()
+        if inYear is None:
+            inYear = hydroYear
+        recordNumbers = eddRecordNumbers(len(df_DatasetToDefine), stream)
+        siteIDs = df_DatasetToDefine.index.to_numpy()
+        flagValues = set(str(flagValue).strip().upper() for flagValue in valueFlags)
+        exceptionList = []
+
+        #Add the exceptions of a check - mask of the failing records, EDD field, values and detail (scalar or array aligned to the records)
+        def addExceptions(checkName, checkMask, fieldName, fieldValues, checkDetail=None):
+            checkMask = np.asarray(checkMask, dtype=bool)
+            if not checkMask.any():
+                return
+            exceptionList.append(pd.DataFrame({'EDD Record': recordNumbers[checkMask], 'Site ID': siteIDs[checkMask], 'Check': checkName, 'Field': fieldName,
+                                               'Value': np.asarray(fieldValues, dtype=object)[checkMask],
+                                               'Detail': np.asarray(checkDetail, dtype=object)[checkMask] if np.ndim(checkDetail) > 0 else checkDetail}))
+
+        #Measured values - numeric or a Text Code Flag
+        numericValues = {}
+        for fieldName in valueFieldMap:
+            fieldValues = df_DatasetToDefine[fieldName]
+            numericValues[fieldName] = pd.to_numeric(fieldValues, errors='coerce')
+            nonNumericMask = fieldValues.notna() & numericValues[fieldName].isna()
+            #Text Code Flag match only on the non-numeric values
+            flagMask = nonNumericMask.copy()
+            if nonNumericMask.any():
+                flagMask[nonNumericMask] = fieldValues[nonNumericMask].astype(str).str.strip().str.upper().isin(flagValues)
+            addExceptions("Missing Value", fieldValues.isna(), fieldName, fieldValues)
+            addExceptions("Non-Numeric Value", nonNumericMask & ~flagMask, fieldName, fieldValues, "Not numeric or a Text Code Flag (valueFlags)")
+            addExceptions("Negative Value", numericValues[fieldName] < 0, fieldName, fieldValues)
+
+        #Checks of the 'wetWeightFields'/'dateField' not in the Target 'fieldCrossWalk1' are not run (configuration warning logged)
+        weightFields = validationFields("Wet Weight", wetWeightFields)
+        dateFields = validationFields("Sample Date", None if dateField is None else [dateField])
+
+        #Wet Weight - Sample wet weight = Sample (wet weight) + bottle weight - Bottle weight
+        if weightFields is not None:
+            grossField, bottleField, wetField = wetWeightFields
+            weightValues = [numericValues[fieldName] if fieldName in numericValues else pd.to_numeric(df_DatasetToDefine[fieldName], errors='coerce')
+                            for fieldName in wetWeightFields]
+            expectedWet = weightValues[0] - weightValues[1]
+            mismatchMask = ((weightValues[2] - expectedWet).abs() > weightTolerance).to_numpy()
+            mismatchDetail = np.full(len(df_DatasetToDefine), None, dtype=object)
+            mismatchDetail[mismatchMask] = ("Expected " + expectedWet[mismatchMask].round(4).astype(str) + " (" + grossField + " - " + bottleField + ")").to_numpy()
+            addExceptions("Wet Weight Mismatch", mismatchMask, wetField, df_DatasetToDefine[wetField], mismatchDetail)
+
+        #Sample Date - within the Hydro Year
+        if dateFields is not None:
+            dateValues = df_DatasetToDefine[dateField]
+            sampleDates = pd.to_datetime(dateValues, errors='coerce')
+            yearStart = pd.Timestamp(int(inYear), hydroYearStartMonth, 1)
+            yearEnd = yearStart + pd.DateOffset(years=1)
+            addExceptions("Missing Date", dateValues.isna(), dateField, dateValues)
+            addExceptions("Invalid Date", dateValues.notna() & sampleDates.isna(), dateField, dateValues)
+            addExceptions("Date Outside Hydro Year", (sampleDates < yearStart) | (sampleDates >= yearEnd), dateField, dateValues,
+                          "Hydro Year " + str(inYear) + ": " + yearStart.strftime("%Y-%m-%d") + " to " + (yearEnd - pd.Timedelta(days=1)).strftime("%Y-%m-%d"))
+
+        exceptionCount = sum(len(exceptionDf) for exceptionDf in exceptionList)
+        if exceptionCount > 0:
+            if outExceptionsCSV is None:
+                outExceptionsCSV = os.path.join(workspace, "ValidationExceptions_" + dateString + ".csv")
+            exceptionDf = pd.concat(exceptionList, ignore_index=True).sort_values(['EDD Record', 'Check'], kind="stable")
+            exportReport(exceptionDf, outExceptionsCSV, stream)
+
+            checkCounts = exceptionDf['Check'].value_counts().to_dict()
+            messageTime = timeFun()
+            scriptMsg = "WARNING - validateEDD - " + str(exceptionCount) + " - Validation Exceptions (" + ", ".join(checkName + ": " + str(checkCount) for checkName, checkCount in checkCounts.items()) \
+                        + ") - Exported to: " + outExceptionsCSV + " - " + messageTime
+            print(scriptMsg)
+            logMessage(scriptMsg, "WARNING", function="validateEDD", exceptions=exceptionCount, checks=checkCounts, outFile=outExceptionsCSV)
 
-        return "success function", queryDf
+        return "success function", exceptionCount
 
     except:
         messageTime = timeFun()
-        scriptMsg = "Error function:  connect_to_AcessDB - " +  messageTime
-        print(scriptMsg)
-        logFile = open(logFileName, "a")
-        logFile.write(scriptMsg + "\n")
-
+        print("Error on validateEDD Function - " + messageTime)
         traceback.print_exc(file=sys.stdout)
-        logFile.close()
-        return "failed function"
+        return "Failed function - 'validateEDD'"
 
 
+#Fields of a validation check (see 'validateEDD') - None when the check is not defined or a field is not in 'fieldCrossWalk1' (configuration
+#warning - e.g. a Crosswalk Config Target without the weight/date fields that does not set 'wetWeightFields'/'dateField' to null)
+#checkName - Name of the check in the warning
+#fieldList - EDD fields of the check (None when not defined)
+def validationFields(checkName, fieldList):
+    if fieldList is None:
+        return None
 
-def nullRecordsGt0(recCountNull, df_DatasetToDefine):
+    missingFields = [fieldName for fieldName in fieldList if fieldName not in fieldCrossWalk1]
+    if len(missingFields) > 0:
+        messageTime = timeFun()
+        scriptMsg = "WARNING - validateEDD - " + checkName + " check not run - fields not in 'fieldCrossWalk1': " + ", ".join(missingFields) \
+                    + " - set the check fields to null for the Target - " + messageTime
+        print(scriptMsg)
+        logMessage(scriptMsg, "WARNING", function="validateEDD", check=checkName, missingFields=missingFields, targetTable=phosphorusTable)
+        return None
+
+    return fieldList
+
+
+#Event resolution priority - Visit Type/Lab Duplicate Type (None - the analyte 'labDuplicateType'), Event Catalog Part, Catalog field joined
+#to the EDD 'Site ID', Catalog field holding the Type and Duplicate Record (Yes/No).  A record is defined by the first pass with a match.
+resolvePriority = [("Standard", "events", "Site_Name", "Visit_Type", "No"),
+                   ("Extra Sample", "events", "Site_Name", "Visit_Type", "No"),
+                   ("Pilot - Spatial", "events", "Site_Name", "Visit_Type", "No"),
+                   ("QAQC", "events", "Site_IDLab_QCExtra", "Visit_Type", "No"),
+                   (None, "labDuplicates", "LabSiteID", "Type", "Yes")]
+
+
+#Define the Event_ID, Event_Group_ID, Site_ID, Visit_Type and DuplicateRecord fields in 'df_DatasetToDefine' via the Event Catalog.
+#Records are resolved in one pass over the hash indexes from 'buildEventIndex' in the 'resolvePriority' order - values already defined are not overwritten.
+#A 'Site ID' matching more than one Event in its pass is left undefined, and Events matched by more than one record are kept;
+#both are exported to the Ambiguous Matches file.
+#df_DatasetToDefine - Dataset being defined (updated in place)
+#eventCatalog - Hydro Year Event Catalog from 'fetchEventCatalog'
+#outAmbiguousCSV - Ambiguous Matches export .csv file (default 'AmbiguousMatches_{date}.csv' in the workspace)
+#indexList - Optional Event Catalog hash indexes from 'buildEventIndex' (e.g. built once for the Streaming Mode chunks)
+#stream - Optional Stream State of the chunk being resolved (Streaming Mode - see 'StreamState')
+#Returns the count of records with Null 'Event_ID' values after resolution
+def resolveEvents(df_DatasetToDefine, eventCatalog, outAmbiguousCSV=None, indexList=None, stream=None):
     try:
+        if indexList is None:
+            with stageSpan("buildEventIndex") as span:
+                indexList = buildEventIndex(eventCatalog)
+                span['rowsOut'] = sum(len(eventIndex['keys']) for eventIndex in indexList)
+
+        siteIDs = df_DatasetToDefine.index
+        recordCount = len(df_DatasetToDefine)
+        unresolved = df_DatasetToDefine['Event_ID'].isnull().to_numpy()
+        resolvedFields = ['Event_Group_ID', 'Event_ID', 'Site_ID', 'Visit_Type', 'DuplicateRecord']
+        resolvedValues = {fieldName: df_DatasetToDefine[fieldName].to_numpy(dtype=object, copy=True) for fieldName in resolvedFields}
+        resolvedPass = np.full(recordCount, None, dtype=object)
+        ambiguousList = []
+
+        for eventIndex in indexList:
+            passType = eventIndex['passType']
+
+            with stageSpan("resolvePass", rowsIn=int(unresolved.sum()), passType=passType) as span:
+                #'Site ID' matching more than one Event for the pass - left undefined (not resolved by a later pass)
+                ambiguousMask = unresolved & siteIDs.isin(eventIndex['ambiguous'].index)
+                if ambiguousMask.any():
+                    ambiguousDf = pd.DataFrame({'EDD Record': eddRecordNumbers(recordCount, stream)[ambiguousMask], 'Site ID': siteIDs[ambiguousMask],
+                                                'Ambiguity': "Multiple Events", 'Resolution Pass': passType})
+                    ambiguousList.append(ambiguousDf.join(eventIndex['ambiguous'], on='Site ID'))
+                    unresolved = unresolved & ~ambiguousMask
+
+                #Hash lookup of the 'Site ID' in the pass key index (-1 when not present)
+                positions = eventIndex['keys'].get_indexer(siteIDs)
+                matchMask = unresolved & (positions >= 0)
+                matchPositions = positions[matchMask]
+                for fieldName in resolvedFields:
+                    resolvedValues[fieldName][matchMask] = eventIndex['events'][fieldName].to_numpy(dtype=object)[matchPositions]
+                resolvedPass[matchMask] = passType
+                unresolved = unresolved & ~matchMask
+                span['rowsOut'] = int(matchMask.sum())
+
+            print("Count of records with Null 'Event_ID' values after Processing '" + passType + "' events:" + str(int(unresolved.sum())))
+
+        for fieldName in resolvedFields:
+            df_DatasetToDefine[fieldName] = resolvedValues[fieldName]
+        if compactFrames:
+            compactDataset(df_DatasetToDefine, categoryFields=['Event_Group_ID', 'Visit_Type', 'DuplicateRecord'])
+
+        #Events matched by more than one record (per Duplicate Record) - kept and reported
+        resolvedDf = pd.DataFrame({'EDD Record': eddRecordNumbers(recordCount, stream), 'Site ID': siteIDs, 'Resolution Pass': resolvedPass,
+                                   'Event_ID': resolvedValues['Event_ID'], 'DuplicateRecord': resolvedValues['DuplicateRecord']})
+        resolvedDf = resolvedDf[resolvedDf['Resolution Pass'].notnull()]
+        if stream is not None:
+            #Streaming Mode - the resolved records of the chunks are reported once the EDD is resolved (see 'streamMain')
+            stream.resolvedList.append(resolvedDf)
+        else:
+            multipleDf = multipleMatches(resolvedDf)
+            if len(multipleDf) > 0:
+                ambiguousList.append(multipleDf)
 
-        scriptMsg = "WARNING - There are: " + str(recCountNull) + " - Records with Null 'Event_ID' values"
-        print(scriptMsg)
-        scriptMsg2 = "These Null Records MUST have a defined Event in the 'Periphyton' database - Exiting Script"
-        print(scriptMsg2)
+        recCountNull = int(df_DatasetToDefine['Event_ID'].isnull().sum())
 
-        # Add Message Box
-        root = tk.Tk()
-        root.geometry("500x300")
-        root.title('Message Box')
-        root.lift()
-        root.attributes('-topmost', True)
-        # Message Box First
-        tkinter.messagebox.Message(title="Warning", message=scriptMsg, master=root).show()
+        if len(ambiguousList) > 0:
+            if outAmbiguousCSV is None:
+                outAmbiguousCSV = os.path.join(workspace, "AmbiguousMatches_" + dateString + ".csv")
+            ambiguousDf = pd.concat(ambiguousList, ignore_index=True)
+            exportReport(ambiguousDf, outAmbiguousCSV, stream)
 
-        # Message Box Second
-        tkinter.messagebox.Message(title="Warning", message=scriptMsg2, master=root).show()
+            messageTime = timeFun()
+            scriptMsg = "WARNING - resolveEvents - Ambiguous Matches: " + str(len(ambiguousDf)) + " records - Exported to: " + outAmbiguousCSV + " - " + messageTime
+            print(scriptMsg)
+            logMessage(scriptMsg, "WARNING", function="resolveEvents", ambiguousRecords=len(ambiguousDf), outFile=outAmbiguousCSV)
 
-        # Export the Records in need of a Matching Event in the database
-        df_eventNeeeded = df_DatasetToDefine[df_DatasetToDefine['Event_ID'].isnull()]
+        return "success function", recCountNull
 
-        # Reset Index
-        df_eventNeeeded.reset_index(drop=False, inplace=True)
+    except:
+        messageTime = timeFun()
+        print("Error on resolveEvents Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'resolveEvents'"
+
+
+#Events matched by more than one EDD record (per Duplicate Record) - kept and reported with the Ambiguous Matches
+#resolvedDf - Resolved records (EDD Record, Site ID, Resolution Pass, Event_ID and DuplicateRecord)
+#Returns the Ambiguous Matches of the records
+def multipleMatches(resolvedDf):
+    multipleDf = resolvedDf[resolvedDf.duplicated(['Event_ID', 'DuplicateRecord'], keep=False)].copy()
+    multipleDf['Ambiguity'] = "Multiple EDD Records"
+    multipleDf['Candidate Event_IDs'] = multipleDf['Event_ID'].astype(str)
+    multipleDf['Records'] = multipleDf.groupby(['Event_ID', 'DuplicateRecord'], dropna=False)['Site ID'].transform('size')
+
+    return multipleDf.drop(columns=['Event_ID', 'DuplicateRecord'])
+
+
+#Build the Event Catalog hash indexes for the 'resolvePriority' passes - built once per Event Catalog
+#eventCatalog - Hydro Year Event Catalog from 'fetchEventCatalog'
+#Returns list (in priority order) of dictionaries with the 'passType', the unique 'keys' index, the 'events' aligned to the keys and
+#the 'ambiguous' keys (i.e. matching more than one Event) with their Candidate Event_IDs and Start Dates
+def buildEventIndex(eventCatalog):
+    indexList = []
+    for passType, partName, keyField, typeField, duplicateYesNo in resolvePriority:
+        if passType is None:
+            passType = labDuplicateType
+        partDf = eventCatalog[partName]
+        passDf = partDf[(partDf[typeField] == passType) & partDf[keyField].notnull()]
+
+        duplicateMask = passDf.duplicated(keyField, keep=False)
+        eventsDf = passDf[~duplicateMask][[keyField, 'Event_Group_ID', 'Event_ID', 'Site_ID', 'Visit_Type']].reset_index(drop=True)
+        eventsDf['DuplicateRecord'] = "Yes" if duplicateYesNo == "Yes" else None
+
+        candidateGroups = passDf[duplicateMask].astype({'Event_ID': str, 'Start_Date': str}).groupby(keyField)
+        ambiguousDf = pd.DataFrame({'Candidate Event_IDs': candidateGroups['Event_ID'].agg("; ".join),
+                                    'Candidate Start_Dates': candidateGroups['Start_Date'].agg("; ".join),
+                                    'Records': candidateGroups.size()})
+
+        indexList.append({'passType': passType, 'keys': pd.Index(eventsDf[keyField]), 'events': eventsDf, 'ambiguous': ambiguousDf})
+
+    return indexList
+
+
+#Add the Lab fields with defined values (i.e. 'labFields' - 'TP_Lab_Name','TP_Lab_SOP','TP_Lab_ID','TP_Lab_MDL') and the 'Notes' field (updated in place)
+def defineLabFields(df_DatasetToDefine):
+    for fieldName, fieldValue in labFields().items():
+        if compactFrames:
+            #One category (no category for a None value) - one byte per record
+            categories = [] if fieldValue is None else [fieldValue]
+            codes = np.full(len(df_DatasetToDefine), len(categories) - 1, dtype=np.int8)
+            df_DatasetToDefine[fieldName] = pd.Categorical.from_codes(codes, categories=categories)
+        else:
+            df_DatasetToDefine[fieldName] = fieldValue
+    df_DatasetToDefine['Notes'] = None
+
+
+#Compact the dataset (updated in place) - see 'compactFrames'
+#categoryFields - Repeated text fields held as categorical
+#numericFields - Fields held as float when all values are numeric (i.e. fields with Text Code Flags are not changed)
+def compactDataset(df_DatasetToDefine, categoryFields=(), numericFields=()):
+    for fieldName in numericFields:
+        if fieldName in df_DatasetToDefine.columns and not pd.api.types.is_numeric_dtype(df_DatasetToDefine[fieldName].dtype):
+            try:
+                df_DatasetToDefine[fieldName] = pd.to_numeric(df_DatasetToDefine[fieldName]).astype("float64")
+            except (TypeError, ValueError):
+                pass
+
+    for fieldName in categoryFields:
+        if fieldName in df_DatasetToDefine.columns and not isinstance(df_DatasetToDefine[fieldName].dtype, pd.CategoricalDtype):
+            df_DatasetToDefine[fieldName] = df_DatasetToDefine[fieldName].astype("category")
+
+
+#Stream State - the state of the Streaming Mode chunks of an EDD (see 'streamMain'), passed to the functions processing a chunk ('stream' - None when
+#the EDD is processed in memory): the EDD record offset of the chunk, the report frames of the chunks (exported once the EDD is processed), the
+#resolved records of the chunk, the Event_ID/DuplicateRecord slots matched by more than one EDD record with the keys of their appended records,
+#the .csv files appended by the chunks and the values expected per Event_ID by the reconciliation of the Target
+class StreamState:
+
+    def __init__(self):
+        self.recordOffset = 0
+        self.reports = {}
+        self.resolvedList = []
+        self.multipleSlots = set()
+        self.slotKeys = set()
+        self.appendedFiles = set()
+        self.reconcile = None
+
+    #Reset the state for the chunks of a Target
+    #multipleSlots - Event_ID/DuplicateRecord slots of the Target matched by more than one EDD record
+    def startTarget(self, multipleSlots=None):
+        self.recordOffset = 0
+        self.multipleSlots = set() if multipleSlots is None else multipleSlots
+        self.slotKeys = set()
+        self.reconcile = None
+
+    #Hold the report frame of a chunk - exported with the report frames of the other chunks (see 'exportReports')
+    def holdReport(self, reportDf, outCSV):
+        self.reports.setdefault(outCSV, []).append(reportDf)
+
+    #Export the reports held - one .csv file per report with the report frames of the chunks
+    #outCSVList - Optional reports exported (default all held reports)
+    def exportReports(self, outCSVList=None):
+        for outCSV in list(self.reports if outCSVList is None else outCSVList):
+            reportList = self.reports.pop(outCSV, [])
+            if len(reportList) > 0:
+                pd.concat(reportList, ignore_index=True).to_csv(outCSV, index=False)
+
+    #Add the values expected per Event_ID of a chunk (see 'reconcileExpected') - the values of the chunk replace those of the earlier chunks
+    #for the same Event_IDs
+    def addReconcile(self, reconcileDf):
+        if self.reconcile is None:
+            self.reconcile = reconcileDf
+        else:
+            self.reconcile = pd.concat([self.reconcile[~self.reconcile.index.isin(reconcileDf.index)], reconcileDf])
 
-        # Export DateFrame with Records that are Null
-        dateString = date.today().strftime("%Y%m%d")
-        # Define Export .csv file
-        outFull = workspace + "\RecordsNoEventinDB_" + dateString + ".csv"
 
-        # Export
-        df_eventNeeeded.to_csv(outFull, index=False)
+#EDD record numbers (1 based) of the dataset records - numbered from the record offset of the chunk in Streaming Mode
+#stream - Optional Stream State of the chunk (see 'StreamState')
+def eddRecordNumbers(recordCount, stream=None):
+    recordOffset = 0 if stream is None else stream.recordOffset
+    return np.arange(recordOffset + 1, recordOffset + recordCount + 1)
 
-        scriptMsg3 = "Exported .csv file: " + outFull + " which defines the events in need of definition - check worspace directory."
-        print(scriptMsg3)
-        # Message Box Three
-        tkinter.messagebox.Message(title="Exporting Table", message=scriptMsg3, master=root).show()
 
-        logFile = open(logFileName, "a")
-        messageTime = timeFun()
-        logFile.write(scriptMsg + " - " + messageTime + "\n")
-        logFile.write(scriptMsg3 + " - " + messageTime + "\n")
-        logFile.close()
+#Export a report .csv file (e.g. Validation Exceptions, Ambiguous Matches) - in Streaming Mode the report of each chunk is held and the
+#report is exported once the EDD is processed (see 'StreamState.exportReports')
+#stream - Optional Stream State of the chunk (see 'StreamState')
+def exportReport(reportDf, outCSV, stream=None):
+    if stream is None:
+        reportDf.to_csv(outCSV, index=False)
+    else:
+        stream.holdReport(reportDf, outCSV)
+
+
+#Memory (MB) of the dataset including the text values and the index - added to the Run Report stages
+def frameMemoryMB(inDF):
+    return round(float(inDF.memory_usage(index=True, deep=True).sum()) / 1048576, 3)
+
+
+#Enable pandas Copy-on-Write (pandas 2.x - the default from pandas 3.0) when 'compactFrames' is True - selections share the data until changed
+def enableCopyOnWrite():
+    if compactFrames and int(pd.__version__.split(".")[0]) == 2:
+        pd.set_option("mode.copy_on_write", True)
+
+
+
+#Event Catalog query text - Events for all Visit Types (i.e. tbl_Event, tbl_Event_Group and tbl_Site) and Lab Duplicates for all Types
+#(i.e. tbl_LabDuplicates).  The Hydro Year is a bound parameter (:hydroYear) so the statement text is the same for every call/year.
+catalogSQL = {'events': "SELECT tbl_Event.Event_Group_ID, tbl_Event.Event_ID, tbl_Event_Group.Hydrologic_Year, tbl_Event.Start_Date, tbl_Event.Site_ID, tbl_Site.Site_Name,"
+                        " tbl_Event.Site_IDLab_QCExtra, tbl_Event.Visit_Type FROM (tbl_Event INNER JOIN tbl_Event_Group"
+                        " ON tbl_Event_Group.Event_Group_ID = tbl_Event.Event_Group_ID)"
+                        " LEFT JOIN tbl_Site ON tbl_Site.Site_ID = tbl_Event.Site_ID WHERE tbl_Event_Group.Hydrologic_Year = :hydroYear"
+                        " ORDER BY tbl_Event.Start_Date, tbl_Site.Site_Name, tbl_Event.Visit_Type",
+              'labDuplicates': "SELECT tbl_Event.Event_Group_ID, tbl_Event.Event_ID, tbl_Event_Group.Hydrologic_Year, tbl_Event.Start_Date, tbl_Event.Site_ID,"
+                               " tbl_LabDuplicates.LabSiteID, tbl_Event.Site_IDLab_QCExtra, tbl_Event.Visit_Type, tbl_LabDuplicates.Type"
+                               " FROM ((tbl_Event INNER JOIN tbl_Event_Group ON tbl_Event_Group.Event_Group_ID = tbl_Event.Event_Group_ID)"
+                               " INNER JOIN tbl_LabDuplicates ON tbl_Event.Event_ID = tbl_LabDuplicates.Event_ID) LEFT JOIN tbl_Site ON tbl_Site.Site_ID = tbl_Event.Site_ID"
+                               " WHERE tbl_Event_Group.Hydrologic_Year = :hydroYear"
+                               " ORDER BY tbl_Event.Start_Date, tbl_LabDuplicates.LabSiteID, tbl_Event.Visit_Type"}
+
+#Event Catalog probe query text - one aggregate row per Catalog Part (row count, max ID and the count/length/range of the fields used to
+#define the records).  {length} is the string length function of the backend (see 'DBBackend').
+catalogProbeSQL = {'events': "SELECT Count(*) AS RecordCount, Max(tbl_Event.Event_ID) AS MaxID, Count(tbl_Event.Site_IDLab_QCExtra) AS QCExtraCount,"
+                             " Sum({length}(tbl_Event.Site_IDLab_QCExtra)) AS QCExtraLength, Min(tbl_Event.Site_IDLab_QCExtra) AS QCExtraMin, Max(tbl_Event.Site_IDLab_QCExtra) AS QCExtraMax,"
+                             " Sum({length}(tbl_Event.Visit_Type)) AS VisitTypeLength, Sum({length}(tbl_Site.Site_Name)) AS SiteNameLength, Max(tbl_Event.Start_Date) AS MaxDate"
+                             " FROM (tbl_Event INNER JOIN tbl_Event_Group ON tbl_Event_Group.Event_Group_ID = tbl_Event.Event_Group_ID)"
+                             " LEFT JOIN tbl_Site ON tbl_Site.Site_ID = tbl_Event.Site_ID WHERE tbl_Event_Group.Hydrologic_Year = :hydroYear",
+                   'labDuplicates': "SELECT Count(*) AS RecordCount, Max(tbl_LabDuplicates.Event_ID) AS MaxID, Sum({length}(tbl_LabDuplicates.LabSiteID)) AS LabSiteIDLength,"
+                                    " Min(tbl_LabDuplicates.LabSiteID) AS LabSiteIDMin, Max(tbl_LabDuplicates.LabSiteID) AS LabSiteIDMax, Sum({length}(tbl_LabDuplicates.Type)) AS TypeLength"
+                                    " FROM (tbl_Event INNER JOIN tbl_Event_Group ON tbl_Event_Group.Event_Group_ID = tbl_Event.Event_Group_ID)"
+                                    " INNER JOIN tbl_LabDuplicates ON tbl_Event.Event_ID = tbl_LabDuplicates.Event_ID WHERE tbl_Event_Group.Hydrologic_Year = :hydroYear"}
+
+
+#Event Catalog queries for the Hydro Year (see 'catalogSQL') with the Hydro Year bound
+#Returns dictionary of Catalog Part Name and Query
+def catalogQueries(inYear):
+    return {partName: sa.text(partSQL).bindparams(hydroYear=int(inYear)) for partName, partSQL in catalogSQL.items()}
+
+
+#Event Catalog probe queries for the Hydro Year (see 'catalogProbeSQL') - used to identify the parts of the Catalog Snapshot which have changed
+#Returns dictionary of Catalog Part Name and Query
+def catalogProbeQueries(inYear):
+    lengthFunction = getSession(inDB).backend.lengthFunction
+    return {partName: sa.text(partSQL.format(length=lengthFunction)).bindparams(hydroYear=int(inYear)) for partName, partSQL in catalogProbeSQL.items()}
+
+
+#Prefetch the Event Catalog for the Hydro Year - One connection to the Periphyton DB for all metadata used in the Visit Type/Lab Duplicate resolution
+#When 'catalogCache' is True the local Catalog Snapshot is used while the database is unchanged (see 'catalogQueries' and 'catalogProbeQueries')
+#inYear - Field Year being processed
+#cancelEvent - Optional threading.Event - when set the fetch ends before the next database query (see 'CatalogPrefetch')
+#Returns dictionary with the 'events' and 'labDuplicates' dataframes - subset in memory by Visit Type and Lab Duplicate Type
+def fetchEventCatalog(inYear, cancelEvent=None):
+    try:
+        queryDict = catalogQueries(inYear)
+        refreshParts = list(queryDict)
+        snapshot = None
+        snapshotState = {'dbFile': dbFileState(), 'probes': {}}
+
+        if catalogCache:
+            snapshot = readCatalogSnapshot(inYear)
+
+            #Database file unchanged - use the Catalog Snapshot without querying the database
+            if snapshot is not None and snapshotState['dbFile'] is not None and snapshot['state']['dbFile'] == snapshotState['dbFile']:
+                eventCatalog = {'hydroYear': inYear, 'events': snapshot['events'], 'labDuplicates': snapshot['labDuplicates']}
+                messageTime = timeFun()
+                scriptMsg = "Success:  fetchEventCatalog - Catalog Snapshot (database unchanged) - Events: " + str(len(eventCatalog['events'])) \
+                            + " - Lab Duplicates: " + str(len(eventCatalog['labDuplicates'])) + " - " + messageTime
+                print(scriptMsg)
+                logMessage(scriptMsg, "INFO", function="fetchEventCatalog", hydroYear=inYear, source="snapshot")
+                return "success function", eventCatalog
+
+            #Probe the Catalog Parts - only parts with a changed probe are queried
+            if cancelEvent is not None and cancelEvent.is_set():
+                return cancelledFetch(inYear)
+            snapshotState['probes'] = probeEventCatalog(inYear)
+            if snapshotState['probes'] is None:
+                messageTime = timeFun()
+                print("WARNING - Function connect_to_AcessDB - " + messageTime + " - Failed - Exiting Script")
+                exit()
+
+            #Database file changed - the events are re-queried (an edit of the Event_ID/Site_ID/Visit_Type mapping, e.g. Site_IDs swapped
+            #between Events, is not seen by the counts/lengths of the probe).  The probes define the parts refreshed when the file state is unknown.
+            if snapshot is not None:
+                refreshParts = [partName for partName in queryDict if snapshot['state']['probes'].get(partName) != snapshotState['probes'][partName]
+                                or (partName == "events" and snapshotState['dbFile'] is not None)]
+
+        #Catalog Part queries are run on a single connection
+        eventCatalog = {'hydroYear': inYear}
+        if cancelEvent is not None and cancelEvent.is_set():
+            return cancelledFetch(inYear)
+        if len(refreshParts) > 0:
+            outVal = connect_to_AcessDB([queryDict[partName] for partName in refreshParts], inDB)
+            if outVal[0].lower() != "success function":
+                messageTime = timeFun()
+                print("WARNING - Function connect_to_AcessDB - " + messageTime + " - Failed - Exiting Script")
+                exit()
+            eventCatalog.update(zip(refreshParts, outVal[1]))
+
+        for partName in queryDict:
+            if partName not in eventCatalog:
+                eventCatalog[partName] = snapshot[partName]
+
+        if catalogCache:
+            writeCatalogSnapshot(eventCatalog, snapshotState)
+
+        messageTime = timeFun()
+        scriptMsg = "Success:  connect_to_AcessDB - fetchEventCatalog - Events: " + str(len(eventCatalog['events'])) + " - Lab Duplicates: " \
+                    + str(len(eventCatalog['labDuplicates'])) + " - Refreshed: " + ", ".join(refreshParts) + " - " + messageTime
+        print(scriptMsg)
+        logMessage(scriptMsg, "INFO", function="fetchEventCatalog", hydroYear=inYear, source="database", refreshed=refreshParts)
+
+        return "success function", eventCatalog
+
+    except:
+        messageTime = timeFun()
+        print("Error on fetchEventCatalog Function - " + str(inYear) + " - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'fetchEventCatalog'"
+
+
+#Event Catalog fetch cancelled (see 'fetchEventCatalog') - Returns the failed outcome
+def cancelledFetch(inYear):
+    messageTime = timeFun()
+    scriptMsg = "fetchEventCatalog cancelled - EDD processing failed - Hydro Year: " + str(inYear) + " - " + messageTime
+    print(scriptMsg)
+    logMessage(scriptMsg, "INFO", function="fetchEventCatalog", hydroYear=inYear)
+    return "Cancelled function - 'fetchEventCatalog'"
+
+
+#Event Catalog Prefetch - 'fetchEventCatalog' run on a background thread while the EDD workbook is parsed (see 'prefetchCatalog').
+#Only the prefetch thread uses the Periphyton DB Session until it is joined.  The fetch is cancelled (before the next database query) by 'close'.
+#inYear - Field Year being processed
+class CatalogPrefetch:
+
+    def __init__(self, inYear):
+        self.cancelEvent = threading.Event()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="CatalogPrefetch")
+        self.future = self.executor.submit(self.fetch, inYear, self.cancelEvent)
+
+    #Fetch the Event Catalog (Run Report 'fetchEventCatalog' stage) - Returns the 'fetchEventCatalog' outcome
+    @staticmethod
+    def fetch(inYear, cancelEvent=None):
+        with stageSpan("fetchEventCatalog", hydroYear=inYear, prefetch=cancelEvent is not None) as span:
+            outVal = fetchEventCatalog(inYear, cancelEvent)
+            span['rowsOut'] = len(outVal[1]['events']) + len(outVal[1]['labDuplicates']) if outVal[0].lower() == "success function" else None
+        return outVal
+
+    #True when the fetch has ended without the Event Catalog
+    def failed(self):
+        return self.future.done() and (self.future.exception() is not None or self.future.result()[0].lower() != "success function")
+
+    #Wait for the fetch (Run Report 'joinEventCatalog' stage - the wait not overlapped by the EDD parse) - Returns the 'fetchEventCatalog' outcome
+    def result(self):
+        with stageSpan("joinEventCatalog"):
+            return self.future.result()
+
+    #Cancel the fetch when not complete and wait for the thread to end
+    def close(self):
+        self.cancelEvent.set()
+        self.executor.shutdown(wait=True)
+
+
+#Run the Event Catalog probe queries for the Hydro Year (see 'catalogProbeQueries') on one connection
+#Returns dictionary of Catalog Part Name and probe values (as text), None when the queries fail
+def probeEventCatalog(inYear):
+    probeDict = catalogProbeQueries(inYear)
+    outVal = connect_to_AcessDB(list(probeDict.values()), inDB)
+    if outVal[0].lower() != "success function":
+        return None
+
+    return {partName: [str(value) for value in probeDf.iloc[0].tolist()] for partName, probeDf in zip(probeDict, outVal[1])}
+
+
+#Content hash (sha256) of the Event Catalog parts - recorded in the Load Plan
+def catalogHash(eventCatalog):
+    hashValue = hashlib.sha256()
+    for partName in catalogSQL:
+        hashValue.update(eventCatalog[partName].to_csv(index=False).encode("utf-8"))
+
+    return hashValue.hexdigest()
+
+
+#Modification time and size of the 'inDB' database file - None when 'inDB' is not a local/network file
+def dbFileState():
+    if not os.path.isfile(inDB):
+        return None
+
+    dbStat = os.stat(inDB)
+    return {'inDB': os.path.abspath(inDB), 'mtime': dbStat.st_mtime, 'size': dbStat.st_size}
+
+
+#Path (without extension) of the Catalog Snapshot for the Hydro Year
+def catalogSnapshotPath(inYear):
+    return os.path.join(workspace, "CatalogCache", "EventCatalog_HY" + str(inYear))
+
+
+#Read the Catalog Snapshot for the Hydro Year - Returns dictionary with the 'state', 'events' and 'labDuplicates', None when not available
+def readCatalogSnapshot(inYear):
+    snapshotPath = catalogSnapshotPath(inYear)
+    try:
+        #Snapshot held in memory (i.e. written or read earlier in the run)
+        if snapshotPath in catalogSnapshots:
+            snapshot = catalogSnapshots[snapshotPath]
+            return snapshot if snapshot['state']['inDB'] == os.path.abspath(inDB) else None
+
+        if not os.path.exists(snapshotPath + ".json"):
+            return None
+
+        with open(snapshotPath + ".json", "r") as stateFile:
+            snapshotState = json.load(stateFile)
+
+        #Snapshot of a different database
+        if snapshotState['inDB'] != os.path.abspath(inDB):
+            return None
+
+        snapshot = {'state': snapshotState}
+        for partName in catalogSQL:
+            snapshot[partName] = pd.read_pickle(snapshotPath + "_" + partName + ".pkl")
+
+        catalogSnapshots[snapshotPath] = snapshot
+        return snapshot
+
+    except:
+        messageTime = timeFun()
+        print("WARNING - Unable to read Catalog Snapshot: " + snapshotPath + " - " + messageTime)
+        return None
+
+
+#Write the Catalog Snapshot for the Hydro Year - the state file (.json) is written last so a partial write is not used
+def writeCatalogSnapshot(eventCatalog, snapshotState):
+    snapshotPath = catalogSnapshotPath(eventCatalog['hydroYear'])
+    catalogSnapshots.pop(snapshotPath, None)
+    try:
+        os.makedirs(os.path.dirname(snapshotPath), exist_ok=True)
+        if os.path.exists(snapshotPath + ".json"):
+            os.remove(snapshotPath + ".json")
+
+        for partName in catalogSQL:
+            eventCatalog[partName].to_pickle(snapshotPath + "_" + partName + ".pkl")
+
+        snapshotState = dict(snapshotState, inDB=os.path.abspath(inDB))
+        with open(snapshotPath + ".json", "w") as stateFile:
+            json.dump(snapshotState, stateFile)
+
+        catalogSnapshots[snapshotPath] = dict({partName: eventCatalog[partName] for partName in catalogSQL}, state=snapshotState)
+
+    except:
+        messageTime = timeFun()
+        print("WARNING - Unable to write Catalog Snapshot: " + snapshotPath + " - " + messageTime)
+
+
+#Periphyton DB Backend - creates the sqlAlchemy engine for 'inDB' and defines the SQL differences of the backend used in the metadata queries.
+#Statements are run with bound parameters (i.e. the same statement text is prepared once by the driver and re-executed).
+#inDB - Database file or sqlAlchemy URL
+class DBBackend(abc.ABC):
+
+    name = None
+
+    #String length function used in the Event Catalog probe queries (see 'catalogProbeSQL')
+    lengthFunction = "Length"
+
+    def __init__(self, inDB):
+        self.inDB = inDB
+
+    @abc.abstractmethod
+    def createEngine(self):
+        pass
+
+
+#Access Backend - Access ODBC driver (access+pyodbc) - NullPool so closing the connection closes the Access driver connection
+class AccessBackend(DBBackend):
+
+    name = "access"
+    lengthFunction = "Len"
+
+    def createEngine(self):
+        import pyodbc
+        pyodbc.pooling = False  #So you can close pydobxthe connection - the shared 'dbSession' connection is closed at the end of the run
+
+        connStr = (r"DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};DBQ=" + self.inDB + ";ExtendedAnsiSQL=1;")  # sqlAlchemy-access connection
+        cnxn = sa.engine.URL.create("access+pyodbc", query={"odbc_connect": connStr})
+        engine = sa.create_engine(cnxn, poolclass=sa.pool.NullPool)
+
+        #Set the pyodbc 'fast_executemany' on the cursor for executemany statements
+        if useFastExecuteMany:
+            @sa.event.listens_for(engine, "before_cursor_execute")
+            def setFastExecuteMany(conn, cursor, statement, params, context, executemany):
+                if executemany:
+                    cursor.fast_executemany = True
+
+        return engine
+
+
+#SQLite Backend - local SQLite copy/stand-in of the Periphyton schema (e.g. staging or processing on Linux).
+#Guid record keys ('TotalPhosphorus_Data_ID') are bound as text.
+class SQLiteBackend(DBBackend):
+
+    name = "sqlite"
+
+    def createEngine(self):
+        import sqlite3
+        sqlite3.register_adapter(uuid.UUID, str)
+
+        return sa.create_engine("sqlite:///" + self.inDB, poolclass=sa.pool.NullPool)
+
+
+#sqlAlchemy URL Backend - any database with a sqlAlchemy dialect (e.g. 'mssql+pyodbc://...', 'postgresql://...')
+class URLBackend(DBBackend):
+
+    name = "url"
+
+    def __init__(self, inDB):
+        DBBackend.__init__(self, inDB)
+        if inDB.split(":", 1)[0].split("+")[0].lower() in ("access", "mssql"):
+            self.lengthFunction = "Len"
+
+    def createEngine(self):
+        return sa.create_engine(self.inDB, poolclass=sa.pool.NullPool)
+
+
+#Periphyton DB Backends by name (see 'dbBackend')
+dbBackends = {'access': AccessBackend, 'sqlite': SQLiteBackend, 'url': URLBackend}
+
+
+#Create the Periphyton DB Backend for 'inDB'
+#backendName - Backend name (see 'dbBackends') - None uses 'dbBackend', defined from 'inDB' when 'dbBackend' is None
+def createBackend(inDB, backendName=None):
+    if backendName is None:
+        backendName = dbBackend
+    if backendName is None:
+        if "://" in inDB:
+            backendName = "url"
+        elif os.path.splitext(inDB)[1].lower() in (".sqlite", ".sqlite3", ".db"):
+            backendName = "sqlite"
+        else:
+            backendName = "access"
+
+    if backendName not in dbBackends:
+        raise ValueError("Unknown dbBackend: " + str(backendName))
+
+    return dbBackends[backendName](inDB)
+
+
+#Shared Periphyton DB Session - a single reusable connection for the run which serves the metadata queries and the append.
+#The connection is opened on first use, reused by subsequent calls and closed deterministically via 'close' at the end of the run.
+#inDB - Periphyton database (Access database, SQLite file or sqlAlchemy URL)
+#engine - Optional sqlAlchemy engine to use in place of the backend engine
+#backend - Optional Periphyton DB Backend (see 'createBackend')
+class DBSession:
+
+    def __init__(self, inDB, engine=None, backend=None):
+        self.inDB = inDB
+        self.engine = engine
+        self.backend = backend if backend is not None else createBackend(inDB)
+        self.connection = None
+        self.openCount = 0
+        self.reuseCount = 0
+        self.queryCount = 0
+
+    #Create the engine of the Periphyton DB Backend
+    def createEngine(self):
+        return self.backend.createEngine()
+
+    #Return the open connection - opening it if this is the first use (or it has been closed)
+    def connect(self):
+        if self.connection is None or self.connection.closed:
+            if self.engine is None:
+                self.engine = self.createEngine()
+            if not sa.event.contains(self.engine, "before_cursor_execute", countRoundTrip):
+                sa.event.listen(self.engine, "before_cursor_execute", countRoundTrip)
+            self.connection = self.engine.connect()
+            self.openCount += 1
+        else:
+            self.reuseCount += 1
+
+        return self.connection
+
+    #Run a select query on the shared connection - return query in a dataframe
+    #query - sqlAlchemy statement with bound parameters (e.g. 'catalogQueries') or query string
+    def readQuery(self, query):
+        with stageSpan("dbQuery", query=" ".join(str(query).split())[:200]) as span:
+            conn = self.connect()
+            queryDf = pd.read_sql(query, conn)
+            if conn.in_transaction():
+                conn.commit()
+            self.queryCount += 1
+            span['rowsOut'] = len(queryDf)
+
+        return queryDf
+
+    #Explicit transaction on the shared connection - committed on exit, rolled back if an exception is raised
+    def transaction(self):
+        conn = self.connect()
+        if conn.in_transaction():
+            conn.commit()
+
+        return conn.begin()
+
+    def statsMessage(self):
+        return "Connections opened: " + str(self.openCount) + " - Connections reused: " + str(self.reuseCount) + " - Queries: " + str(self.queryCount)
+
+    #Close the connection and the engine
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        if self.engine is not None:
+            self.engine.dispose()
+
+
+#Get the shared Periphyton DB Session for the run - created on first call
+def getSession(inDB):
+    global dbSession
+    if dbSession is None:
+        dbSession = DBSession(inDB)
+
+    return dbSession
+
+
+#Close the shared Periphyton DB Session and log the connection open/reuse counts
+def closeSession():
+    global dbSession
+    if dbSession is None:
+        return
+
+    try:
+        dbSession.close()
+        messageTime = timeFun()
+        scriptMsg = "Closed Periphyton DB Session - " + dbSession.statsMessage() + " - " + messageTime
+        print(scriptMsg)
+        logMessage(scriptMsg, "INFO", function="closeSession", connectionsOpened=dbSession.openCount,
+                   connectionsReused=dbSession.reuseCount, queries=dbSession.queryCount)
+    except:
+        messageTime = timeFun()
+        print("Error on closeSession Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+    finally:
+        dbSession = None
+
+
+#Connect to Access DB and perform defined query - return query in a dataframe
+#query - single query string, or list of query strings (returns a list of dataframes)
+#Queries are run on the shared Periphyton DB Session connection (see 'getSession')
+def connect_to_AcessDB(query, inDB):
+
+    try:
+        session = getSession(inDB)
+        if isinstance(query, list):
+            queryDf = [session.readQuery(queryOne) for queryOne in query]
+        else:
+            queryDf = session.readQuery(query)
+
+        return "success function", queryDf
+
+    except:
+        messageTime = timeFun()
+        scriptMsg = "Error function:  connect_to_AcessDB - " +  messageTime
+        print(scriptMsg)
+        logMessage(scriptMsg, "ERROR", function="connect_to_AcessDB", traceback=traceback.format_exc())
+
+        traceback.print_exc(file=sys.stdout)
+        return "failed function"
 
-        root.destroy()
-        root.mainloop()
+
+
+#Export the Records with Null 'Event_ID' values and notify (Message Boxes in Interactive Mode) that the Events must be defined in the Periphyton DB
+#df_DatasetToDefine - Dataset being defined - None when the records were exported with the chunks (Streaming Mode)
+#outFull - Export .csv file (default 'RecordsNoEventinDB_{date}.csv' in the workspace)
+def nullRecordsGt0(recCountNull, df_DatasetToDefine, outFull=None):
+    try:
+
+        scriptMsg = "WARNING - There are: " + str(recCountNull) + " - Records with Null 'Event_ID' values"
+        print(scriptMsg)
+        scriptMsg2 = "These Null Records MUST have a defined Event in the 'Periphyton' database - Exiting Script"
+        print(scriptMsg2)
+
+        if interactive:
+            import tkinter as tk
+            import tkinter.messagebox
+
+            # Add Message Box
+            root = tk.Tk()
+            root.geometry("500x300")
+            root.title('Message Box')
+            root.lift()
+            root.attributes('-topmost', True)
+            # Message Box First
+            tkinter.messagebox.Message(title="Warning", message=scriptMsg, master=root).show()
+
+            # Message Box Second
+            tkinter.messagebox.Message(title="Warning", message=scriptMsg2, master=root).show()
+
+        # Define Export .csv file
+        if outFull is None:
+            outFull = os.path.join(workspace, "RecordsNoEventinDB_" + dateString + ".csv")
+
+        # Export the Records in need of a Matching Event in the database (exported with the chunks in Streaming Mode)
+        if df_DatasetToDefine is not None:
+            exportNullRecords(df_DatasetToDefine, outFull)
+
+        scriptMsg3 = "Exported .csv file: " + outFull + " which defines the events in need of definition - check worspace directory."
+        print(scriptMsg3)
+
+        messageTime = timeFun()
+        logMessage(scriptMsg + " - " + messageTime, "WARNING", function="nullRecordsGt0", records=int(recCountNull))
+        logMessage(scriptMsg3 + " - " + messageTime, "WARNING", function="nullRecordsGt0", outFile=outFull)
+
+        if interactive:
+            # Message Box Three
+            tkinter.messagebox.Message(title="Exporting Table", message=scriptMsg3, master=root).show()
+
+            root.destroy()
+            root.mainloop()
 
         return "success function"
 
@@ -644,8 +2177,426 @@ def nullRecordsGt0(recCountNull, df_DatasetToDefine):
         return "Failed function - 'nullRecordsGt0'"
 
 
+#Export the Records with Null 'Event_ID' values (i.e. in need of a Matching Event in the database) to .csv file
+#df_DatasetToDefine - Dataset being defined
+#outFull - Export .csv file
+#stream - Optional Stream State of the chunk (Streaming Mode - see 'StreamState')
+def exportNullRecords(df_DatasetToDefine, outFull, stream=None):
+    df_eventNeeeded = df_DatasetToDefine[df_DatasetToDefine['Event_ID'].isnull()].reset_index(drop=False)
+    exportReport(df_eventNeeeded, outFull, stream)
+
+    return outFull
+
+
+#Event Catalogs searched for the suggestions (see 'suggestEvents') - the Hydro Year and the adjacent 'suggestionYears' Hydro Years.
+#Adjacent Hydro Years not fetched are not searched.
+#inYear - Field Year being processed
+#eventCatalog - Hydro Year Event Catalog from 'fetchEventCatalog'
+#fetchedCatalogs - Optional dictionary of Hydro Year and Event Catalog already fetched (e.g. Batch Mode) - the adjacent Hydro Years fetched are added
+#Returns list of Event Catalogs
+def suggestionCatalogs(inYear, eventCatalog, fetchedCatalogs=None):
+    if fetchedCatalogs is None:
+        fetchedCatalogs = {}
+
+    catalogList = [eventCatalog]
+    for adjacentYear in range(inYear - suggestionYears, inYear + suggestionYears + 1):
+        if adjacentYear == inYear:
+            continue
+        if adjacentYear not in fetchedCatalogs:
+            with stageSpan("fetchEventCatalog", hydroYear=adjacentYear) as span:
+                outVal = fetchEventCatalog(adjacentYear)
+                span['rowsOut'] = len(outVal[1]['events']) + len(outVal[1]['labDuplicates']) if outVal[0].lower() == "success function" else None
+            if outVal[0].lower() != "success function":
+                continue
+            fetchedCatalogs[adjacentYear] = outVal[1]
+        catalogList.append(fetchedCatalogs[adjacentYear])
+
+    return catalogList
+
+
+#Normalized 'Site ID'/key value compared by the Suggestion Index - upper case letters and digits only (e.g. 'bicy-01 ' and 'BICY 01' match)
+def normalizeSiteKey(inValue):
+    return "".join(character for character in str(inValue).upper() if character.isalnum())
+
+
+#Trigrams of a normalized key - padded so the leading/trailing characters carry weight
+def keyTrigrams(keyValue):
+    paddedValue = "  " + keyValue + " "
+    return {paddedValue[position:position + 3] for position in range(len(paddedValue) - 2)}
+
+
+#Edit (Levenshtein) distance of two key values
+def editDistance(firstValue, secondValue):
+    previousRow = list(range(len(secondValue) + 1))
+    for firstPosition, firstCharacter in enumerate(firstValue, 1):
+        currentRow = [firstPosition]
+        for secondPosition, secondCharacter in enumerate(secondValue, 1):
+            currentRow.append(min(previousRow[secondPosition] + 1, currentRow[secondPosition - 1] + 1,
+                                  previousRow[secondPosition - 1] + (firstCharacter != secondCharacter)))
+        previousRow = currentRow
+    return previousRow[-1]
+
+
+#Suggestion Index - trigram index over the 'resolvePriority' key values (i.e. Site_Name, Site_IDLab_QCExtra and LabSiteID) of the Event Catalogs.
+#The candidate keys of a 'Site ID' are found via the posting lists of its trigrams (no comparison to every key), the 'shortlistSize' keys
+#with the most shared trigrams (Dice coefficient) are scored by edit distance.
+#catalogList - Event Catalogs from 'fetchEventCatalog' (see 'suggestionCatalogs')
+class SuggestionIndex:
+
+    shortlistSize = 25
+
+    def __init__(self, catalogList):
+        candidateList = []
+        for eventCatalog in catalogList:
+            for passType, partName, keyField, typeField, duplicateYesNo in resolvePriority:
+                partDf = eventCatalog[partName]
+                candidateDf = partDf[partDf[keyField].notnull()][[keyField, 'Event_ID', 'Hydrologic_Year', 'Start_Date', typeField]]
+                candidateList.append(candidateDf.rename(columns={keyField: 'Key Value', typeField: 'Type'}).assign(**{'Key Field': keyField}))
+
+        #Candidate Events (one per key field/value) and the unique normalized keys
+        self.candidates = pd.concat(candidateList, ignore_index=True).drop_duplicates(['Key Field', 'Key Value', 'Event_ID'], ignore_index=True)
+        keyCodes, self.keys = pd.factorize(self.candidates['Key Value'].astype(str).map(normalizeSiteKey))
+        self.candidates['keyCode'] = keyCodes
+
+        postingLists = {}
+        self.trigramCounts = np.zeros(len(self.keys), dtype=np.int32)
+        for keyCode, keyValue in enumerate(self.keys):
+            keyGrams = keyTrigrams(keyValue)
+            self.trigramCounts[keyCode] = len(keyGrams)
+            for keyGram in keyGrams:
+                postingLists.setdefault(keyGram, []).append(keyCode)
+        self.postings = {keyGram: np.array(codeList, dtype=np.int32) for keyGram, codeList in postingLists.items()}
+
+    #Candidate keys for the 'Site ID'
+    #Returns list of (key code, score) - score 0 to 1 (mean of the trigram Dice coefficient and the edit distance similarity)
+    def query(self, siteID):
+        queryValue = normalizeSiteKey(siteID)
+        queryGrams = keyTrigrams(queryValue)
+        postingList = [self.postings[keyGram] for keyGram in queryGrams if keyGram in self.postings]
+        if len(queryValue) == 0 or len(postingList) == 0:
+            return []
+
+        #Shared trigram counts of the keys in the posting lists only
+        sharedCounts = np.bincount(np.concatenate(postingList), minlength=len(self.keys))
+        keyCodes = np.flatnonzero(sharedCounts)
+        diceScores = 2 * sharedCounts[keyCodes] / (len(queryGrams) + self.trigramCounts[keyCodes])
+        #Shortlist - keys tied with the last shortlisted Dice coefficient are kept
+        if len(keyCodes) > self.shortlistSize:
+            shortlist = diceScores >= np.partition(diceScores, len(diceScores) - self.shortlistSize)[len(diceScores) - self.shortlistSize]
+            keyCodes, diceScores = keyCodes[shortlist], diceScores[shortlist]
+
+        matchList = []
+        for keyCode, diceScore in zip(keyCodes, diceScores):
+            keyValue = self.keys[keyCode]
+            editScore = 1 - editDistance(queryValue, keyValue) / max(len(queryValue), len(keyValue))
+            matchList.append((int(keyCode), round((float(diceScore) + editScore) / 2, 4)))
+
+        return matchList
+
+
+#Suggest the nearest matching Events for the records with Null 'Event_ID' values - the top 'suggestionCount' Events per record by score
+#(then by the days between the record 'dateField' and the Event Start_Date) are exported for review
+#df_DatasetToDefine - Dataset being defined
+#catalogList - Event Catalogs searched (see 'suggestionCatalogs')
+#outSuggestCSV - Export .csv file of the Suggested Events
+#stream - Optional Stream State of the chunk (Streaming Mode - see 'StreamState')
+#Returns "success function" and the count of records with a suggested Event
+def suggestEvents(df_DatasetToDefine, catalogList, outSuggestCSV, stream=None):
+    try:
+        with stageSpan("buildSuggestionIndex") as span:
+            suggestionIndex = SuggestionIndex(catalogList)
+            span['rowsOut'] = len(suggestionIndex.keys)
+
+        nullMask = df_DatasetToDefine['Event_ID'].isnull().to_numpy()
+        recordsDf = pd.DataFrame({'EDD Record': eddRecordNumbers(len(nullMask), stream)[nullMask], 'Site ID': df_DatasetToDefine.index[nullMask]})
+        if dateField is not None and dateField in df_DatasetToDefine.columns:
+            recordsDf['EDD Date'] = pd.to_datetime(df_DatasetToDefine[dateField].to_numpy()[nullMask], errors='coerce')
+
+        #Candidate keys per unique 'Site ID'
+        matchList = [(siteID, keyCode, score) for siteID in recordsDf['Site ID'].unique() for keyCode, score in suggestionIndex.query(siteID)]
+        matchDf = pd.DataFrame(matchList, columns=['Site ID', 'keyCode', 'Score'])
+        matchDf = matchDf.merge(suggestionIndex.candidates, on='keyCode').drop(columns=['keyCode'])
+
+        suggestDf = recordsDf.merge(matchDf, on='Site ID', how='left')
+        if 'EDD Date' in suggestDf.columns:
+            suggestDf['Days Apart'] = (pd.to_datetime(suggestDf['Start_Date'], errors='coerce') - suggestDf['EDD Date']).abs().dt.days
+        else:
+            suggestDf['Days Apart'] = np.nan
+
+        #Top Events per record - an Event matched by more than one key field is listed once (best score)
+        suggestDf = suggestDf.sort_values(['EDD Record', 'Score', 'Days Apart'], ascending=[True, False, True], na_position='last')
+        suggestDf = suggestDf.drop_duplicates(['EDD Record', 'Event_ID']).groupby('EDD Record').head(suggestionCount)
+        suggestDf.insert(2, 'Rank', suggestDf.groupby('EDD Record').cumcount() + 1)
+        suggestDf.loc[suggestDf['Event_ID'].isnull(), 'Rank'] = np.nan
+        exportReport(suggestDf, outSuggestCSV, stream)
+
+        suggestedCount = int(suggestDf.loc[suggestDf['Event_ID'].notnull(), 'EDD Record'].nunique())
+        messageTime = timeFun()
+        scriptMsg = "Suggested Events for: " + str(suggestedCount) + " of " + str(len(recordsDf)) + " - Records with Null 'Event_ID' values - Hydro Years: " \
+                    + ", ".join(str(eventCatalog['hydroYear']) for eventCatalog in catalogList) + " - Exported .csv file: " + outSuggestCSV + " - " + messageTime
+        print(scriptMsg)
+        logMessage(scriptMsg, "WARNING", function="suggestEvents", records=len(recordsDf), suggested=suggestedCount, outFile=outSuggestCSV)
+
+        return "success function", suggestedCount
+
+    except:
+        messageTime = timeFun()
+        print("Error on suggestEvents Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'suggestEvents'"
+
+
+#Site Statistics queries ({table}/{field} - 'phosphorusTable'/'outlierField', {length} - backend length function) - 'probe' is one grouped query of
+#the record count/value length/range per Hydro Year (identifies the Hydro Years with changed records) and 'history' the values of a Hydro Year
+statisticsSQL = {'probe': "SELECT tbl_Event_Group.Hydrologic_Year, Count(*) AS RecordCount, Sum({length}({table}.{field})) AS ValueLength,"
+                          " Min({table}.{field}) AS ValueMin, Max({table}.{field}) AS ValueMax"
+                          " FROM ({table} INNER JOIN tbl_Event ON tbl_Event.Event_ID = {table}.Event_ID)"
+                          " INNER JOIN tbl_Event_Group ON tbl_Event_Group.Event_Group_ID = tbl_Event.Event_Group_ID GROUP BY tbl_Event_Group.Hydrologic_Year",
+                 'history': "SELECT tbl_Event.Site_ID, tbl_Event.Visit_Type, {table}.{field} AS HistoryValue"
+                            " FROM ({table} INNER JOIN tbl_Event ON tbl_Event.Event_ID = {table}.Event_ID)"
+                            " INNER JOIN tbl_Event_Group ON tbl_Event_Group.Event_Group_ID = tbl_Event.Event_Group_ID WHERE tbl_Event_Group.Hydrologic_Year = :hydroYear"}
+
+#Percentiles of the Site Statistics (i.e. 'P05', 'P25', 'P75' and 'P95' fields)
+statisticsPercentiles = [5, 25, 75, 95]
+
+
+#Site Statistics Cache folder of the 'phosphorusTable'/'outlierField' - history (Site_ID, Visit_Type and numeric value) per Hydro Year and the
+#Site Statistics index per Hydro Year processed
+def statisticsCachePath():
+    return os.path.join(workspace, "StatisticsCache", phosphorusTable + "_" + outlierField)
+
+
+#Read the Site Statistics Cache - Returns dictionary with the 'state', 'history' and 'statistics' (Hydro Year dataframes), None when not available
+def readStatisticsCache(cachePath):
+    try:
+        #Cache held in memory (i.e. written or read earlier in the run)
+        if cachePath in statisticsCaches:
+            cache = statisticsCaches[cachePath]
+            return cache if cache['state']['inDB'] == os.path.abspath(inDB) else None
+
+        if not os.path.exists(os.path.join(cachePath, "State.json")):
+            return None
+
+        with open(os.path.join(cachePath, "State.json"), "r") as stateFile:
+            cacheState = json.load(stateFile)
+
+        #Cache of a different database
+        if cacheState['inDB'] != os.path.abspath(inDB):
+            return None
+
+        cache = {'state': cacheState,
+                 'history': {yearName: pd.read_pickle(os.path.join(cachePath, "History_HY" + yearName + ".pkl")) for yearName in cacheState['probes']},
+                 'statistics': {yearName: pd.read_pickle(os.path.join(cachePath, "Statistics_HY" + yearName + ".pkl")) for yearName in cacheState['statistics']}}
+
+        statisticsCaches[cachePath] = cache
+        return cache
+
+    except:
+        messageTime = timeFun()
+        print("WARNING - Unable to read Site Statistics Cache: " + cachePath + " - " + messageTime)
+        return None
+
+
+#Write the Site Statistics Cache - only the history/statistics of the Hydro Years passed are written, the state file (.json) is written last
+#so a partial write is not used
+def writeStatisticsCache(cachePath, cache, historyYears=(), statisticsYears=()):
+    statisticsCaches[cachePath] = cache
+    try:
+        os.makedirs(cachePath, exist_ok=True)
+        if os.path.exists(os.path.join(cachePath, "State.json")):
+            os.remove(os.path.join(cachePath, "State.json"))
+
+        for yearName in historyYears:
+            cache['history'][yearName].to_pickle(os.path.join(cachePath, "History_HY" + yearName + ".pkl"))
+        for yearName in statisticsYears:
+            cache['statistics'][yearName].to_pickle(os.path.join(cachePath, "Statistics_HY" + yearName + ".pkl"))
+
+        with open(os.path.join(cachePath, "State.json"), "w") as stateFile:
+            json.dump(cache['state'], stateFile)
+
+    except:
+        messageTime = timeFun()
+        print("WARNING - Unable to write Site Statistics Cache: " + cachePath + " - " + messageTime)
+
+
+#Refresh the Site Statistics history - the database is not queried while the inDB file modification time/size is unchanged, otherwise one
+#grouped probe query defines the Hydro Years with changed records and only those Hydro Years are queried.  Called when the Site Statistics are
+#fetched (see 'fetchSiteStatistics') - the records appended since the last fetch change the inDB file and are picked up by the next fetch.
+#Returns the Site Statistics Cache and the list of refreshed Hydro Years - None when the database query failed
+def refreshStatisticsHistory():
+    cachePath = statisticsCachePath()
+    cache = readStatisticsCache(cachePath)
+    dbState = dbFileState()
+    if cache is not None and dbState is not None and cache['state']['dbFile'] == dbState:
+        return cache, []
+
+    sqlValues = {'table': phosphorusTable, 'field': outlierField, 'length': getSession(inDB).backend.lengthFunction}
+    outVal = connect_to_AcessDB(sa.text(statisticsSQL['probe'].format(**sqlValues)), inDB)
+    if outVal[0].lower() != "success function":
+        return None, []
+    probes = {str(int(probeRow[0])): [str(value) for value in probeRow[1:]] for probeRow in outVal[1].itertuples(index=False, name=None)
+              if pd.notna(probeRow[0])}
+
+    priorState = {'probes': {}, 'statistics': {}} if cache is None else cache['state']
+    refreshYears = [yearName for yearName in probes if priorState['probes'].get(yearName) != probes[yearName]]
+    history = {} if cache is None else {yearName: historyDf for yearName, historyDf in cache['history'].items() if yearName in probes}
+    if len(refreshYears) > 0:
+        historyQuery = sa.text(statisticsSQL['history'].format(**sqlValues))
+        outVal = connect_to_AcessDB([historyQuery.bindparams(hydroYear=int(yearName)) for yearName in refreshYears], inDB)
+        if outVal[0].lower() != "success function":
+            return None, []
+
+        #Numeric values only (Text Code Flags e.g. '<MDL' are not part of the history)
+        for yearName, historyDf in zip(refreshYears, outVal[1]):
+            historyDf['HistoryValue'] = pd.to_numeric(historyDf['HistoryValue'], errors='coerce').astype("float64")
+            historyDf['Visit_Type'] = historyDf['Visit_Type'].fillna("")
+            history[yearName] = historyDf.dropna(subset=['HistoryValue', 'Site_ID']).reset_index(drop=True)
+
+    #Statistics of Hydro Years with changed history are recomputed (see 'fetchSiteStatistics')
+    statistics = {} if cache is None else cache['statistics']
+    cache = {'state': {'inDB': os.path.abspath(inDB), 'dbFile': dbFileState(), 'probes': probes,
+                       'statistics': {yearName: statisticsHash for yearName, statisticsHash in priorState['statistics'].items() if yearName in statistics}},
+             'history': history, 'statistics': statistics}
+    writeStatisticsCache(cachePath, cache, refreshYears)
+
+    return cache, refreshYears
+
+
+#Site Statistics index of the Hydro Year - count, median, MAD (median absolute deviation) and percentiles per Site_ID/Visit_Type of the
+#'outlierField' values of the prior Hydro Years.  The index is kept in the Site Statistics Cache and rebuilt only when the history of a prior
+#Hydro Year changed.
+#inYear - Field Year being processed
+#Returns "success function" and the Site Statistics (indexed on Site_ID/Visit_Type)
+def fetchSiteStatistics(inYear):
+    try:
+        cache, refreshYears = refreshStatisticsHistory()
+        if cache is None:
+            return "Failed function - 'fetchSiteStatistics'"
+
+        priorYears = sorted(yearName for yearName in cache['history'] if int(yearName) < int(inYear))
+        statisticsHash = hashlib.sha256(json.dumps([[yearName, cache['state']['probes'][yearName]] for yearName in priorYears]).encode("utf-8")).hexdigest()
+        yearName = str(int(inYear))
+        source = "cache"
+        if cache['state']['statistics'].get(yearName) != statisticsHash:
+            cache['statistics'][yearName] = computeSiteStatistics([cache['history'][priorYear].assign(Hydrologic_Year=int(priorYear)) for priorYear in priorYears])
+            cache['state']['statistics'][yearName] = statisticsHash
+            writeStatisticsCache(statisticsCachePath(), cache, statisticsYears=[yearName])
+            source = "history"
+
+        siteStatistics = cache['statistics'][yearName]
+        messageTime = timeFun()
+        scriptMsg = "Success:  fetchSiteStatistics - Site_ID/Visit_Type: " + str(len(siteStatistics)) + " - Prior Hydro Years: " + str(len(priorYears)) \
+                    + " - Refreshed: " + ", ".join(refreshYears) + " - " + messageTime
+        print(scriptMsg)
+        logMessage(scriptMsg, "INFO", function="fetchSiteStatistics", hydroYear=inYear, source=source, refreshed=refreshYears, groups=len(siteStatistics))
+
+        return "success function", siteStatistics
+
+    except:
+        messageTime = timeFun()
+        print("Error on fetchSiteStatistics Function - " + str(inYear) + " - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'fetchSiteStatistics'"
+
+
+#Compute the Site Statistics from the history dataframes (Site_ID, Visit_Type, HistoryValue and Hydrologic_Year)
+#Returns dataframe indexed on Site_ID/Visit_Type - Count, Median, MAD, P05, P25, P75, P95, First_Year and Last_Year
+def computeSiteStatistics(historyList):
+    percentileFields = ["P" + str(percentile).zfill(2) for percentile in statisticsPercentiles]
+    historyList = [historyDf for historyDf in historyList if len(historyDf) > 0]
+    if len(historyList) == 0:
+        return pd.DataFrame(columns=['Count', 'Median', 'MAD'] + percentileFields + ['First_Year', 'Last_Year'],
+                            index=pd.MultiIndex.from_arrays([[], []], names=['Site_ID', 'Visit_Type']))
+
+    historyDf = pd.concat(historyList, ignore_index=True)
+    groupKeys = [historyDf['Site_ID'], historyDf['Visit_Type']]
+    grouped = historyDf.groupby(groupKeys)['HistoryValue']
+
+    siteStatistics = grouped.agg(Count='count', Median='median')
+    siteStatistics['MAD'] = (historyDf['HistoryValue'] - grouped.transform('median')).abs().groupby(groupKeys).median()
+    percentileDf = grouped.quantile([percentile / 100 for percentile in statisticsPercentiles]).unstack()
+    percentileDf.columns = percentileFields
+    siteStatistics = siteStatistics.join(percentileDf)
+    siteStatistics = siteStatistics.join(historyDf.groupby(groupKeys)['Hydrologic_Year'].agg(First_Year='min', Last_Year='max'))
+
+    return siteStatistics
+
+
+#Flag the 'outlierField' values outside the history of the Site_ID/Visit_Type - robust z-score (0.6745 * |value - median| / MAD) above
+#'outlierThreshold' with at least 'outlierMinCount' prior values.  One vectorized lookup of the Site Statistics index (see 'fetchSiteStatistics'),
+#the flagged records are noted in the 'Notes' field (updated in place) and exported to the Outlier Review .csv file.
+#df_DatasetToDefine - Defined dataset (Lab fields defined - see 'defineLabFields')
+#inYear - Field Year being processed
+#outReviewCSV - Export .csv file of the flagged records
+#siteStatistics - Optional Site Statistics from 'fetchSiteStatistics' (default fetched for 'inYear' - fetched once per Target in Streaming Mode)
+#stream - Optional Stream State of the chunk (Streaming Mode - see 'StreamState')
+#Returns "success function" and the count of flagged records
+def flagOutliers(df_DatasetToDefine, inYear, outReviewCSV, siteStatistics=None, stream=None):
+    try:
+        valueFields = [eddField for eddField, tableField in valueFieldMap.items() if tableField == outlierField]
+        if len(valueFields) == 0 or len(df_DatasetToDefine) == 0:
+            return "success function", 0
+
+        if siteStatistics is None:
+            outVal = fetchSiteStatistics(inYear)
+            if outVal[0].lower() != "success function":
+                return "Failed function - 'flagOutliers'"
+            siteStatistics = outVal[1]
+        if len(siteStatistics) == 0:
+            return "success function", 0
+
+        values = pd.to_numeric(pd.Series(df_DatasetToDefine[valueFields[0]].to_numpy()), errors='coerce').to_numpy(dtype="float64")
+        lookupKeys = pd.MultiIndex.from_arrays([df_DatasetToDefine['Site_ID'].to_numpy(dtype=object),
+                                                pd.Series(df_DatasetToDefine['Visit_Type'].to_numpy(dtype=object)).fillna("").to_numpy(dtype=object)])
+        positions = siteStatistics.index.get_indexer(lookupKeys)
+        statisticsDf = siteStatistics.iloc[np.maximum(positions, 0)].reset_index()
+
+        #Robust z-score - a MAD of 0 (i.e. most prior values equal) flags any value different from the median
+        median = statisticsDf['Median'].to_numpy(dtype="float64")
+        mad = statisticsDf['MAD'].to_numpy(dtype="float64")
+        with np.errstate(divide='ignore', invalid='ignore'):
+            robustZ = np.where(mad > 0, 0.6745 * np.abs(values - median) / mad, np.where(values == median, 0.0, np.inf))
+        outlierMask = (positions >= 0) & (statisticsDf['Count'].to_numpy() >= outlierMinCount) & ~np.isnan(values) & (robustZ > outlierThreshold)
+        outlierCount = int(outlierMask.sum())
+        if outlierCount == 0:
+            return "success function", 0
+
+        reviewDf = statisticsDf[outlierMask].copy()
+        reviewDf.insert(0, 'EDD Record', eddRecordNumbers(len(outlierMask), stream)[outlierMask])
+        reviewDf.insert(1, 'Site ID', df_DatasetToDefine.index[outlierMask])
+        reviewDf.insert(2, 'Event_ID', df_DatasetToDefine['Event_ID'].to_numpy()[outlierMask])
+        reviewDf.insert(5, outlierField, values[outlierMask])
+        reviewDf.insert(6, 'Robust Z', np.round(robustZ[outlierMask], 2))
+        exportReport(reviewDf, outReviewCSV, stream)
+
+        #Note the flagged records - appended to the existing note
+        noteText = (outlierField + " outlier - robust z " + reviewDf['Robust Z'].astype(str) + " - HY" + reviewDf['First_Year'].astype(str) + "-"
+                    + reviewDf['Last_Year'].astype(str) + " median " + reviewDf['Median'].round(4).astype(str) + ", MAD " + reviewDf['MAD'].round(4).astype(str)
+                    + ", n " + reviewDf['Count'].astype(str)).to_numpy(dtype=object)
+        notes = df_DatasetToDefine['Notes'].to_numpy(dtype=object, copy=True)
+        priorNotes = notes[outlierMask]
+        notes[outlierMask] = np.where(pd.isnull(priorNotes), noteText, priorNotes.astype(str) + "; " + noteText)
+        df_DatasetToDefine['Notes'] = notes
+
+        messageTime = timeFun()
+        scriptMsg = "WARNING - flagOutliers - " + str(outlierCount) + " - " + outlierField + " values outside the Site_ID/Visit_Type history (robust z > " \
+                    + str(outlierThreshold) + ") - noted in 'Notes' - Exported .csv file: " + outReviewCSV + " - " + messageTime
+        print(scriptMsg)
+        logMessage(scriptMsg, "WARNING", function="flagOutliers", records=outlierCount, outFile=outReviewCSV)
+
+        return "success function", outlierCount
+
+    except:
+        messageTime = timeFun()
+        print("Error on flagOutliers Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'flagOutliers'"
+
+
 #Confirm QAQC have been entered
 def confirmDef(root):
+    import tkinter.messagebox
+    from tkinter.messagebox import askyesno
 
     answer = askyesno(title="Confirm Apriori QAQC and Field Duplicate info defined", message="Have the the QAQC and Field Duplicate Records been defined in the 'Site_ID_QCExtra' field in the table 'tbl_Event'?")
     if answer == False:
@@ -660,6 +2611,8 @@ def confirmDef(root):
 
 #Confirm Lab Duplicates have been entered
 def confirmDefLabDup(root):
+    import tkinter.messagebox
+    from tkinter.messagebox import askyesno
 
     answer = askyesno(title="Confirm Lab Duplicate info defined", message="Have the the Lab Duplicates Records been defined in the 'tbl_LabDuplicate' table?")
     if answer == False:
@@ -673,111 +2626,1645 @@ def confirmDefLabDup(root):
 
 
 #Append records in the 'df_DatasetToDefine' dataframe to table 'tbl_Lab_Data_TotalPhosphorus'
-#Using sqlAlchemyh Access to append dataframe to table - schema must match. Define the index on dataframe with the index in the Access DB table (i.e. TotalPhosphorus_Data_ID)
-def appendRecords(inDF):
+#Using sqlAlchemyh Access to bulk insert (i.e. executemany) the dataframe to table in batches of 'appendChunkSize' records - schema must match.
+#Each batch is appended in an explicit transaction on the shared 'dbSession' connection and rolled back on failure (i.e. no partial batches in 'tbl_Lab_Data_TotalPhosphorus')
+#Loads are idempotent - 'TotalPhosphorus_Data_ID' is a deterministic key (see 'recordKeys') and records already in the table are skipped.
+#Records with an Event_ID/DuplicateRecord already in the table with different values are conflicts - handled per 'conflictAction'.
+#inDF - Defined dataset to be appended, or the final records of a Load Plan (see 'readLoadPlan') when 'planned' is True
+#outAppendedCSV - Export .csv file of the appended records (default 'DataFrameAppended.csv' in the workspace)
+#planned - True when 'inDF' holds the final records (i.e. from 'defineAppendRecords') - the index is the Load Plan position of each record
+#journal - Optional Load Journal (see 'LoadJournal') - the Load Plan positions of each committed batch are recorded
+#inYear - Hydro Year of the Events loaded - the load is reconciled for the Hydro Year (default 'hydroYear' - see 'reconcileRecords')
+#stream - Optional Stream State of the chunk being appended (Streaming Mode - see 'StreamState')
+#Returns "success function" and dictionary of the inserted, skipped, duplicate (in the EDD) and conflicting record counts (and the Event_IDs with reconciliation 'mismatches')
+def appendRecords(inDF, outAppendedCSV=None, planned=False, journal=None, inYear=None, stream=None):
     try:
-        #Connect to Access DB
+        #Shared Periphyton DB Session - same connection used for the metadata queries
+        session = getSession(inDB)
+
+        #Load Plan records - 'LoadAction' and the index are defined on a copy (the Load Plan frame of the caller is not changed)
+        df_ToAppendFinal = inDF.copy(deep=False) if planned else defineAppendRecords(inDF)
+
+        #Bulk existence check - records in the table for the Event_IDs being loaded
+        with stageSpan("existenceCheck", rowsIn=len(df_ToAppendFinal)) as span:
+            existingDf = fetchExistingRecords(session, df_ToAppendFinal['Event_ID'].dropna().unique().tolist())
+            slotKeys = None if stream is None else stream.slotKeys
+            existingDf, existingAllDf = streamSlotRecords(existingDf, slotKeys), existingDf
+            df_ToAppendFinal['LoadAction'] = classifyRecords(df_ToAppendFinal, existingAllDf, existingDf, slotKeys).values
+            span['rowsOut'] = len(existingAllDf)
+
+        #Streaming Mode - keys of the records appended to the slots matched by more than one EDD record (see 'streamSlotRecords')
+        if stream is not None and len(stream.multipleSlots) > 0:
+            inSlot = df_ToAppendFinal['Event_ID'].astype(str) + "|" + df_ToAppendFinal['DuplicateRecord'].map(normalizeKeyValue)
+            slotMask = inSlot.isin(stream.multipleSlots) & df_ToAppendFinal['LoadAction'].isin(["Insert", "Replace"])
+            stream.slotKeys.update(df_ToAppendFinal.loc[slotMask, recordKeyField])
+
+        #Load Plan positions (i.e. index) of the records to be inserted - recorded in the Load Journal as each batch is committed
+        recordPositions = df_ToAppendFinal.index[df_ToAppendFinal['LoadAction'].isin(["Insert", "Replace"])].to_numpy()
+
+        # Set Index field to the 'TotalPhosphorus_Data_ID' field (i.e. 'recordKeyField') - exported with the .csv of the appended records
+        df_ToAppendFinal.set_index(recordKeyField, inplace=True)
+
+        outFull = outAppendedCSV
+        if outFull is None:
+            outFull = os.path.join(workspace, "DataFrameAppended.csv")
+        #Export Data Frame that has been imported - 'LoadAction' defines the records Inserted, Skipped (already loaded), Duplicate in EDD or Conflict.
+        #In Streaming Mode the records of the chunks are added to the file of the first chunk
+        if stream is not None and outFull in stream.appendedFiles:
+            df_ToAppendFinal.to_csv(outFull, index=True, mode="a", header=False)
+        else:
+            df_ToAppendFinal.to_csv(outFull, index=True)
+            if stream is not None:
+                stream.appendedFiles.add(outFull)
+
+        loadSummary = {'inserted': int(df_ToAppendFinal['LoadAction'].isin(["Insert", "Replace"]).sum()),
+                       'skipped': int((df_ToAppendFinal['LoadAction'] == "Skip").sum()),
+                       'duplicates': int((df_ToAppendFinal['LoadAction'] == "Duplicate in EDD").sum()),
+                       'conflicting': int(df_ToAppendFinal['LoadAction'].isin(["Conflict", "Replace"]).sum())}
+
+        #Export the Conflict records (new and existing values)
+        if loadSummary['conflicting'] > 0:
+            exportConflicts(df_ToAppendFinal, existingDf, stream)
+
+        #Define the Insert statement and the record parameters (Null/NaN values as None) for the executemany batches
+        df_ToInsert = df_ToAppendFinal[df_ToAppendFinal['LoadAction'].isin(["Insert", "Replace"])].drop(columns=['LoadAction']).reset_index(drop=False)
+        fieldList = list(df_ToInsert.columns)
+        insertStatement = sa.table(phosphorusTable, *[sa.column(field) for field in fieldList]).insert()
+        recordList = df_ToInsert.astype(object).where(df_ToInsert.notna(), None).to_dict(orient='records')
+        eventIDList = df_ToInsert['Event_ID'].tolist()
+
+        #Existing records to be deleted (conflictAction 'replace') - by Event_ID/DuplicateRecord of the records in each batch
+        replaceIDs = {}
+        if len(existingDf) > 0 and (df_ToInsert.shape[0] > 0):
+            existingSlot = existingDf['Event_ID'].astype(str) + "|" + existingDf['DuplicateRecord'].map(normalizeKeyValue)
+            for slotValue, existingID in zip(existingSlot, existingDf[recordKeyField]):
+                replaceIDs.setdefault(slotValue, []).append(existingID)
+            insertSlot = (df_ToInsert['Event_ID'].astype(str) + "|" + df_ToInsert['DuplicateRecord'].map(normalizeKeyValue)).tolist()
+        del (df_ToInsert)
+        replacedIDs = []
+        if conflictAction == "replace" and len(replaceIDs) > 0:
+            replacedIDs = [existingID for slotValue in set(insertSlot) for existingID in replaceIDs.get(slotValue, [])]
+
+        keyColumn = sa.column(recordKeyField)
+        deleteTable = sa.table(phosphorusTable, keyColumn)
+
+        #Create iteration range for the batches to be appended
+        lenRows = len(recordList)
+        chunkRange = range(0, lenRows, appendChunkSize)
+
+        #Staging Append - the records are promoted to the table in one set-based INSERT ... SELECT (no direct append batches)
+        if appendMode == "staging" and lenRows > 0:
+            if stagingAppend(session, fieldList, recordList, replacedIDs) != "success function":
+                return "failed function"
+            if journal is not None:
+                journal.batchCommitted(int(recordPositions[0]), int(recordPositions[-1]), lenRows)
+            chunkRange = range(0)
+
+        for chunkStart in chunkRange:
+            chunkEnd = min(chunkStart + appendChunkSize, lenRows)
+            try:
+                #Transaction is committed on exit, rolled back if the batch fails
+                with stageSpan("appendBatch", rowsIn=chunkEnd - chunkStart) as span, session.transaction() as trans:
+                    if conflictAction == "replace" and len(replaceIDs) > 0:
+                        deleteIDs = [existingID for slotValue in set(insertSlot[chunkStart:chunkEnd]) for existingID in replaceIDs.pop(slotValue, [])]
+                        if len(deleteIDs) > 0:
+                            trans.connection.execute(deleteTable.delete().where(keyColumn.in_(deleteIDs)))
+                    trans.connection.execute(insertStatement, recordList[chunkStart:chunkEnd])
+                    span['rowsOut'] = chunkEnd - chunkStart
+
+                #Committed batch recorded in the Load Journal (a batch committed but not journaled is skipped as already loaded on resume)
+                if journal is not None:
+                    journal.batchCommitted(int(recordPositions[chunkStart]), int(recordPositions[chunkEnd - 1]), chunkEnd - chunkStart)
 
-        connStr = (r"DRIVER={Microsoft Access Driver (*.mdb, *.accdb)};DBQ=" + inDB + ";ExtendedAnsiSQL=1;")  # sqlAlchemy-access connection
-        cnxn = sa.engine.URL.create("access+pyodbc", query={"odbc_connect": connStr})
-        engine = sa.create_engine(cnxn)
+                messageTime = timeFun()
+                scriptMsg = "Successfully Appended records " + str(chunkStart + 1) + " to " + str(chunkEnd) + " of " + str(lenRows) + " - Event_ID - "\
+                            + str(eventIDList[chunkStart]) + " to " + str(eventIDList[chunkEnd - 1]) + " - " + messageTime
+                print(scriptMsg)
+                logMessage(scriptMsg, "INFO", function="appendRecords", recordStart=chunkStart + 1, recordEnd=chunkEnd, records=lenRows)
+
+            except:
+
+                messageTime = timeFun()
+                scriptMsg = "WARNING Failed to Append records " + str(chunkStart + 1) + " to " + str(chunkEnd) + " - Event_ID - " + str(eventIDList[chunkStart])\
+                            + " to " + str(eventIDList[chunkEnd - 1]) + " - batch rolled back - " + str(chunkStart) + " records previously appended - " + messageTime
+                if journal is not None:
+                    scriptMsg = scriptMsg + " - continue the load with --resume " + journal.journalFile
+                print(scriptMsg)
+                traceback.print_exc(file=sys.stdout)
+                logMessage(scriptMsg, "WARNING", function="appendRecords", recordStart=chunkStart + 1, recordEnd=chunkEnd, records=lenRows,
+                           traceback=traceback.format_exc())
+                flushRunLogger()
+                return "failed function"
+
+        #Reconcile the load - one aggregate query of the table for the Event_IDs loaded compared to the records expected in the table
+        #(the existing records not replaced and the records inserted).  In Streaming Mode the expected values of the chunk replace those of the
+        #earlier chunks for the same Event_IDs and the Target is reconciled once after its last chunk (see 'streamMain')
+        if reconcileLoad and len(df_ToAppendFinal) > 0:
+            reconcileDf = reconcileExpected(pd.concat([existingAllDf[~existingAllDf[recordKeyField].isin(replacedIDs)][recordKeyFields()],
+                                                       df_ToAppendFinal[df_ToAppendFinal['LoadAction'].isin(["Insert", "Replace"])][recordKeyFields()]], ignore_index=True))
+            if stream is not None:
+                stream.addReconcile(reconcileDf)
+            else:
+                with stageSpan("reconcileRecords", rowsIn=len(reconcileDf)) as span:
+                    outVal = reconcileRecords(session, reconcileDf, hydroYear if inYear is None else inYear)
+                    span['rowsOut'] = outVal[1] if outVal[0].lower() == "success function" else None
+                if outVal[0].lower() != "success function":
+                    logMessage("WARNING - Load not reconciled - " + timeFun(), "WARNING", function="appendRecords")
+                else:
+                    loadSummary['mismatches'] = outVal[1]
+            del (reconcileDf)
+
+        messageTime = timeFun()
+        scriptMsg = "Load Summary - Inserted: " + str(loadSummary['inserted']) + " - Skipped (already loaded): " + str(loadSummary['skipped']) \
+                    + " - Duplicates in EDD: " + str(loadSummary['duplicates']) \
+                    + " - Conflicting: " + str(loadSummary['conflicting']) + " (conflictAction: " + conflictAction + ")" \
+                    + ("" if 'mismatches' not in loadSummary else " - Reconciliation Mismatches (Event_IDs): " + str(loadSummary['mismatches'])) + " - " + messageTime
+        print(scriptMsg)
+        logMessage(scriptMsg, "WARNING" if loadSummary['conflicting'] > 0 or loadSummary.get('mismatches', 0) > 0 else "INFO", function="appendRecords",
+                   conflictAction=conflictAction, **loadSummary)
+
+        return "success function", loadSummary
+
+
+    except:
+        messageTime = timeFun()
+        print("Error SFCN_TP_ETL.py  - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'appendRecords'"
+
+
+#Define the final records to be appended - the 'phosphorusTable' fields with the 'TotalPhosphorus_Data_ID' (i.e. 'recordKeyField') key
+#inDF - Defined dataset (Lab fields defined - see 'defineLabFields')
+#Returns the dataframe of the final records (default index)
+def defineAppendRecords(inDF):
+    #Define Final Data Frame with Matching Schema for table - the field selection is a new frame (a shallow copy so 'inDF' is not changed
+    #by the updates below - the values are only copied when changed with Copy-on-Write, see 'enableCopyOnWrite')
+    df_ToAppendFinal = inDF[['Event_ID'] + list(labFields()) + list(valueFieldMap) + ['DuplicateRecord','Notes']].copy(deep=False)
+
+    #Rename Fields to match DB Schema (i.e. 'valueFieldMap')
+    df_ToAppendFinal.rename(columns=valueFieldMap,inplace=True)
+
+
+    #Round Total Phosphorus field to 2 decimal - have made the native field string to accommodate Text Code Flags
+    #df_ToAppendFinal.round({'Total_Phosphorus': 2})
+
+    #Add Index Field - Deterministic Guid (Event_ID, DuplicateRecord and measured values) so reloaded records are identified in table 'tbl_Lab_Data_TotalPhosphorus'
+    df_ToAppendFinal[recordKeyField] = recordKeys(df_ToAppendFinal).values
+
+    #Reset the index
+    df_ToAppendFinal.reset_index(drop=True, inplace=True)
+
+    return df_ToAppendFinal
+
+
+#Staging Append - bulk insert the records to the scratch staging table (i.e. 'phosphorusTable' + 'stagingTableSuffix'), validate the staged
+#records with SQL and promote them to 'phosphorusTable' with one set-based INSERT ... SELECT in a single transaction - an EDD is loaded in
+#full or not at all.  The staging table is dropped afterward.
+#session - Shared Periphyton DB Session
+#fieldList - Fields of the records (i.e. 'phosphorusTable' fields)
+#recordList - Records to be appended (dictionaries of field values)
+#deleteIDs - 'TotalPhosphorus_Data_ID' (i.e. 'recordKeyField') of the existing records deleted in the promote transaction (conflictAction 'replace')
+#Returns "success function" or "failed function"
+def stagingAppend(session, fieldList, recordList, deleteIDs):
+    #Staging table with the field types of 'phosphorusTable' (no keys/indexes)
+    targetTable = sa.Table(phosphorusTable, sa.MetaData(), autoload_with=session.connect())
+    stagingTable = sa.Table(phosphorusTable + stagingTableSuffix, sa.MetaData(), *[sa.Column(field, targetTable.c[field].type) for field in fieldList])
+    keyField = recordKeyField
+    lenRows = len(recordList)
+
+    try:
+        with session.transaction() as trans:
+            stagingTable.drop(trans.connection, checkfirst=True)
+            stagingTable.create(trans.connection)
+
+        #Bulk insert to the staging table - a failed batch leaves 'phosphorusTable' untouched
+        for chunkStart in range(0, lenRows, appendChunkSize):
+            chunkEnd = min(chunkStart + appendChunkSize, lenRows)
+            with stageSpan("stagingBatch", rowsIn=chunkEnd - chunkStart) as span, session.transaction() as trans:
+                trans.connection.execute(stagingTable.insert(), recordList[chunkStart:chunkEnd])
+                span['rowsOut'] = chunkEnd - chunkStart
+
+        #Validate the staged records - all records staged with an Event_ID, none already in 'phosphorusTable' and all Events defined in 'tbl_Event'
+        with stageSpan("stagingValidate", rowsIn=lenRows) as span:
+            eventTable = sa.table("tbl_Event", sa.column('Event_ID'))
+            stagedDf = session.readQuery(sa.select(sa.func.count().label('StagedRecords'), sa.func.count(stagingTable.c.Event_ID).label('StagedEventIDs'))
+                                         .select_from(stagingTable))
+            loadedDf = session.readQuery(sa.select(sa.func.count().label('LoadedRecords'))
+                                         .select_from(stagingTable.join(targetTable, stagingTable.c[keyField] == targetTable.c[keyField])))
+            undefinedDf = session.readQuery(sa.select(sa.func.count().label('UndefinedEvents'))
+                                            .select_from(stagingTable.outerjoin(eventTable, stagingTable.c.Event_ID == eventTable.c.Event_ID))
+                                            .where(eventTable.c.Event_ID.is_(None)))
+            validation = {'stagedRecords': int(stagedDf.iloc[0, 0]), 'stagedEventIDs': int(stagedDf.iloc[0, 1]),
+                          'loadedRecords': int(loadedDf.iloc[0, 0]), 'undefinedEvents': int(undefinedDf.iloc[0, 0])}
+            span.update(validation)
+
+        if validation['stagedRecords'] != lenRows or validation['stagedEventIDs'] != lenRows or validation['loadedRecords'] > 0 or validation['undefinedEvents'] > 0:
+            messageTime = timeFun()
+            scriptMsg = "WARNING - Staged records failed validation - not promoted to '" + phosphorusTable + "' - Records: " + str(lenRows) \
+                        + " - Staged: " + str(validation['stagedRecords']) + " - With Event_ID: " + str(validation['stagedEventIDs']) \
+                        + " - Already Loaded: " + str(validation['loadedRecords']) + " - Undefined Events: " + str(validation['undefinedEvents']) + " - " + messageTime
+            print(scriptMsg)
+            logMessage(scriptMsg, "WARNING", function="stagingAppend", records=lenRows, **validation)
+            return "failed function"
+
+        #Promote - one set-based INSERT ... SELECT (and the conflictAction 'replace' deletes) in a single transaction
+        with stageSpan("stagingPromote", rowsIn=lenRows) as span, session.transaction() as trans:
+            for chunkStart in range(0, len(deleteIDs), existenceCheckChunkSize):
+                trans.connection.execute(targetTable.delete().where(targetTable.c[keyField].in_(deleteIDs[chunkStart:chunkStart + existenceCheckChunkSize])))
+            trans.connection.execute(targetTable.insert().from_select(fieldList, sa.select(*[stagingTable.c[field] for field in fieldList])))
+            span['rowsOut'] = lenRows
+
+        messageTime = timeFun()
+        scriptMsg = "Successfully Appended records 1 to " + str(lenRows) + " of " + str(lenRows) + " - promoted from staging table '" + stagingTable.name \
+                    + "' - Replaced: " + str(len(deleteIDs)) + " - " + messageTime
+        print(scriptMsg)
+        logMessage(scriptMsg, "INFO", function="stagingAppend", records=lenRows, replaced=len(deleteIDs))
+
+        return "success function"
+
+    except:
+        messageTime = timeFun()
+        scriptMsg = "WARNING Failed to Append records via staging table '" + stagingTable.name + "' - '" + phosphorusTable + "' not changed - " + messageTime
+        print(scriptMsg)
+        traceback.print_exc(file=sys.stdout)
+        logMessage(scriptMsg, "WARNING", function="stagingAppend", records=lenRows, traceback=traceback.format_exc())
+        flushRunLogger()
+        return "failed function"
+
+    finally:
+        try:
+            with session.transaction() as trans:
+                stagingTable.drop(trans.connection, checkfirst=True)
+        except:
+            messageTime = timeFun()
+            print("WARNING - Unable to drop staging table: " + stagingTable.name + " - " + messageTime)
+
+
+#Normalized text of a value used in the deterministic record key - numbers (including numeric text e.g. 'TP µg/g' stored as text) are
+#formatted to 6 decimals so the EDD and database values compare equal, Null values are blank and text is trimmed/lower case
+def normalizeKeyValue(inValue):
+    if inValue is None or (isinstance(inValue, float) and inValue != inValue):
+        return ""
+    if isinstance(inValue, bool):
+        return "yes" if inValue else ""
+    try:
+        return format(round(float(inValue), 6), ".6f")
+    except (TypeError, ValueError):
+        return str(inValue).strip().lower()
+
+
+#Deterministic record key (Guid) for the 'TotalPhosphorus_Data_ID' field - derived from the Event_ID, DuplicateRecord and the measured values
+#inDF - Records with the database field names (i.e. 'recordKeyFields' - 'Event_ID', 'DuplicateRecord', 'Bottle_Weight_g', 'Plant_Weight_g', 'Sample_Wet_Weight_g', 'Total_Phosphorus')
+#Returns Series of uuid.UUID values
+def recordKeys(inDF):
+    keyText = inDF['Event_ID'].astype(str).str.strip()
+    for field in recordKeyFields()[1:]:
+        keyText = keyText + "|" + inDF[field].map(normalizeKeyValue)
+
+    return keyText.map(lambda keyValue: uuid.uuid5(recordKeyNamespace, keyValue))
+
+
+#Records in table 'tbl_Lab_Data_TotalPhosphorus' for the Event_IDs - one query per batch of 'existenceCheckChunkSize' Event_IDs (bound parameters)
+#session - Shared Periphyton DB Session
+#eventIDList - Event_IDs being loaded
+def fetchExistingRecords(session, eventIDList):
+    fieldList = [recordKeyField] + recordKeyFields()
+    existingTable = sa.table(phosphorusTable, *[sa.column(field) for field in fieldList])
+    existingList = []
+    for chunkStart in range(0, len(eventIDList), existenceCheckChunkSize):
+        selectStatement = sa.select(*existingTable.c).where(existingTable.c.Event_ID.in_(eventIDList[chunkStart:chunkStart + existenceCheckChunkSize]))
+        existingList.append(session.readQuery(selectStatement))
+
+    if len(existingList) == 0:
+        return pd.DataFrame(columns=fieldList)
+
+    return pd.concat(existingList, ignore_index=True)
+
+
+#Define the Load Action for the records to be appended - Insert (new), Skip (same key already in the table), Duplicate in EDD (same key as an
+#earlier record of the EDD - not appended twice), Conflict (Event_ID/DuplicateRecord in the table with different values - Replace when
+#'conflictAction' is 'replace' and Insert when 'insert')
+#inDF - Records to be appended with the 'TotalPhosphorus_Data_ID' key
+#existingDf - Records in the table from 'fetchExistingRecords'
+#slotDf - Optional existing records of the Event_ID/DuplicateRecord conflicts (default 'existingDf' - see 'streamSlotRecords')
+#eddKeys - Optional keys appended from the EDD by earlier chunks (Streaming Mode) - in the table, but Duplicate in EDD rather than Skip
+def classifyRecords(inDF, existingDf, slotDf=None, eddKeys=None):
+    if slotDf is None:
+        slotDf = existingDf
+    existingKeys = set(recordKeys(existingDf)) if len(existingDf) > 0 else set()
+    existingSlots = set(slotDf['Event_ID'].astype(str) + "|" + slotDf['DuplicateRecord'].map(normalizeKeyValue)) if len(slotDf) > 0 else set()
+
+    inSlot = inDF['Event_ID'].astype(str) + "|" + inDF['DuplicateRecord'].map(normalizeKeyValue)
+    conflictValue = {"skip": "Conflict", "replace": "Replace", "insert": "Insert"}[conflictAction]
+
+    loadAction = pd.Series("Insert", index=inDF.index)
+    loadAction[inSlot.isin(existingSlots)] = conflictValue
+    loadAction[inDF[recordKeyField].duplicated()] = "Duplicate in EDD"
+    loadAction[inDF[recordKeyField].isin(existingKeys)] = "Skip"
+    if eddKeys is not None and len(eddKeys) > 0:
+        loadAction[inDF[recordKeyField].isin(eddKeys)] = "Duplicate in EDD"
+
+    return loadAction
+
+
+#Existing records of the Event_ID/DuplicateRecord conflicts - in Streaming Mode the records appended by the earlier chunks to a slot matched by more
+#than one EDD record are not conflicts (as when the EDD is appended in one load - the records of the slot are kept and reported by 'resolveEvents')
+#existingDf - Records in the table from 'fetchExistingRecords'
+#slotKeys - Keys appended to the slots by the earlier chunks (see 'StreamState' - None when the EDD is appended in one load)
+def streamSlotRecords(existingDf, slotKeys=None):
+    if slotKeys is None or len(slotKeys) == 0 or len(existingDf) == 0:
+        return existingDf
+
+    return existingDf[~recordKeys(existingDf).isin(slotKeys).to_numpy()].reset_index(drop=True)
+
+
+#Export the Conflict records - new values from the EDD and the existing values in the table for the same Event_ID/DuplicateRecord
+#stream - Optional Stream State of the chunk (Streaming Mode - see 'StreamState')
+def exportConflicts(df_ToAppendFinal, existingDf, stream=None):
+    conflictDf = df_ToAppendFinal[df_ToAppendFinal['LoadAction'].isin(["Conflict", "Replace"])].reset_index(drop=False)
+    conflictDf['Slot'] = conflictDf['Event_ID'].astype(str) + "|" + conflictDf['DuplicateRecord'].map(normalizeKeyValue)
+    existingDf = existingDf.copy()
+    existingDf['Slot'] = existingDf['Event_ID'].astype(str) + "|" + existingDf['DuplicateRecord'].map(normalizeKeyValue)
+
+    outDf = pd.merge(conflictDf, existingDf.drop(columns=['Event_ID', 'DuplicateRecord']), how='left', on='Slot', suffixes=("", "_Existing")).drop(columns=['Slot'])
+    outFull = os.path.join(workspace, "RecordConflicts_" + dateString + ".csv")
+    exportReport(outDf, outFull, stream)
+
+    scriptMsg = "WARNING - " + str(len(conflictDf)) + " - Records conflict with existing records in '" + phosphorusTable + "' - Exported .csv file: " + outFull
+    print(scriptMsg)
+    logMessage(scriptMsg, "WARNING", function="appendRecords", records=len(conflictDf), outFile=outFull)
+
+
+#Reconciliation query text - the records, Duplicate Records and the sums of the weight fields (see 'reconcileFields') per Event_ID in the
+#'phosphorusTable' for the Hydro Year.  One grouped statement (one round trip) - the Hydro Year is a bound parameter (:hydroYear) and the rows are
+#restricted to the Event_IDs loaded client side (see 'reconcileRecords')
+reconcileSQL = ("SELECT {table}.Event_ID, Count(*) AS Records, Count({table}.DuplicateRecord) AS DuplicateRecords{sumFields}"
+                " FROM ({table} INNER JOIN tbl_Event ON tbl_Event.Event_ID = {table}.Event_ID)"
+                " INNER JOIN tbl_Event_Group ON tbl_Event_Group.Event_Group_ID = tbl_Event.Event_Group_ID"
+                " WHERE tbl_Event_Group.Hydrologic_Year = :hydroYear GROUP BY {table}.Event_ID")
+
+
+#Weight fields (table fields - see 'valueFieldMap') summed by the load reconciliation - the 'wetWeightFields' loaded
+def reconcileFields():
+    return [valueFieldMap[fieldName] for fieldName in (wetWeightFields or []) if fieldName in valueFieldMap]
+
+
+#Values expected in 'phosphorusTable' per Event_ID - the record count, the Duplicate Record count and the sums of the weight fields (Null when no
+#value is defined - as the SQL Sum)
+#expectedDf - Records expected in the table for the Event_IDs loaded ('recordKeyFields') - the existing records kept and the records inserted
+#Returns dataframe indexed on Event_ID
+def reconcileExpected(expectedDf):
+    expectedGroups = expectedDf.groupby('Event_ID', sort=False)
+    reconcileDf = pd.DataFrame({'Records': expectedGroups.size(), 'DuplicateRecords': expectedGroups['DuplicateRecord'].count()})
+    for fieldName in reconcileFields():
+        reconcileDf[fieldName] = pd.to_numeric(expectedDf[fieldName], errors='coerce').groupby(expectedDf['Event_ID'], sort=False).sum(min_count=1)
+
+    return reconcileDf
+
+
+#Reconcile a load - the records in 'phosphorusTable' of the Hydro Year are read back with one grouped aggregate query (see 'reconcileSQL' - one
+#round trip), restricted to the Event_IDs loaded and compared to the records expected in the table per Event_ID: the record count, the Duplicate
+#Record count and the sums of the weight fields.  The mismatches are exported to 'ReconciliationMismatches_{date}.csv' (Event_ID, Check, Expected
+#and Loaded values)
+#session - Shared Periphyton DB Session
+#reconcileDf - Values expected in the table per Event_ID (see 'reconcileExpected')
+#inYear - Hydro Year of the Events loaded
+#stream - Optional Stream State of the Target (Streaming Mode - see 'StreamState')
+#Returns "success function" and the count of Event_IDs with mismatches
+def reconcileRecords(session, reconcileDf, inYear, stream=None):
+    try:
+        sumFields = reconcileFields()
+        sqlValues = {'table': phosphorusTable, 'sumFields': "".join(", Sum(" + phosphorusTable + "." + fieldName + ") AS " + fieldName for fieldName in sumFields)}
+        loadedDf = session.readQuery(sa.text(reconcileSQL.format(**sqlValues)).bindparams(hydroYear=int(inYear)))
+
+        #Loaded values per Event_ID of the Event_IDs loaded - Event_IDs without records in the table have no rows
+        loadedDf.index = loadedDf['Event_ID'].astype(str)
+        loadedDf = loadedDf.reindex(reconcileDf.index.astype(str))
+        loadedDf[['Records', 'DuplicateRecords']] = loadedDf[['Records', 'DuplicateRecords']].fillna(0)
+
+        mismatchList = []
+        for checkName in ['Records', 'DuplicateRecords'] + sumFields:
+            expectedValues = reconcileDf[checkName].to_numpy(dtype="float64")
+            loadedValues = pd.to_numeric(loadedDf[checkName], errors='coerce').to_numpy(dtype="float64")
+            mismatchMask = ~np.isclose(loadedValues, expectedValues, rtol=1e-9, atol=1e-6, equal_nan=True)
+            if mismatchMask.any():
+                mismatchList.append(pd.DataFrame({'Event_ID': reconcileDf.index[mismatchMask], 'Check': checkName,
+                                                  'Expected': expectedValues[mismatchMask], 'Loaded': loadedValues[mismatchMask]}))
+
+        mismatchCount = 0
+        if len(mismatchList) > 0:
+            mismatchDf = pd.concat(mismatchList, ignore_index=True)
+            mismatchCount = int(mismatchDf['Event_ID'].nunique())
+            outFull = os.path.join(workspace, "ReconciliationMismatches_" + dateString + ".csv")
+            exportReport(mismatchDf, outFull, stream)
+
+            checkCounts = mismatchDf['Check'].value_counts().to_dict()
+            messageTime = timeFun()
+            scriptMsg = "WARNING - reconcileRecords - " + str(mismatchCount) + " - Event_IDs in '" + phosphorusTable + "' do not match the records loaded (" \
+                        + ", ".join(checkName + ": " + str(checkCount) for checkName, checkCount in checkCounts.items()) + ") - Exported .csv file: " + outFull + " - " + messageTime
+            print(scriptMsg)
+            logMessage(scriptMsg, "WARNING", function="reconcileRecords", eventIDs=mismatchCount, checks=checkCounts, outFile=outFull)
+        else:
+            print("Success - Function reconcileRecords - " + str(len(reconcileDf)) + " Event_IDs reconciled")
+
+        return "success function", mismatchCount
+
+    except:
+        messageTime = timeFun()
+        print("Error on reconcileRecords Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'reconcileRecords'"
+
+
+#Load Plan version - incremented when the Load Plan file layout changes
+loadPlanVersion = 1
+
+
+#Write the Load Plan ('plan' Run Mode) - self-contained JSON lines file of the final records to be appended, reviewed before the 'apply' Run Mode.
+#Line one is the plan header (EDD content hash, Event Catalog content hash, Target parameters, fields and record counts) followed by one line per
+#record (list of the field values) in Target order.
+#planTargets - List of (Target name, Target parameters (i.e. 'targetParameterNames'), final records from 'defineAppendRecords')
+#eventCatalog - Hydro Year Event Catalog from 'fetchEventCatalog'
+#outPlan - Load Plan file
+#Returns "success function"
+def writeLoadPlan(planTargets, eventCatalog, outPlan):
+    try:
+        targetList = []
+        recordLines = []
+        for targetName, targetParameters, df_ToAppendFinal in planTargets:
+            recordsDf = df_ToAppendFinal.astype(object).where(df_ToAppendFinal.notna(), None)
+            recordLines.extend(json.dumps(list(values), default=str) + "\n" for values in recordsDf.itertuples(index=False, name=None))
+            targetList.append({'name': targetName, 'parameters': targetParameters, 'fields': list(df_ToAppendFinal.columns), 'records': len(df_ToAppendFinal)})
+
+        recordsHash = hashlib.sha256()
+        for recordLine in recordLines:
+            recordsHash.update(recordLine.encode("utf-8"))
+
+        planHeader = {'loadPlanVersion': loadPlanVersion, 'script': "SFCN_TP_ETL.py", 'created': timeFun(), 'inputFile': inputFile,
+                      'eddHash': fileHash(inputFile), 'hydroYear': hydroYear, 'inDB': os.path.abspath(inDB) if os.path.isfile(inDB) else inDB,
+                      'catalogHash': catalogHash(eventCatalog), 'recordsHash': recordsHash.hexdigest(),
+                      'targets': targetList}
+
+        with open(outPlan, "w", encoding="utf-8") as planOut:
+            planOut.write(json.dumps(planHeader, default=str) + "\n")
+            planOut.writelines(recordLines)
+
+        messageTime = timeFun()
+        scriptMsg = "Load Plan exported: " + outPlan + " - Records: " + str(len(recordLines)) \
+                    + (" - review and append with Run Mode 'apply' (--mode apply --plan-file) - " if runMode == "plan" else " - ") + messageTime
+        print(scriptMsg)
+        logMessage(scriptMsg, "INFO", function="writeLoadPlan", records=len(recordLines), outFile=outPlan, targets=[targetDict['name'] for targetDict in targetList])
+
+        return "success function"
+
+    except:
+        messageTime = timeFun()
+        print("Error on writeLoadPlan Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'writeLoadPlan'"
+
+
+#Read the Load Plan - the record count and content hash of the plan are verified
+#inPlan - Load Plan file from 'writeLoadPlan'
+#Returns the plan header and list of (Target dictionary, final records dataframe)
+def readLoadPlan(inPlan):
+    with open(inPlan, "r", encoding="utf-8") as planIn:
+        planHeader = json.loads(planIn.readline())
+        if planHeader.get('loadPlanVersion') != loadPlanVersion:
+            raise ValueError("Load Plan version " + str(planHeader.get('loadPlanVersion')) + " not supported (version " + str(loadPlanVersion) + ") - " + inPlan)
+
+        recordsHash = hashlib.sha256()
+        planTargets = []
+        for targetDict in planHeader['targets']:
+            recordList = []
+            for recordLine in itertools.islice(planIn, targetDict['records']):
+                recordsHash.update(recordLine.encode("utf-8"))
+                recordList.append(json.loads(recordLine))
+            if len(recordList) != targetDict['records']:
+                raise ValueError("Load Plan is incomplete - Target: " + str(targetDict['name']) + " - " + inPlan)
+
+            #Record keys as Guid (i.e. as defined by 'recordKeys')
+            df_ToAppendFinal = pd.DataFrame(recordList, columns=targetDict['fields'])
+            keyField = targetDict['parameters']['recordKeyField']
+            df_ToAppendFinal[keyField] = df_ToAppendFinal[keyField].map(uuid.UUID)
+            planTargets.append((targetDict, df_ToAppendFinal))
+
+        if planIn.readline() != "" or recordsHash.hexdigest() != planHeader['recordsHash']:
+            raise ValueError("Load Plan records do not match the plan header (records hash) - " + inPlan)
+
+    return planHeader, planTargets
+
+
+#Load Journal version - incremented when the Load Journal file layout changes
+loadJournalVersion = 1
+
+
+#Load Journal - JSON lines file recording the append progress of a Load Plan in the workspace 'LoadJournal' folder.  Line one is the journal header
+#(Load Plan file, EDD and Hydro Year) followed by one line per committed batch (Target, Load Plan positions of the first/last record of the batch),
+#per appended Target (load summary) and the completed load.  Each line is flushed to disk when written - the journal survives a crash of the run.
+#journalFile - Load Journal file (existing journals are read - see 'read')
+class LoadJournal:
+
+    def __init__(self, journalFile):
+        self.journalFile = journalFile
+        self.target = None
+        self.header, self.targets, self.completed = LoadJournal.read(journalFile) if os.path.isfile(journalFile) else (None, {}, False)
+
+    #Create the Load Journal of a Load Plan
+    #planFile - Load Plan file (see 'writeLoadPlan') of the records being appended
+    @classmethod
+    def create(cls, journalFile, planFile):
+        os.makedirs(os.path.dirname(journalFile), exist_ok=True)
+        journal = cls(journalFile)
+        journal.header = {'loadJournalVersion': loadJournalVersion, 'script': "SFCN_TP_ETL.py", 'created': timeFun(), 'planFile': os.path.abspath(planFile),
+                          'inputFile': inputFile, 'hydroYear': hydroYear}
+        journal.write(journal.header)
+        return journal
+
+    #Append a line to the journal - flushed and synced to disk before the next batch is appended
+    def write(self, entry):
+        with open(self.journalFile, "a", encoding="utf-8") as journalOut:
+            journalOut.write(json.dumps(entry, default=str) + "\n")
+            journalOut.flush()
+            os.fsync(journalOut.fileno())
+
+    #Committed batch of the current Target (i.e. 'target') - planStart/planEnd Load Plan positions of the first/last record of the batch
+    def batchCommitted(self, planStart, planEnd, records):
+        self.write({'entry': "batch", 'target': self.target, 'planStart': planStart, 'planEnd': planEnd, 'records': records, 'time': timeFun()})
+        self.targets.setdefault(self.target, {})['planEnd'] = planEnd
+
+    #Appended Target - loadSummary from 'appendRecords'
+    def targetCompleted(self, loadSummary):
+        self.write({'entry': "target", 'target': self.target, 'time': timeFun(), **loadSummary})
+        self.targets.setdefault(self.target, {})['completed'] = True
+
+    #Completed load - the journal and its Load Plan (when written to the Load Journal folder - a Load Plan applied in 'apply' mode is kept) are deleted
+    def complete(self):
+        self.write({'entry': "complete", 'time': timeFun()})
+        self.completed = True
+
+        planFile = self.header['planFile']
+        if os.path.dirname(planFile) == os.path.dirname(os.path.abspath(self.journalFile)) and os.path.isfile(planFile):
+            os.remove(planFile)
+        os.remove(self.journalFile)
+
+    #Read the Load Journal - a partially written last line (i.e. crash while writing) is ignored
+    #Returns the journal header, dictionary of Target name and state (last committed 'planEnd', 'completed') and True when the load completed
+    @staticmethod
+    def read(journalFile):
+        with open(journalFile, "r", encoding="utf-8") as journalIn:
+            header = json.loads(journalIn.readline())
+            if header.get('loadJournalVersion') != loadJournalVersion:
+                raise ValueError("Load Journal version " + str(header.get('loadJournalVersion')) + " not supported (version " + str(loadJournalVersion) + ") - " + journalFile)
+
+            targets = {}
+            completed = False
+            for journalLine in journalIn:
+                try:
+                    entry = json.loads(journalLine)
+                except ValueError:
+                    break
+                if entry['entry'] == "batch":
+                    targets.setdefault(entry['target'], {})['planEnd'] = entry['planEnd']
+                elif entry['entry'] == "target":
+                    targets.setdefault(entry['target'], {})['completed'] = True
+                elif entry['entry'] == "complete":
+                    completed = True
+
+        return header, targets, completed
+
+    #Latest (modification time) incomplete Load Journal in the folder - None when all journals completed
+    @staticmethod
+    def latest(journalFolder):
+        if not os.path.isdir(journalFolder):
+            return None
+        journalList = [os.path.join(journalFolder, fileName) for fileName in os.listdir(journalFolder) if fileName.endswith("_LoadJournal.jsonl")]
+        for journalFile in sorted(journalList, key=os.path.getmtime, reverse=True):
+            if not LoadJournal.read(journalFile)[2]:
+                return journalFile
+        return None
+
+
+#Load Journal folder in the workspace - Load Plans and Load Journals of the journaled loads (see 'loadJournal')
+def loadJournalFolder():
+    return os.path.join(workspace, "LoadJournal")
+
+
+#Append the final records of the Targets of a Load Plan - Targets completed in the Load Journal are skipped and a Target interrupted in a
+#prior run is appended from the record after its last committed batch
+#planTargets - List of (Target dictionary (i.e. 'name' and 'parameters'), final records dataframe - index is the Load Plan position of the record)
+#baseParameters - Script parameters (see 'currentParameters') the Target parameters are applied to
+#sourceName - EDD or Load Plan named in the messages
+#journal - Optional Load Journal (see 'LoadJournal')
+#Returns "success function"
+def appendPlanTargets(planTargets, baseParameters, sourceName, journal=None):
+    try:
+        for targetDict, df_ToAppendFinal in planTargets:
+            applyTargetParameters(baseParameters, targetDict['parameters'])
+            targetName = targetDict['name']
+            targetSuffix = "" if targetName is None else "_" + targetName
+
+            if journal is not None:
+                journal.target = targetName
+                targetState = journal.targets.get(targetName, {})
+                if targetState.get('completed'):
+                    logMessage("Load Journal - Target appended in a prior run - skipped: " + phosphorusTable + targetSuffix + " - " + timeFun(), "INFO", function="appendPlanTargets", target=targetName)
+                    continue
+                elif 'planEnd' in targetState:
+                    messageTime = timeFun()
+                    scriptMsg = "Load Journal - Resuming Target: " + phosphorusTable + targetSuffix + " - after Load Plan record " + str(targetState['planEnd'] + 1) + " of " \
+                                + str(len(df_ToAppendFinal)) + " - " + messageTime
+                    print(scriptMsg)
+                    logMessage(scriptMsg, "INFO", function="appendPlanTargets", target=targetName, planEnd=targetState['planEnd'], records=len(df_ToAppendFinal))
+                    df_ToAppendFinal = df_ToAppendFinal.iloc[targetState['planEnd'] + 1:]
+
+            with stageSpan("appendRecords", rowsIn=len(df_ToAppendFinal), target=targetName) as span:
+                if runReportFile:
+                    span['frameMemoryMB'] = frameMemoryMB(df_ToAppendFinal)
+                outVal = appendRecords(df_ToAppendFinal, os.path.join(workspace, "DataFrameAppended" + targetSuffix + ".csv"), planned=True, journal=journal)
+                span['rowsOut'] = outVal[1]['inserted'] if outVal[0].lower() == "success function" else None
+            if outVal[0].lower() != "success function":
+                return "Failed function - 'appendPlanTargets'"
+
+            if journal is not None:
+                journal.targetCompleted(outVal[1])
+
+            messageTime = timeFun()
+            scriptMsg = "Successfully processed: " + str(len(df_ToAppendFinal)) + " - Records in table - " + phosphorusTable + " - " + sourceName + " - " + messageTime
+            print(scriptMsg)
+            logMessage(scriptMsg, "INFO", function="appendPlanTargets", records=len(df_ToAppendFinal), source=sourceName, target=targetName, targetTable=phosphorusTable)
+
+        return "success function"
+
+    except:
+        messageTime = timeFun()
+        print("Error on appendPlanTargets Function - " + messageTime)
+        traceback.print_exc(file=sys.stdout)
+        return "Failed function - 'appendPlanTargets'"
+
+
+#Apply the Load Plan ('apply' Run Mode) - the planned records are appended without parsing the EDD or resolving the events.  The plan is refused
+#when the Event Catalog (content hash of the fetched Hydro Year catalog - see 'catalogHash') or the EDD (when available) changed after the plan was defined.
+#inPlan - Load Plan file from 'writeLoadPlan'
+#journal - Optional Load Journal (see 'LoadJournal') of the plan being resumed (see 'resumeMain')
+#Returns "success function" or "failed function"
+def applyMain(inPlan, journal=None):
+    runStatus = "failed function"
+    baseParameters = currentParameters()
+    try:
+        with stageSpan("readLoadPlan") as span:
+            planHeader, planTargets = readLoadPlan(inPlan)
+            span['rowsOut'] = sum(len(df_ToAppendFinal) for targetDict, df_ToAppendFinal in planTargets)
+
+        #Hydro Year and EDD of the plan (i.e. the output/log file names)
+        configure(hydroYear=planHeader['hydroYear'], inputFile=planHeader['inputFile'])
+        baseParameters = currentParameters()
+
+        setupWorkspace()
+        enableCopyOnWrite()
+
+        messageTime = timeFun()
+        scriptMsg = "Load Plan: " + inPlan + " - defined: " + planHeader['created'] + " - EDD: " + planHeader['inputFile'] + " - Records: " \
+                    + str(span['rowsOut']) + " - " + messageTime
+        print(scriptMsg)
+        logMessage(scriptMsg, "INFO", function="applyMain", loadPlan=inPlan, records=span['rowsOut'], catalogHash=planHeader['catalogHash'])
+
+        planDB = os.path.abspath(inDB) if os.path.isfile(inDB) else inDB
+        if planDB != planHeader['inDB']:
+            logMessage("WARNING - Load Plan defined against database: " + planHeader['inDB'] + " - applied to: " + planDB + " - " + timeFun(), "WARNING", function="applyMain")
+
+        #Refuse the plan when the EDD (when available) was changed after the plan was defined
+        if os.path.isfile(inputFile) and fileHash(inputFile) != planHeader['eddHash']:
+            messageTime = timeFun()
+            scriptMsg = "WARNING - Load Plan refused - EDD changed after the plan was defined: " + inputFile + " - define a new Load Plan - Exiting Script - " + messageTime
+            print(scriptMsg)
+            logMessage(scriptMsg, "WARNING", function="applyMain", loadPlan=inPlan)
+            exit()
+
+        #Refuse the plan when the Event Catalog the records were defined against has changed - the Hydro Year Event Catalog is fetched and its
+        #content hash compared (the probe counts/lengths do not cover the Event_ID/Site_ID/Visit_Type/QCExtra mapping of the records)
+        with stageSpan("fetchEventCatalog", hydroYear=hydroYear) as span:
+            outVal = fetchEventCatalog(hydroYear)
+            span['rowsOut'] = len(outVal[1]['events']) + len(outVal[1]['labDuplicates']) if outVal[0].lower() == "success function" else None
+        if outVal[0].lower() != "success function":
+            print("WARNING - Function fetchEventCatalog - Failed - Exiting Script")
+            exit()
+
+        if catalogHash(outVal[1]) != planHeader['catalogHash']:
+            messageTime = timeFun()
+            scriptMsg = "WARNING - Load Plan refused - Event Catalog changed after the plan was defined (catalog hash) - define a new Load Plan - Exiting Script - " + messageTime
+            print(scriptMsg)
+            logMessage(scriptMsg, "WARNING", function="applyMain", loadPlan=inPlan, catalogHash=catalogHash(outVal[1]))
+            exit()
+
+        #Load Journal of the plan - resumed journal, or a new journal in the workspace 'LoadJournal' folder (see 'loadJournal')
+        if journal is None and loadJournal:
+            journal = LoadJournal.create(os.path.join(loadJournalFolder(), os.path.splitext(os.path.basename(inPlan))[0] + "_" + datetime.now().strftime("%H%M%S")
+                                                      + "_LoadJournal.jsonl"), inPlan)
+
+        outVal = appendPlanTargets(planTargets, baseParameters, "Load Plan: " + inPlan, journal)
+        if outVal.lower() != "success function":
+            print("WARNING - Function appendPlanTargets - Failed - Exiting Script")
+            exit()
+
+        if journal is not None:
+            journal.complete()
 
+        runStatus = "success function"
+        return runStatus
 
-        #Define Final Data Frame with Matching Schema for table -
-        df_ToAppendFinal = inDF[['Event_ID','TP_Lab_Name','TP_Lab_SOP','TP_Lab_ID','TP_Lab_MDL','Bottle weight (g)','Plant weight (g)','Sample wet weight (g)','TP µg/g','DuplicateRecord','Notes']]
-        #df_ToAppendFinal = inDF[['Event_ID', 'TP_Lab_Name', 'TP_Lab_SOP', 'TP_Lab_ID', 'TP_Lab_MDL', 'Bottle weight (g)', 'Plant weight (g)', 'Sample wet weight (g)', 'TP µg/g', 'Notes']]
+    except:
 
-        #Rename Fields to match DB Schema
-        df_ToAppendFinal.rename(columns={'Bottle weight (g)': 'Bottle_Weight_g', 'Plant weight (g)': 'Plant_Weight_g', 'Sample wet weight (g)': 'Sample_Wet_Weight_g',
-                                    'TP µg/g':'Total_Phosphorus'},inplace=True)
+        messageTime = timeFun()
+        scriptMsg = "SCFN_TP_ETL.py - applyMain - " + messageTime
+        print (scriptMsg)
+        logMessage(scriptMsg, "ERROR", function="applyMain", traceback=traceback.format_exc())
+        traceback.print_exc(file=sys.stdout)
+        flushRunLogger()
+        return "failed function"
 
+    finally:
+        #Restore the script parameters (i.e. of the last Target), close the shared Periphyton DB connection, write the Run Report and flush the log
+        applyTargetParameters(baseParameters, {})
+        closeSession()
+        writeRunReport(runStatus, loadPlan=inPlan)
+        flushRunLogger()
+
+
+#Resume the interrupted load of a Load Journal - the Load Plan of the journal is applied (see 'applyMain') from the record after the last
+#committed batch of each Target.  The plan checks of 'applyMain' (EDD and Event Catalog unchanged) are repeated.
+#inJournal - Load Journal file, or True for the latest incomplete journal in the workspace 'LoadJournal' folder
+#Returns "success function" or "failed function"
+def resumeMain(inJournal):
+    setupWorkspace()
+    journalFile = LoadJournal.latest(loadJournalFolder()) if inJournal is True else inJournal
+    if journalFile is None or not os.path.isfile(journalFile):
+        messageTime = timeFun()
+        scriptMsg = "WARNING - No incomplete Load Journal to resume - " + (loadJournalFolder() if journalFile is None else journalFile) + " - " + messageTime
+        print(scriptMsg)
+        logMessage(scriptMsg, "WARNING", function="resumeMain")
+        flushRunLogger()
+        return "failed function"
 
-        #Round Total Phosphorus field to 2 decimal - have made the native field string to accommodate Text Code Flags
-        #df_ToAppendFinal.round({'Total_Phosphorus': 2})
+    journal = LoadJournal(journalFile)
+    messageTime = timeFun()
+    if journal.completed:
+        scriptMsg = "Load Journal completed - nothing to resume: " + journalFile + " - " + messageTime
+        print(scriptMsg)
+        logMessage(scriptMsg, "INFO", function="resumeMain", loadJournal=journalFile)
+        flushRunLogger()
+        return "success function"
 
-        #Get Number of Columns
-        shapeDf = df_ToAppendFinal.shape
-        lenColumns = shapeDf[1]
+    scriptMsg = "Resuming Load Journal: " + journalFile + " - created: " + journal.header['created'] + " - EDD: " + journal.header['inputFile'] + " - committed records: " \
+                + ", ".join(("" if targetName is None else targetName + " ") + str(targetState.get('planEnd', -1) + 1) for targetName, targetState in journal.targets.items()) \
+                + " - " + messageTime
+    print(scriptMsg)
+    logMessage(scriptMsg, "INFO", function="resumeMain", loadJournal=journalFile, loadPlan=journal.header['planFile'])
+
+    return applyMain(journal.header['planFile'], journal)
+
+
+#Streaming Mode - the EDD is processed in chunks of 'streamChunkSize' records so the memory stays bounded for very large EDDs.  The chunks are
+#read from the workbook and spooled to the workspace 'StreamSpool' folder, each chunk is validated and resolved against the Event index (built
+#once per Event Catalog) and, once no Target has records with Null Event_IDs, each chunk is defined and appended.  The records loaded and the
+#reports are those of the in memory load ('main') - the reports of the chunks are exported once the Target is processed.  The chunks are spooled
+#rather than appended as they are read: the field types are defined from all the chunks of the sheet (see 'streamFieldTypes') and no record is
+#appended until every Target is resolved without Null Event_IDs.  The Site Statistics are fetched once per Target before the chunks are appended and
+#the Target is reconciled once after its last chunk (see 'reconcileRecords').
+#Run Mode 'load' and .xlsx/.xlsm EDDs only - the Load Journal is not written (an interrupted load is rerun - the records appended are skipped)
+def streamMain():
+    runStatus = "failed function"
+    baseParameters = currentParameters()
+    spoolFolder = None
+    try:
+        if runMode != "load":
+            print("WARNING - Streaming Mode - Run Mode '" + runMode + "' is not supported (Run Mode 'load' only) - Exiting Script")
+            exit()
 
-        #Add 'Event_ID_DummyIndex' Field - to be used as Index value for SQL Alchemy
-        #df_ToAppendFinal.insert(lenColumns, 'TotalPhosphorus_Data_ID', df_ToAppendFinal['Event_ID'])
-        #Add Index Field - to be used as Index value for SQL Alchemy - Must be Unique Guid to avoid duplicates in table 'tbl_Lab_Data_TotalPhosphorus'
-        df_ToAppendFinal['TotalPhosphorus_Data_ID'] = [uuid.uuid4() for x in range(len(df_ToAppendFinal))]
+        if os.path.splitext(inputFile)[1].lower() not in streamWorkbookTypes:
+            print("WARNING - Streaming Mode - EDD format '" + os.path.splitext(inputFile)[1] + "' is not read in chunks (" + ", ".join(streamWorkbookTypes)
+                  + " only) - save the EDD as .xlsx or load it without --stream-chunk-size - Exiting Script: " + inputFile)
+            exit()
 
-        #Reset the index
-        df_ToAppendFinal.reset_index(drop=True, inplace=True)
+        setupWorkspace()
+        enableCopyOnWrite()
 
-        # Set Index field to the 'TotalPhosphorus_Data_ID' field - SQL Alchemy will not be able to append to table unless the index field in table 'tbl_Lab_Data_TotalPhosphorus' is defined as the inde
-        # this fields index value - value will not be retained on append (i.e. a new autonumber will be populated).
-        df_ToAppendFinal.set_index("TotalPhosphorus_Data_ID", inplace=True)
+        #Confirm the QAQC/Field Duplicate and Lab Duplicate Records have been defined
+        if interactive:
+            confirmPrerequisites()
+        else:
+            logMessage("Non-Interactive Mode - QAQC/Field Duplicate and Lab Duplicate definitions not confirmed - " + timeFun(), "INFO", function="streamMain")
 
-        outFull = workspace + "\DataFrameAppended.csv"
-        #Export Data Frame that has been imported
-        df_ToAppendFinal.to_csv(outFull, index=True)
+        #Prefetch the Hydro Year Event Catalog while the EDD chunks are spooled (see 'CatalogPrefetch')
+        eventCatalog = None
+        catalogPrefetch = None
+        if prefetchCatalog:
+            catalogPrefetch = CatalogPrefetch(hydroYear)
+        else:
+            outVal = CatalogPrefetch.fetch(hydroYear)
+            if outVal[0].lower() != "success function":
+                print("WARNING - Function fetchEventCatalog - Failed - Exiting Script")
+                exit()
+            else:
+                print("Success - Function fetchEventCatalog")
+                eventCatalog = outVal[1]
 
-        #Create iteration range for records to be appended
-        shapeDf = df_ToAppendFinal.shape
-        lenRows = shapeDf[0]
-        rowRange = range(0, lenRows)
+        stream = StreamState()
+        spoolFolder = os.path.join(workspace, "StreamSpool", outName + "_" + datetime.now().strftime("%H%M%S"))
+        os.makedirs(spoolFolder, exist_ok=True)
 
+        #Targets (sheet/analyte) processed from the workbook - the script parameters when 'crosswalkConfig' is None
+        targetList = readCrosswalkConfig(crosswalkConfig) if crosswalkConfig is not None else [(None, {})]
+        workbook = EDDWorkbook(inputFile)
+        spoolList = []
         try:
-            for row in rowRange:
-                df3 = df_ToAppendFinal[row:row + 1]
-                recordIdSeries = df3.iloc[0]
-                recordId = recordIdSeries.get('Event_ID')
+            for targetName, targetParameters in targetList:
+                applyTargetParameters(baseParameters, targetParameters)
+
+                #####################
+                #Spool the Raw Data chunks of the Target sheet
+                #####################
+                with stageSpan("spoolEDD", target=targetName) as span:
+                    outVal = spoolEDD(inputFile, rawDataSheet, firstRow, workbook.open(), os.path.join(spoolFolder, "Target" + str(len(spoolList))))
+                    span['rowsOut'] = outVal[1]['records'] if outVal[0].lower() == "success function" else None
+                    if outVal[0].lower() == "success function":
+                        span['chunks'] = len(outVal[1]['chunks'])
+                if outVal[0].lower() == "truncate warning":
+                    truncateWarning(outVal[1], targetName)
+                    exit()
+
+                elif outVal[0].lower() != "success function":
+                    print("WARNING - Function spoolEDD - Failed - Exiting Script")
+                    exit()
+                else:
+                    print("Success - Function spoolEDD - Sheet: " + rawDataSheet + " - " + str(len(outVal[1]['chunks'])) + " chunks")
+                    spoolList.append((targetName, targetParameters, outVal[1]))
+
+            #Join the prefetched Event Catalog
+            if eventCatalog is None:
+                outVal = catalogPrefetch.result()
+                if outVal[0].lower() != "success function":
+                    print("WARNING - Function fetchEventCatalog - Failed - Exiting Script")
+                    exit()
+                else:
+                    print("Success - Function fetchEventCatalog")
+                    eventCatalog = outVal[1]
+
+        finally:
+            workbook.close()
+            #Cancel the Event Catalog prefetch (when the EDD spooling failed) and wait for the thread before the DB session is closed
+            if catalogPrefetch is not None:
+                catalogPrefetch.close()
+
+        #Event Catalog hash indexes - built once for the chunks of the Targets (the Lab Duplicate pass per Target 'labDuplicateType')
+        indexLists = {}
 
-                #outFull = workspace + "\Test2.csv"
-                # # Export
-                # df3.to_csv(outFull, index=True)
+        ###############################
+        # Validate and resolve the chunks of each Target - Define the Event_ID, Event_Group_ID, Site_ID, Visit_Type and DuplicateRecord fields
+        ##############################
+        catalogList = None
+        for targetName, targetParameters, spoolInfo in spoolList:
+            applyTargetParameters(baseParameters, targetParameters)
+            targetSuffix = "" if targetName is None else "_" + targetName
+            outExceptionsCSV = os.path.join(workspace, "ValidationExceptions" + targetSuffix + "_" + dateString + ".csv")
+            outAmbiguousCSV = os.path.join(workspace, "AmbiguousMatches" + targetSuffix + "_" + dateString + ".csv")
+            outNullCSV = os.path.join(workspace, "RecordsNoEventinDB" + targetSuffix + "_" + dateString + ".csv")
+            outSuggestCSV = os.path.join(workspace, "SuggestedEvents" + targetSuffix + "_" + dateString + ".csv")
+            if labDuplicateType not in indexLists:
+                with stageSpan("buildEventIndex", target=targetName) as span:
+                    indexLists[labDuplicateType] = buildEventIndex(eventCatalog)
+                    span['rowsOut'] = sum(len(eventIndex['keys']) for eventIndex in indexLists[labDuplicateType])
+
+            exceptionCount = 0
+            targetNull = 0
+            slotCounts = {}
+            stream.startTarget()
+            for chunkNumber, (chunkFile, chunkRecords) in enumerate(spoolInfo['chunks']):
+                df_DatasetToDefine = readStreamChunk(chunkFile, spoolInfo)
+
+                #Validate the EDD measurements of the chunk
+                if validationMode != "off":
+                    with stageSpan("validateEDD", rowsIn=chunkRecords, target=targetName, chunk=chunkNumber) as span:
+                        outVal = validateEDD(df_DatasetToDefine, outExceptionsCSV, stream=stream)
+                        span['rowsOut'] = outVal[1] if outVal[0].lower() == "success function" else None
+                    if outVal[0].lower() != "success function":
+                        print("WARNING - Function validateEDD - Failed - Exiting Script")
+                        exit()
+                    exceptionCount = exceptionCount + outVal[1]
+
+                with stageSpan("resolveEvents", rowsIn=chunkRecords, target=targetName, chunk=chunkNumber) as span:
+                    outVal = resolveEvents(df_DatasetToDefine, eventCatalog, outAmbiguousCSV, indexLists[labDuplicateType], stream)
+                    span['rowsOut'] = chunkRecords - outVal[1] if outVal[0].lower() == "success function" else None
+                    if runReportFile:
+                        span['frameMemoryMB'] = frameMemoryMB(df_DatasetToDefine)
+                if outVal[0].lower() != "success function":
+                    print("WARNING - Function resolveEvents - Failed - Exiting Script")
+                    exit()
+
+                #Records with Null Event_IDs and their nearest matching Events - exported with the chunks
+                if outVal[1] > 0:
+                    exportNullRecords(df_DatasetToDefine, outNullCSV, stream)
+                    if suggestMatches:
+                        if catalogList is None:
+                            catalogList = suggestionCatalogs(hydroYear, eventCatalog)
+                        with stageSpan("suggestEvents", rowsIn=outVal[1], target=targetName, chunk=chunkNumber):
+                            suggestEvents(df_DatasetToDefine, catalogList, outSuggestCSV, stream)
+                    targetNull = targetNull + outVal[1]
+
+                #Resolved records of the chunk spooled - the Events matched by more than one record are reported once the Target is resolved
+                resolvedDf = stream.resolvedList.pop()
+                resolvedDf['Slot'] = resolvedDf['Event_ID'].astype(str) + "|" + resolvedDf['DuplicateRecord'].map(normalizeKeyValue)
+                for slotValue, slotCount in resolvedDf['Slot'].value_counts().items():
+                    slotCounts[slotValue] = slotCounts.get(slotValue, 0) + slotCount
+                resolvedDf.to_pickle(chunkFile[:-len(".pkl")] + "_Resolved.pkl")
+                df_DatasetToDefine.to_pickle(chunkFile)
+                stream.recordOffset = stream.recordOffset + chunkRecords
+                del (df_DatasetToDefine, resolvedDf)
+
+            #Events matched by more than one record (per Duplicate Record) - kept and reported with the Ambiguous Matches
+            multipleSlots = set(slotValue for slotValue, slotCount in slotCounts.items() if slotCount > 1)
+            if len(multipleSlots) > 0:
+                multipleList = []
+                for chunkFile, chunkRecords in spoolInfo['chunks']:
+                    resolvedDf = pd.read_pickle(chunkFile[:-len(".pkl")] + "_Resolved.pkl")
+                    multipleList.append(resolvedDf[resolvedDf['Slot'].isin(multipleSlots)].drop(columns=['Slot']))
+                multipleDf = multipleMatches(pd.concat(multipleList, ignore_index=True))
+                stream.holdReport(multipleDf, outAmbiguousCSV)
 
-                appendOut = df3.to_sql(phosphorusTable, con=engine, if_exists='append')
-                print(appendOut)
                 messageTime = timeFun()
-                scriptMsg = "Successfully Appended Event_ID - " + recordId + " - " + messageTime
+                scriptMsg = "WARNING - resolveEvents - Ambiguous Matches: " + str(len(multipleDf)) + " records matching the same Event - Exported to: " + outAmbiguousCSV + " - " + messageTime
                 print(scriptMsg)
-                logFile = open(logFileName, "a")
-                logFile.write(scriptMsg + "\n")
-                logFile.close()
+                logMessage(scriptMsg, "WARNING", function="streamMain", ambiguousRecords=len(multipleDf), outFile=outAmbiguousCSV, target=targetName)
+            spoolInfo['multipleSlots'] = multipleSlots
 
-            return "success function"
+            #Validation Exceptions - Exit Script when 'validationMode' is 'block'
+            if exceptionCount > 0 and validationMode == "block":
+                stream.exportReports([outExceptionsCSV])
+                messageTime = timeFun()
+                scriptMsg = "WARNING - " + str(exceptionCount) + " - Validation Exceptions - Sheet: " + rawDataSheet + " - Load blocked (validationMode 'block') - Exiting Script - " + messageTime
+                print(scriptMsg)
+                logMessage(scriptMsg, "WARNING", function="streamMain", exceptions=exceptionCount, target=targetName, outFile=outExceptionsCSV)
+                exit()
+
+            stream.exportReports()
+            print("Success - Function resolveEvents - " + str(spoolInfo['records']) + " records - " + str(targetNull) + " records with Null 'Event_ID' values")
+            spoolInfo['nullRecords'] = targetNull
+
+        #If Undefined Records (any Target) Exit Script these need to be defined - no Target is appended (the records are exported with the chunks)
+        if any(spoolInfo['nullRecords'] > 0 for targetName, targetParameters, spoolInfo in spoolList):
+            for targetName, targetParameters, spoolInfo in spoolList:
+                if spoolInfo['nullRecords'] > 0:
+                    targetSuffix = "" if targetName is None else "_" + targetName
+                    outVal = nullRecordsGt0(spoolInfo['nullRecords'], None, os.path.join(workspace, "RecordsNoEventinDB" + targetSuffix + "_" + dateString + ".csv"))
+                    if outVal.lower() != "success function":
+                        print("WARNING - Function nullRecordsGt0 - Failed - Exiting Script")
+                    else:
+                        print("Success - Function nullRecordsGt0")
+            exit()
 
-        except:
+        ###############################
+        # Define and append the chunks of each Target
+        ##############################
+        for targetName, targetParameters, spoolInfo in spoolList:
+            applyTargetParameters(baseParameters, targetParameters)
+            targetSuffix = "" if targetName is None else "_" + targetName
+            outReviewCSV = os.path.join(workspace, "OutlierReview" + targetSuffix + "_" + dateString + ".csv")
+
+            stream.startTarget(spoolInfo['multipleSlots'])
+            targetSummary = {'inserted': 0, 'skipped': 0, 'duplicates': 0, 'conflicting': 0, 'mismatches': 0}
+
+            #Site Statistics of the Target - fetched once for the chunks (the Hydro Years prior to 'hydroYear' are not changed by the chunks appended)
+            siteStatistics = None
+            if outlierFlagging and outlierField is not None and outlierField in valueFieldMap.values():
+                with stageSpan("fetchSiteStatistics", target=targetName) as span:
+                    outVal = fetchSiteStatistics(hydroYear)
+                    span['rowsOut'] = len(outVal[1]) if outVal[0].lower() == "success function" else None
+                if outVal[0].lower() != "success function":
+                    print("WARNING - Function fetchSiteStatistics - Failed - values not flagged")
+                else:
+                    siteStatistics = outVal[1]
+            for chunkNumber, (chunkFile, chunkRecords) in enumerate(spoolInfo['chunks']):
+                df_DatasetToDefine = pd.read_pickle(chunkFile)
+
+                #Add the Lab fields with defined values (e.g. 'TP_Lab_Name','TP_Lab_SOP','TP_Lab_ID','TP_Lab_MDL')
+                defineLabFields(df_DatasetToDefine)
+
+                #Flag the values outside the Site_ID/Visit_Type history in the 'Notes' field - the records are loaded (review report only)
+                if siteStatistics is not None:
+                    with stageSpan("flagOutliers", rowsIn=chunkRecords, target=targetName, chunk=chunkNumber) as span:
+                        outVal = flagOutliers(df_DatasetToDefine, hydroYear, outReviewCSV, siteStatistics, stream)
+                        span['rowsOut'] = outVal[1] if outVal[0].lower() == "success function" else None
+                    if outVal[0].lower() != "success function":
+                        print("WARNING - Function flagOutliers - Failed - values not flagged")
+
+                #Appended the chunk records to the Target table (i.e. 'phosphorusTable')
+                with stageSpan("appendRecords", rowsIn=chunkRecords, target=targetName, chunk=chunkNumber) as span:
+                    if runReportFile:
+                        span['frameMemoryMB'] = frameMemoryMB(df_DatasetToDefine)
+                    outVal = appendRecords(df_DatasetToDefine, os.path.join(workspace, "DataFrameAppended" + targetSuffix + ".csv"), stream=stream)
+                    span['rowsOut'] = outVal[1]['inserted'] if outVal[0].lower() == "success function" else None
+                if outVal[0].lower() != "success function":
+                    stream.exportReports()
+                    print("WARNING - Function appendRecords - Failed - Exiting Script")
+                    exit()
+                for summaryName in targetSummary:
+                    targetSummary[summaryName] = targetSummary[summaryName] + outVal[1].get(summaryName, 0)
+
+                stream.recordOffset = stream.recordOffset + chunkRecords
+                del (df_DatasetToDefine)
+
+            print("Success - Function appendRecords")
+
+            #Reconcile the Target - the records expected per Event_ID after the last chunk (see 'appendRecords') compared to the table in one query
+            if stream.reconcile is not None and len(stream.reconcile) > 0:
+                with stageSpan("reconcileRecords", rowsIn=len(stream.reconcile), target=targetName) as span:
+                    outVal = reconcileRecords(getSession(inDB), stream.reconcile, hydroYear, stream)
+                    span['rowsOut'] = outVal[1] if outVal[0].lower() == "success function" else None
+                if outVal[0].lower() != "success function":
+                    logMessage("WARNING - Load not reconciled - " + timeFun(), "WARNING", function="streamMain", target=targetName)
+                else:
+                    targetSummary['mismatches'] = outVal[1]
+                stream.reconcile = None
+            stream.exportReports()
+
+            #Refresh the Site Statistics history with the appended records of the Target - once after the last chunk (see 'refreshStatisticsHistory')
+            if outlierFlagging and outlierField in valueFieldMap.values() and targetSummary['inserted'] > 0:
+                with stageSpan("refreshStatisticsHistory", target=targetName):
+                    if refreshStatisticsHistory()[0] is None:
+                        logMessage("WARNING - Site Statistics history not refreshed - " + timeFun(), "WARNING", function="streamMain")
 
             messageTime = timeFun()
-            scriptMsg = "WARNING Failed to Appended Event_ID - " + recordId + " - " + messageTime
+            scriptMsg = "Successfully processed: " + str(spoolInfo['records']) + " - Records in table - " + phosphorusTable + " - " + inputFile + " - " \
+                        + str(len(spoolInfo['chunks'])) + " chunks - Inserted: " + str(targetSummary['inserted']) + " - Skipped (already loaded): " \
+                        + str(targetSummary['skipped']) + " - Duplicates in EDD: " + str(targetSummary['duplicates']) + " - Conflicting: " + str(targetSummary['conflicting']) + " - " + messageTime
             print(scriptMsg)
-            logFile = open(logFileName, "a")
-            logFile.write(scriptMsg + "\n")
-            logFile.close()
-            return "failed function"
+            logMessage(scriptMsg, "INFO", function="streamMain", records=spoolInfo['records'], chunks=len(spoolInfo['chunks']), inputFile=inputFile,
+                       target=targetName, targetTable=phosphorusTable, **targetSummary)
 
+        runStatus = "success function"
+        return runStatus
 
     except:
+
         messageTime = timeFun()
-        print("Error SFCN_TP_ETL.py  - " + messageTime)
+        scriptMsg = "SCFN_TP_ETL.py - " + messageTime
+        print (scriptMsg)
+        logMessage(scriptMsg, "ERROR", function="streamMain", traceback=traceback.format_exc())
         traceback.print_exc(file=sys.stdout)
-        return "Failed function - 'appendRecords'"
+        flushRunLogger()
+        return "failed function"
 
+    finally:
+        #Restore the script parameters, remove the spooled chunks, close the shared Periphyton DB connection, write the Run Report and flush the log
+        applyTargetParameters(baseParameters, {})
+        if spoolFolder is not None:
+            shutil.rmtree(spoolFolder, ignore_errors=True)
+        closeSession()
+        writeRunReport(runStatus, inputFile=inputFile)
+        flushRunLogger()
+
+
+#Read the Batch Mode EDD list - Directory of EDDs (*.xls, *.xlsx) or Manifest .csv file
+#Manifest fields: inputFile (required), rawDataSheet, firstRow and hydroYear - blank values default to the script parameters
+#inSource - Directory or Manifest .csv file
+#Returns list of dictionaries (inputFile, rawDataSheet, firstRow, hydroYear)
+def readBatchSource(inSource):
+    if os.path.isdir(inSource):
+        fileList = sorted(os.path.join(inSource, fileName) for fileName in os.listdir(inSource)
+                          if os.path.splitext(fileName)[1].lower() in (".xls", ".xlsx") and not fileName.startswith("~$"))
+        manifestDf = pd.DataFrame({'inputFile': fileList})
+    else:
+        manifestDf = pd.read_csv(inSource, dtype={'inputFile': str, 'rawDataSheet': str, 'firstRow': str})
+
+    eddList = []
+    for manifestRow in manifestDf.to_dict(orient='records'):
+        eddItem = {'inputFile': manifestRow['inputFile'], 'rawDataSheet': rawDataSheet, 'firstRow': firstRow, 'hydroYear': hydroYear}
+        for field in ('rawDataSheet', 'firstRow', 'hydroYear'):
+            if field in manifestRow and pd.notnull(manifestRow[field]):
+                eddItem[field] = manifestRow[field]
+        eddItem['hydroYear'] = int(eddItem['hydroYear'])
+        eddList.append(eddItem)
+
+    return eddList
+
+
+#Batch Mode worker process initializer - define the script parameters of the parent process
+def initBatchWorker(parameters):
+    configure(**parameters)
+    enableCopyOnWrite()
+
+
+#Batch Mode worker - Extract and Define (i.e. resolve the events) one EDD against the hydro year Event Catalog.  Runs in a worker process
+#and does not write to the Periphyton DB - resolved datasets are returned to the single writer (see 'batchWriter').
+#eddItem - Dictionary from 'readBatchSource'
+#eventCatalog - Hydro Year Event Catalog from 'fetchEventCatalog'
+#catalogList - Event Catalogs searched for the Suggested Events (see 'suggestionCatalogs') - None fetches the adjacent Hydro Years (not used in the
+#worker processes, the Batch Mode passes the catalogs)
+#Returns the outcome dictionary and the resolved dataset (None when not resolved)
+def processEDDWorker(eddItem, eventCatalog, catalogList=None):
+    outcome = {'inputFile': eddItem['inputFile'], 'hydroYear': eddItem['hydroYear'], 'status': None, 'records': 0,
+               'recordsNullEvent': 0, 'validationExceptions': 0, 'outFile': None, 'message': None}
+    try:
+        with stageSpan("extractEDD") as span:
+            outVal = extractEDD(eddItem['inputFile'], eddItem['rawDataSheet'], eddItem['firstRow'])
+            span['rowsOut'] = len(outVal[1]) if outVal[0].lower() == "success function" else None
+            if runReportFile and outVal[0].lower() == "success function":
+                span['frameMemoryMB'] = frameMemoryMB(outVal[1])
+        if outVal[0].lower() == "truncate warning":
+            outcome['status'] = "Extract Failed"
+            outcome['message'] = "WARNING - Truncating Imported Dataset after field: " + str(outVal[1])
+            return outcome, None
+        elif outVal[0].lower() != "success function":
+            outcome['status'] = "Extract Failed"
+            outcome['message'] = "Failed function - 'extractEDD'"
+            return outcome, None
+
+        df_DatasetToDefine = outVal[1]
+        outcome['records'] = len(df_DatasetToDefine)
+
+        eddName = os.path.splitext(os.path.basename(eddItem['inputFile']))[0]
+        if validationMode != "off":
+            outFull = os.path.join(workspace, "ValidationExceptions_" + eddName + "_" + dateString + ".csv")
+            with stageSpan("validateEDD", rowsIn=len(df_DatasetToDefine)) as span:
+                outVal = validateEDD(df_DatasetToDefine, outFull, eddItem['hydroYear'])
+                span['rowsOut'] = outVal[1] if outVal[0].lower() == "success function" else None
+            if outVal[0].lower() != "success function":
+                outcome['status'] = "Validation Failed"
+                outcome['message'] = "Failed function - 'validateEDD'"
+                return outcome, None
+            outcome['validationExceptions'] = outVal[1]
+            if outVal[1] > 0 and validationMode == "block":
+                outcome['status'] = "Validation Failed"
+                outcome['outFile'] = outFull
+                outcome['message'] = "There are: " + str(outVal[1]) + " - Validation Exceptions - Load blocked (validationMode 'block')"
+                return outcome, None
+        outAmbiguousCSV = os.path.join(workspace, "AmbiguousMatches_" + eddName + "_" + dateString + ".csv")
+        with stageSpan("resolveEvents", rowsIn=len(df_DatasetToDefine)) as span:
+            outVal = resolveEvents(df_DatasetToDefine, eventCatalog, outAmbiguousCSV)
+            span['rowsOut'] = len(df_DatasetToDefine) - outVal[1] if outVal[0].lower() == "success function" else None
+            if runReportFile:
+                span['frameMemoryMB'] = frameMemoryMB(df_DatasetToDefine)
+        if outVal[0].lower() != "success function":
+            outcome['status'] = "Resolve Failed"
+            outcome['message'] = "Failed function - 'resolveEvents'"
+            return outcome, None
 
-if __name__ == '__main__':
+        recCountNull = outVal[1]
+        if recCountNull > 0:
+            #Export the Records in need of a Matching Event in the database
+            outFull = os.path.join(workspace, "RecordsNoEventinDB_" + eddName + "_" + dateString + ".csv")
+            exportNullRecords(df_DatasetToDefine, outFull)
+
+            if suggestMatches:
+                if catalogList is None:
+                    catalogList = suggestionCatalogs(eddItem['hydroYear'], eventCatalog)
+                outSuggestCSV = os.path.join(workspace, "SuggestedEvents_" + eddName + "_" + dateString + ".csv")
+                with stageSpan("suggestEvents", rowsIn=recCountNull) as span:
+                    outVal = suggestEvents(df_DatasetToDefine, catalogList, outSuggestCSV)
+                    span['rowsOut'] = outVal[1] if outVal[0].lower() == "success function" else None
+
+            outcome['status'] = "Undefined Events"
+            outcome['recordsNullEvent'] = recCountNull
+            outcome['outFile'] = outFull
+            outcome['message'] = "There are: " + str(recCountNull) + " - Records with Null 'Event_ID' values"
+            return outcome, None
+
+        defineLabFields(df_DatasetToDefine)
+        outcome['status'] = "Resolved"
+        return outcome, df_DatasetToDefine
 
-    # Write parameters to log file ---------------------------------------------
-    ##################################
-    # Checking for working directories
-    ##################################
+    except:
+        outcome['status'] = "Failed"
+        outcome['message'] = traceback.format_exc()
+        return outcome, None
 
-    if os.path.exists(workspace):
-        pass
-    else:
-        os.makedirs(workspace)
+    finally:
+        #Run Report spans of the worker process - added to the Run Report of the Batch Mode run (see 'batchMain')
+        if runReportFile:
+            outcome['stages'] = getRunReport().takeSpans()
 
-    #Check for logfile
 
-    if os.path.exists(logFileName):
-        pass
+#Batch Mode single writer - Appends the resolved datasets from the writer queue one at a time (Access tolerates only one writer).
+#Processing ends when None is received from the queue.
+#writerQueue - Queue of (outcome, resolved dataset)
+#outcomeList - List the final outcome dictionaries are added to
+def batchWriter(writerQueue, outcomeList):
+    while True:
+        queueItem = writerQueue.get()
+        if queueItem is None:
+            break
+
+        outcome, df_DatasetToDefine = queueItem
+        appendResolvedEDD(outcome, df_DatasetToDefine)
+
+        logBatchOutcome(outcome)
+        outcomeList.append(outcome)
+
+
+#Append the resolved dataset of an EDD (Batch/Service Mode) - the outcome dictionary is updated with the Load status and record counts
+#outcome - Outcome dictionary from 'processEDDWorker'
+#df_DatasetToDefine - Resolved dataset from 'processEDDWorker'
+def appendResolvedEDD(outcome, df_DatasetToDefine):
+    try:
+        eddName = os.path.splitext(os.path.basename(outcome['inputFile']))[0]
+        outFull = os.path.join(workspace, "DataFrameAppended_" + eddName + ".csv")
+
+        #Flag the values outside the Site_ID/Visit_Type history in the 'Notes' field (Site Statistics queried by the writer - see 'flagOutliers')
+        if outlierFlagging and outlierField is not None:
+            outReviewCSV = os.path.join(workspace, "OutlierReview_" + eddName + "_" + dateString + ".csv")
+            with stageSpan("flagOutliers", rowsIn=len(df_DatasetToDefine), inputFile=outcome['inputFile']) as span:
+                outVal = flagOutliers(df_DatasetToDefine, outcome['hydroYear'], outReviewCSV)
+                span['rowsOut'] = outVal[1] if outVal[0].lower() == "success function" else None
+            outcome['outliers'] = outVal[1] if outVal[0].lower() == "success function" else None
+            if outcome['outliers']:
+                outcome['reviewFile'] = outReviewCSV
+
+        with stageSpan("appendRecords", rowsIn=len(df_DatasetToDefine), inputFile=outcome['inputFile']) as span:
+            if runReportFile:
+                span['frameMemoryMB'] = frameMemoryMB(df_DatasetToDefine)
+            outVal = appendRecords(df_DatasetToDefine, outFull, inYear=outcome['hydroYear'])
+            span['rowsOut'] = outVal[1]['inserted'] if outVal[0].lower() == "success function" else None
+        if outVal[0].lower() != "success function":
+            outcome['status'] = "Append Failed"
+            outcome['message'] = "Failed function - 'appendRecords'"
+        else:
+            outcome['status'] = "Loaded"
+            outcome['outFile'] = outFull
+            outcome.update(outVal[1])
+    except:
+        outcome['status'] = "Append Failed"
+        outcome['message'] = traceback.format_exc()
+
+
+#Write the Batch/Service Mode outcome for an EDD to the log
+#modeName - 'Batch' or 'Service'
+def logBatchOutcome(outcome, modeName="Batch"):
+    messageTime = timeFun()
+    scriptMsg = modeName + " EDD - " + outcome['status'] + " - " + str(outcome['records']) + " - Records - " + outcome['inputFile'] + " - " + messageTime
+    print(scriptMsg)
+    logMessage(scriptMsg, "INFO" if outcome['status'] == "Loaded" else "WARNING", function=modeName.lower() + "Main", **outcome)
+
+
+#Batch Mode - Process a Directory or Manifest of EDDs in one run.  EDDs are extracted and defined in parallel (process pool) against one
+#Event Catalog per hydro year, all appends go through a single writer thread.  An outcome report (.csv) is exported to the workspace.
+#inSource - Directory of EDDs or Manifest .csv file (see 'readBatchSource')
+#Returns "success function" or "failed function"
+def batchMain(inSource):
+    runStatus = "failed function"
+    try:
+
+        setupWorkspace()
+        enableCopyOnWrite()
+
+        #Confirm the QAQC/Field Duplicate and Lab Duplicate Records have been defined
+        if interactive:
+            confirmPrerequisites()
+        else:
+            logMessage("Non-Interactive Mode - QAQC/Field Duplicate and Lab Duplicate definitions not confirmed - " + timeFun(), "INFO", function="batchMain")
+
+        if runMode != "load":
+            messageTime = timeFun()
+            scriptMsg = "WARNING - Batch Mode loads the EDDs - Run Mode '" + runMode + "' is not supported in Batch Mode - Exiting Script - " + messageTime
+            print(scriptMsg)
+            logMessage(scriptMsg, "WARNING", function="batchMain", runMode=runMode)
+            exit()
+
+        if crosswalkConfig is not None:
+            logMessage("WARNING - Batch Mode processes the Target defined by the script parameters - Crosswalk Config not used: " + crosswalkConfig + " - " + timeFun(),
+                       "WARNING", function="batchMain")
+
+        eddList = readBatchSource(inSource)
+        messageTime = timeFun()
+        scriptMsg = "Batch Mode - " + str(len(eddList)) + " - EDDs to process from - " + inSource + " - " + messageTime
+        print(scriptMsg)
+        logMessage(scriptMsg, "INFO", function="batchMain", edds=len(eddList), batchSource=inSource)
+
+        #Prefetch one Event Catalog per hydro year - shared by all EDDs for the year
+        eventCatalogs = {}
+        for inYear in sorted(set(eddItem['hydroYear'] for eddItem in eddList)):
+            with stageSpan("fetchEventCatalog", hydroYear=inYear) as span:
+                outVal = fetchEventCatalog(inYear)
+                span['rowsOut'] = len(outVal[1]['events']) + len(outVal[1]['labDuplicates']) if outVal[0].lower() == "success function" else None
+            if outVal[0].lower() != "success function":
+                print("WARNING - Function fetchEventCatalog - " + str(inYear) + " - Failed - Exiting Script")
+                exit()
+            eventCatalogs[inYear] = outVal[1]
+
+        #Event Catalogs searched for the Suggested Events (adjacent hydro years) - passed to the worker processes (the workers do not query the database)
+        catalogLists = {}
+        if suggestMatches:
+            fetchedCatalogs = dict(eventCatalogs)
+            catalogLists = {inYear: suggestionCatalogs(inYear, eventCatalogs[inYear], fetchedCatalogs) for inYear in eventCatalogs}
+
+        #Single writer for the Periphyton DB
+        outcomeList = []
+        writerQueue = queue.Queue()
+        writerThread = threading.Thread(target=batchWriter, args=(writerQueue, outcomeList))
+        writerThread.start()
+
+        try:
+            #Worker processes are defined with the current script parameters
+            with concurrent.futures.ProcessPoolExecutor(max_workers=batchWorkers, initializer=initBatchWorker, initargs=(currentParameters(),)) as executor:
+                futureList = [executor.submit(processEDDWorker, eddItem, eventCatalogs[eddItem['hydroYear']], catalogLists.get(eddItem['hydroYear'], []))
+                              for eddItem in eddList]
+
+                for future in concurrent.futures.as_completed(futureList):
+                    outcome, df_DatasetToDefine = future.result()
+                    stageList = outcome.pop('stages', [])
+                    if runReportFile:
+                        getRunReport().addSpans(stageList, inputFile=outcome['inputFile'])
+                    if df_DatasetToDefine is not None:
+                        writerQueue.put((outcome, df_DatasetToDefine))
+                    else:
+                        logBatchOutcome(outcome)
+                        outcomeList.append(outcome)
+        finally:
+            writerQueue.put(None)
+            writerThread.join()
+
+        #Export the outcome report
+        outFull = os.path.join(workspace, "BatchReport_" + dateString + ".csv")
+        outcomeDf = pd.DataFrame(outcomeList, columns=['inputFile', 'hydroYear', 'status', 'records', 'recordsNullEvent', 'validationExceptions', 'outliers', 'inserted', 'skipped',
+                                                       'duplicates', 'conflicting', 'mismatches', 'outFile', 'message'])
+        outcomeDf.to_csv(outFull, index=False)
+
+        loadedCount = int((outcomeDf['status'] == "Loaded").sum())
+        messageTime = timeFun()
+        scriptMsg = "Batch Mode - Loaded: " + str(loadedCount) + " of " + str(len(outcomeDf)) + " - EDDs - Outcome Report: " + outFull + " - " + messageTime
+        print(scriptMsg)
+        logMessage(scriptMsg, "INFO", function="batchMain", loaded=loadedCount, edds=len(outcomeDf), outFile=outFull)
+
+        runStatus = "success function"
+        return runStatus
+
+    except:
+
+        messageTime = timeFun()
+        scriptMsg = "SCFN_TP_ETL.py - batchMain - " + messageTime
+        print (scriptMsg)
+        logMessage(scriptMsg, "ERROR", function="batchMain", traceback=traceback.format_exc())
+        traceback.print_exc(file=sys.stdout)
+        flushRunLogger()
+        return "failed function"
+
+    finally:
+        #Close the shared Periphyton DB connection, write the Run Report and flush the log
+        closeSession()
+        writeRunReport(runStatus, batchSource=inSource)
+        flushRunLogger()
+
+
+#Service Mode - Watch the inbox directory for new EDDs and process each as it arrives (until stopped - Ctrl+C).  The interpreter, the shared
+#Periphyton DB Session and the Event Catalog (see 'catalogSnapshots') stay warm between EDDs.  Each EDD is processed as in Batch Mode
+#(see 'processEDDWorker') once its size/modification time is unchanged between two polls, then moved with the files returned by its run (the
+#outcome 'outFile', the Outlier Review .csv file, the Run Report) and 'Outcome.json' to a '{EDD name}_{time}' folder in 'Done' (loaded) or
+#'Failed' of the inbox.  An EDD raising an error is logged and moved to 'Failed' - the service keeps polling.
+#inFolder - Inbox directory
+#maxPolls - Number of polls before the Service Mode ends (None runs until stopped) - an EDD is processed on its second poll
+#Returns "success function" or "failed function"
+def serviceMain(inFolder, maxPolls=None):
+    runStatus = "failed function"
+    try:
+
+        setupWorkspace()
+        enableCopyOnWrite()
+
+        #Confirm the QAQC/Field Duplicate and Lab Duplicate Records have been defined
+        if interactive:
+            confirmPrerequisites()
+        else:
+            logMessage("Non-Interactive Mode - QAQC/Field Duplicate and Lab Duplicate definitions not confirmed - " + timeFun(), "INFO", function="serviceMain")
+
+        if runMode != "load":
+            messageTime = timeFun()
+            scriptMsg = "WARNING - Service Mode loads the EDDs - Run Mode '" + runMode + "' is not supported in Service Mode - Exiting Script - " + messageTime
+            print(scriptMsg)
+            logMessage(scriptMsg, "WARNING", function="serviceMain", runMode=runMode)
+            exit()
+
+        if crosswalkConfig is not None:
+            logMessage("WARNING - Service Mode processes the Target defined by the script parameters - Crosswalk Config not used: " + crosswalkConfig + " - " + timeFun(),
+                       "WARNING", function="serviceMain")
+
+        doneFolder = os.path.join(inFolder, "Done")
+        failedFolder = os.path.join(inFolder, "Failed")
+        os.makedirs(doneFolder, exist_ok=True)
+        os.makedirs(failedFolder, exist_ok=True)
+
+        messageTime = timeFun()
+        scriptMsg = "Service Mode - Watching inbox: " + inFolder + " - every " + str(watchInterval) + " seconds - " + messageTime
+        print(scriptMsg)
+        logMessage(scriptMsg, "INFO", function="serviceMain", watchFolder=inFolder, watchInterval=watchInterval)
+
+        #Size/modification time of the EDDs seen on the previous poll - an EDD still being copied to the inbox is not processed
+        pendingFiles = {}
+        pollCount = 0
+        while maxPolls is None or pollCount < maxPolls:
+            pollCount += 1
+            seenFiles = {}
+            for eddItem in readBatchSource(inFolder):
+                try:
+                    fileStat = os.stat(eddItem['inputFile'])
+                except OSError:
+                    continue
+
+                seenFiles[eddItem['inputFile']] = (fileStat.st_size, fileStat.st_mtime)
+                if pendingFiles.get(eddItem['inputFile']) == seenFiles[eddItem['inputFile']]:
+                    del seenFiles[eddItem['inputFile']]
+                    try:
+                        processServiceEDD(eddItem, doneFolder, failedFolder)
+                    except Exception:
+                        failServiceEDD(eddItem, failedFolder)
+
+            pendingFiles = seenFiles
+            flushRunLogger()
+            if maxPolls is None or pollCount < maxPolls:
+                time.sleep(watchInterval)
+
+        runStatus = "success function"
+        return runStatus
+
+    except KeyboardInterrupt:
+        messageTime = timeFun()
+        scriptMsg = "Service Mode stopped - " + inFolder + " - " + messageTime
+        print(scriptMsg)
+        logMessage(scriptMsg, "INFO", function="serviceMain")
+        runStatus = "success function"
+        return runStatus
+
+    except:
+
+        messageTime = timeFun()
+        scriptMsg = "SCFN_TP_ETL.py - serviceMain - " + messageTime
+        print (scriptMsg)
+        logMessage(scriptMsg, "ERROR", function="serviceMain", traceback=traceback.format_exc())
+        traceback.print_exc(file=sys.stdout)
+        flushRunLogger()
+        return "failed function"
+
+    finally:
+        #Close the shared Periphyton DB connection, write the Run Report (spans outside of the EDDs) and flush the log
+        closeSession()
+        writeRunReport(runStatus, watchFolder=inFolder)
+        flushRunLogger()
+
+
+#Service Mode - Process one EDD from the inbox against the warm Event Catalog and move the EDD with its reports to the 'Done' or 'Failed' folder
+#eddItem - Dictionary from 'readBatchSource'
+#doneFolder - Folder of the loaded EDDs
+#failedFolder - Folder of the EDDs not loaded
+#Returns the outcome dictionary
+def processServiceEDD(eddItem, doneFolder, failedFolder):
+    eddName = os.path.splitext(os.path.basename(eddItem['inputFile']))[0]
+
+    #Report and log file names of the EDD - dated on the day the EDD is processed
+    refreshRunDate()
+
+    with stageSpan("fetchEventCatalog", hydroYear=eddItem['hydroYear']) as span:
+        outVal = fetchEventCatalog(eddItem['hydroYear'])
+        span['rowsOut'] = len(outVal[1]['events']) + len(outVal[1]['labDuplicates']) if outVal[0].lower() == "success function" else None
+
+    if outVal[0].lower() != "success function":
+        outcome = {'inputFile': eddItem['inputFile'], 'hydroYear': eddItem['hydroYear'], 'status': "Failed", 'records': 0,
+                   'recordsNullEvent': 0, 'validationExceptions': 0, 'outFile': None, 'message': "Failed function - 'fetchEventCatalog'"}
     else:
-        logFile = open(logFileName, "w")    #Creating index file if it doesn't exist
-        logFile.close()
+        outcome, df_DatasetToDefine = processEDDWorker(eddItem, outVal[1])
+        stageList = outcome.pop('stages', [])
+        if runReportFile:
+            getRunReport().addSpans(stageList, inputFile=eddItem['inputFile'])
+        if df_DatasetToDefine is not None:
+            appendResolvedEDD(outcome, df_DatasetToDefine)
+        del (df_DatasetToDefine)
+
+    #Database failure - the Periphyton DB Session is reconnected for the next EDD
+    if outcome['status'] in ("Failed", "Append Failed"):
+        closeSession()
+
+    logBatchOutcome(outcome, "Service")
+    runReportPath = writeRunReport(outcome['status'], inputFile=eddItem['inputFile'])
+
+    #Move the EDD and the files returned by its run
+    outFolder = os.path.join(doneFolder if outcome['status'] == "Loaded" else failedFolder, eddName + "_" + datetime.now().strftime("%Y%m%d_%H%M%S"))
+    os.makedirs(outFolder, exist_ok=True)
+    outcome['runReport'] = runReportPath
+    for fileKey in ['outFile', 'reviewFile', 'runReport']:
+        if outcome.get(fileKey) is not None and os.path.isfile(outcome[fileKey]):
+            outcome[fileKey] = shutil.move(outcome[fileKey], os.path.join(outFolder, os.path.basename(outcome[fileKey])))
+    shutil.move(eddItem['inputFile'], os.path.join(outFolder, os.path.basename(eddItem['inputFile'])))
+
+    with open(os.path.join(outFolder, "Outcome.json"), "w") as outcomeFile:
+        json.dump(outcome, outcomeFile, indent=2, default=str)
+
+    messageTime = timeFun()
+    scriptMsg = "Service EDD moved to: " + outFolder + " - " + messageTime
+    print(scriptMsg)
+    logMessage(scriptMsg, "INFO", function="serviceMain", outFolder=outFolder)
+    flushRunLogger()
+
+    return outcome
+
+
+#Service Mode - Log the error of an EDD and move the EDD to a '{EDD name}_{time}' folder in 'Failed' (when the EDD can be moved)
+#eddItem - Dictionary from 'readBatchSource'
+#failedFolder - Folder of the EDDs not loaded
+def failServiceEDD(eddItem, failedFolder):
+    messageTime = timeFun()
+    scriptMsg = "WARNING - Service EDD - Failed - " + eddItem['inputFile'] + " - " + messageTime
+    print(scriptMsg)
+    traceback.print_exc(file=sys.stdout)
+    logMessage(scriptMsg, "ERROR", function="serviceMain", inputFile=eddItem['inputFile'], traceback=traceback.format_exc())
+
+    #Database failure - the Periphyton DB Session is reconnected for the next EDD
+    closeSession()
+    try:
+        eddName = os.path.splitext(os.path.basename(eddItem['inputFile']))[0]
+        outFolder = os.path.join(failedFolder, eddName + "_" + datetime.now().strftime("%Y%m%d_%H%M%S"))
+        os.makedirs(outFolder, exist_ok=True)
+        shutil.move(eddItem['inputFile'], os.path.join(outFolder, os.path.basename(eddItem['inputFile'])))
+        logMessage("Service EDD moved to: " + outFolder + " - " + timeFun(), "INFO", function="serviceMain", outFolder=outFolder)
+    except OSError:
+        logMessage("WARNING - Unable to move the Service EDD to: " + failedFolder + " - " + timeFun(), "WARNING", function="serviceMain",
+                   inputFile=eddItem['inputFile'])
+    flushRunLogger()
+
+
+#Command line arguments - parameters not passed on the command line keep the values defined at the top of the script
+#argv - Argument list (None uses sys.argv)
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(description="Extract Transform and Load (ETL) the Total Phosphorus (TP) EDD to the Periphyton database table - tbl_Lab_Data_TotalPhosphorus")
+    parser.add_argument("--input-file", dest="inputFile", help="Excel EDD from the lab")
+    parser.add_argument("--raw-data-sheet", dest="rawDataSheet", help="Name of the Raw Data Sheet in the input file")
+    parser.add_argument("--first-row", dest="firstRow", help="Text value in the First Row and First Column of the data sheet that should be retained")
+    parser.add_argument("--hydro-year", dest="hydroYear", type=int, help="Hydrological year - field season for which processing is occurring")
+    parser.add_argument("--in-db", dest="inDB", help="Path to the Periphyton Access database (SQLite database file or sqlAlchemy URL per --db-backend)")
+    parser.add_argument("--db-backend", dest="dbBackend", choices=sorted(dbBackends),
+                        help="Periphyton DB Backend - access, sqlite or url (sqlAlchemy URL in --in-db) - defined from --in-db when not passed")
+    parser.add_argument("--workspace", dest="workspace", help="Workspace Folder")
+    parser.add_argument("--mode", dest="runMode", choices=["load", "plan", "apply"],
+                        help="load (extract, define and append), plan (write the Load Plan for review) or apply (append the Load Plan of --plan-file)")
+    parser.add_argument("--plan-file", dest="planFile", help="Load Plan file - written in plan mode and read in apply mode")
+    parser.add_argument("--journal", dest="loadJournal", action="store_true", default=None,
+                        help="Journal the load in the Load Journal (an interrupted load is resumable with --resume)")
+    parser.add_argument("--resume", dest="resumeLoad", nargs="?", const=True,
+                        help="Resume the interrupted load of the Load Journal file (default the latest incomplete journal in the workspace)")
+    parser.add_argument("--crosswalk-config", dest="crosswalkConfig", help="Crosswalk Config .json file - Targets (sheets/analytes) processed from the workbook in one run")
+    parser.add_argument("--batch-source", dest="batchSource", help="Batch Mode - Directory of EDDs or Manifest .csv file")
+    parser.add_argument("--watch-folder", dest="watchFolder", help="Service Mode - Inbox directory watched for new EDDs (moved to Done/Failed with their reports)")
+    parser.add_argument("--watch-interval", dest="watchInterval", type=float, help="Seconds between the Service Mode polls of the inbox")
+    parser.add_argument("--batch-workers", dest="batchWorkers", type=int, help="Number of worker processes used in Batch Mode")
+    parser.add_argument("--append-chunk-size", dest="appendChunkSize", type=int, help="Number of records appended per transaction")
+    parser.add_argument("--log-level", dest="logLevel", choices=["DEBUG", "INFO", "WARNING", "ERROR"], help="Minimum level of messages written to the log file")
+    parser.add_argument("--validation", dest="validationMode", choices=["report", "block", "off"],
+                        help="Validation of the EDD measurements - report (export exceptions), block (export exceptions and do not load) or off")
+    parser.add_argument("--append-mode", dest="appendMode", choices=["direct", "staging"],
+                        help="direct (transactional batches) or staging (staging table promoted with one INSERT ... SELECT)")
+    parser.add_argument("--on-conflict", dest="conflictAction", choices=["skip", "replace", "insert"],
+                        help="Records already loaded with different values - skip (report only), replace or insert")
+    parser.add_argument("--no-reconcile", dest="reconcileLoad", action="store_false", default=None,
+                        help="Do not reconcile the load (aggregate query of the table compared to the records loaded)")
+    parser.add_argument("--refresh-catalog", dest="catalogCache", action="store_false", default=None,
+                        help="Query the Event Catalog from the database (ignore the local Catalog Snapshot)")
+    parser.add_argument("--no-prefetch", dest="prefetchCatalog", action="store_false", default=None,
+                        help="Fetch the Event Catalog before the EDD is parsed (not on a background thread)")
+    parser.add_argument("--no-run-report", dest="runReportFile", action="store_false", default=None,
+                        help="Do not instrument the stages or write the Run Report .json file")
+    parser.add_argument("--trace-memory", dest="traceMemory", action="store_true", default=None,
+                        help="Trace the peak Python memory (tracemalloc) of each Run Report stage - slows the run")
+    parser.add_argument("--no-compact-frames", dest="compactFrames", action="store_false", default=None,
+                        help="Keep the object (text) fields of the EDD - no categorical/float fields or Copy-on-Write")
+    parser.add_argument("--no-outlier-flags", dest="outlierFlagging", action="store_false", default=None,
+                        help="Do not flag the values outside the Site_ID/Visit_Type history (Notes field and Outlier Review report)")
+    parser.add_argument("--outlier-threshold", dest="outlierThreshold", type=float, help="Robust z-score above which a value is flagged as an outlier")
+    parser.add_argument("--stream-chunk-size", dest="streamChunkSize", type=int,
+                        help="Streaming Mode - number of EDD records per chunk (memory bounded load of very large EDDs)")
+    parser.add_argument("--non-interactive", dest="interactive", action="store_false", default=None,
+                        help="Headless run - no Message Boxes (tkinter is not loaded), warnings are logged only")
+
+    return parser.parse_args(argv)
+
+
+#Command line entry point - Returns the exit code (0 - success, 1 - failed)
+def cliMain(argv=None):
+    arguments = parseArguments(argv)
+    configure(**vars(arguments))
 
     # Analyses routine ---------------------------------------------------------
-    main()
+    if resumeLoad is not None:
+        outVal = resumeMain(resumeLoad)
+    elif runMode == "apply":
+        outVal = applyMain(planFile)
+    elif watchFolder is not None:
+        outVal = serviceMain(watchFolder)
+    elif batchSource is None and streamChunkSize is not None:
+        outVal = streamMain()
+    elif batchSource is None:
+        outVal = main()
+    else:
+        outVal = batchMain(batchSource)
+
+    return 0 if outVal == "success function" else 1
+
+
+if __name__ == '__main__':
+
+    sys.exit(cliMain())
@@ -0,0 +1,307 @@
+# ---------------------------------------------------------------------------
+# SFCN_TP_ETL_Benchmark
+# Description:  Benchmark of the SFCN_TP_ETL.py stages without the Windows Access driver or the Periphyton .accdb.  A synthetic FIU SERC style
+# EDD and a local SQLite stand-in for the Periphyton schema (tbl_Site, tbl_Event_Group, tbl_Event, tbl_LabDuplicates and
+# tbl_Lab_Data_TotalPhosphorus) are generated for each benchmark size.
+
+# Code performs the following routines:
+# For each size - generates the SQLite database with the Hydro Year Event Catalog and an EDD with the header rows, the 'firstRow' row and the
+# 'fieldCrossWalk1' columns with a mix of Standard, Extra Sample, Pilot - Spatial, QAQC and Lab Duplicate records.  The load (extractEDD),
+# catalog (fetchEventCatalog), resolve (resolveEvents) and append (appendRecords) stages are timed separately, then a full run (main) against
+# a copy of the database is timed with the default Run Report settings.  The results are appended to the benchmark results .csv file.  Stage times are compared to the previous run of the same size and stage so regressions show up.
+
+# Usage:  python SFCN_TP_ETL_Benchmark.py --sizes 100 1000 10000 --workspace benchmark
+
+# Dependences:
+# Python version 3.9
+# Pandas, openpyxl and sqlalchemy (sqlalchemy-access/pyodbc are not required)
+# ---------------------------------------------------------------------------
+
+###################################################
+# Start of Parameters requiring set up.
+###################################################
+#Number of EDD records for each benchmark run
+benchmarkSizes = [100, 1000, 10000, 100000, 1000000]
+
+#Fraction of the EDD records by Visit Type/Lab Duplicate
+recordMix = {'Standard': 0.80, 'Extra Sample': 0.06, 'Pilot - Spatial': 0.04, 'QAQC': 0.05, 'Lab Duplicate': 0.05}
+
+#Hydrological year of the synthetic Event Catalog - Events for the prior Hydro Year are also generated (not matched by the EDD)
+benchmarkHydroYear = 2021
+
+#Directory Information - the databases, EDDs and ETL workspaces are created in sub folders by size
+benchmarkWorkspace = r'C:\SFCN\Monitoring\Periphyton\Data\Benchmark'
+
+#Benchmark results .csv file (appended to on each run) - None uses 'BenchmarkResults.csv' in the 'benchmarkWorkspace'
+benchmarkResults = None
+
+#Stage time ratio to the previous run (same size and stage) reported as a regression
+regressionThreshold = 1.25
+
+#Seed of the synthetic EDD values
+randomSeed = 20230210
+
+#######################################
+## Below are paths which are hard coded
+#######################################
+#Import Required Libraries
+import os
+import argparse
+import platform
+import random
+import shutil
+import subprocess
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+import sqlalchemy as sa
+from openpyxl import Workbook
+
+import SFCN_TP_ETL as etl
+
+#Run Report settings of the ETL script ('runReportFile', 'traceMemory') - the 'run' stage is timed with the defaults so the instrumentation
+#overhead is part of the benchmark
+runReportDefaults = {'runReportFile': etl.runReportFile, 'traceMemory': etl.traceMemory}
+
+#Benchmark results fields
+resultFields = ['runTime', 'revision', 'size', 'stage', 'seconds', 'records', 'recordsPerSecond', 'python', 'pandas', 'platform']
+##################################
+
+
+#Run the benchmark for each size - Returns the list of result dictionaries
+def benchmarkMain(sizeList):
+    runTime = datetime.now().isoformat(timespec="seconds")
+    revision = sourceRevision()
+    resultList = []
+
+    for size in sizeList:
+        for stage, seconds, records in benchmarkSize(size):
+            resultList.append({'runTime': runTime, 'revision': revision, 'size': size, 'stage': stage, 'seconds': round(seconds, 4),
+                               'records': records, 'recordsPerSecond': round(records / seconds, 1) if seconds > 0 else None,
+                               'python': platform.python_version(), 'pandas': pd.__version__, 'platform': platform.platform()})
+
+    resultsFile = benchmarkResults
+    if resultsFile is None:
+        resultsFile = os.path.join(benchmarkWorkspace, "BenchmarkResults.csv")
+
+    resultDf = pd.DataFrame(resultList, columns=resultFields)
+    reportResults(resultDf, resultsFile)
+
+    resultDf.to_csv(resultsFile, mode="a", index=False, header=not os.path.exists(resultsFile))
+    print("Benchmark results appended to: " + resultsFile)
+
+    return resultList
+
+
+#Benchmark one size - generates the database and EDD, runs the ETL stages against the SQLite stand-in
+#Returns list of (stage, seconds, records)
+def benchmarkSize(size):
+    sizeWorkspace = os.path.join(benchmarkWorkspace, "Size_" + str(size))
+    os.makedirs(sizeWorkspace, exist_ok=True)
+    dbPath = os.path.join(sizeWorkspace, "Periphyton_Benchmark.sqlite")
+    eddPath = os.path.join(sizeWorkspace, "Benchmark_EDD_" + str(size) + ".xlsx")
+
+    print("Generating the Benchmark Database and EDD - " + str(size) + " records - " + etl.timeFun())
+    siteIDList = createBenchmarkDB(dbPath, size)
+    createBenchmarkEDD(eddPath, siteIDList)
+    runDBPath = os.path.join(sizeWorkspace, "Periphyton_Benchmark_Run.sqlite")
+    shutil.copyfile(dbPath, runDBPath)
+
+    #Each stage runs from the source - the EDD and Catalog caches are not used
+    etl.configure(inputFile=eddPath, hydroYear=benchmarkHydroYear, inDB=dbPath, dbBackend="sqlite", workspace=sizeWorkspace, interactive=False,
+                  eddCache=False, catalogCache=False, runReportFile=False, logLevel="WARNING")
+    etl.setupWorkspace()
+
+    stageList = []
+    try:
+        startTime = time.perf_counter()
+        outVal = etl.extractEDD(eddPath, etl.rawDataSheet, etl.firstRow)
+        stageList.append(("load", time.perf_counter() - startTime, size))
+        checkStage(outVal, "extractEDD")
+        df_DatasetToDefine = outVal[1]
+
+        startTime = time.perf_counter()
+        outVal = etl.fetchEventCatalog(benchmarkHydroYear)
+        stageSeconds = time.perf_counter() - startTime
+        checkStage(outVal, "fetchEventCatalog")
+        eventCatalog = outVal[1]
+        stageList.append(("catalog", stageSeconds, len(eventCatalog['events']) + len(eventCatalog['labDuplicates'])))
+
+        startTime = time.perf_counter()
+        outVal = etl.resolveEvents(df_DatasetToDefine, eventCatalog)
+        etl.defineLabFields(df_DatasetToDefine)
+        stageList.append(("resolve", time.perf_counter() - startTime, size))
+        checkStage(outVal, "resolveEvents")
+        if outVal[1] > 0:
+            raise RuntimeError("Benchmark EDD has " + str(outVal[1]) + " records with Null 'Event_ID' values")
+
+        startTime = time.perf_counter()
+        outVal = etl.appendRecords(df_DatasetToDefine)
+        stageList.append(("append", time.perf_counter() - startTime, size))
+        checkStage(outVal, "appendRecords")
+        if outVal[1]['inserted'] != size:
+            raise RuntimeError("Benchmark append inserted " + str(outVal[1]['inserted']) + " of " + str(size) + " records")
+        etl.closeSession()
+
+        #Full run (extract, define and append) with the default Run Report settings - the instrumentation overhead is included
+        etl.configure(inDB=runDBPath, **runReportDefaults)
+        startTime = time.perf_counter()
+        outVal = etl.main()
+        stageList.append(("run", time.perf_counter() - startTime, size))
+        if outVal != "success function":
+            raise RuntimeError("Benchmark stage failed - Function main")
+
+    finally:
+        etl.closeSession()
+        etl.flushRunLogger()
+
+    return stageList
+
+
+#Raise when an ETL stage did not return 'success function'
+def checkStage(outVal, functionName):
+    if isinstance(outVal, str) or outVal[0].lower() != "success function":
+        raise RuntimeError("Benchmark stage failed - Function " + functionName)
+
+
+#Create the Benchmark Database - the Periphyton schema subset used by the ETL with the Hydro Year Event Catalog for 'size' EDD records
+#Returns the list of EDD 'Site ID' values (Site_Name, Site_IDLab_QCExtra or LabSiteID by the 'recordMix')
+def createBenchmarkDB(dbPath, size):
+    if os.path.exists(dbPath):
+        os.remove(dbPath)
+
+    recordCounts = mixCounts(size)
+    siteCount = recordCounts['Standard'] + recordCounts['Extra Sample'] + recordCounts['Pilot - Spatial']
+    startDate = datetime(benchmarkHydroYear, 5, 1)
+
+    siteList = [("SITE-" + str(siteNumber), "S" + str(siteNumber).zfill(7)) for siteNumber in range(siteCount)]
+    eventGroupList = [("EG-HY" + str(year), year) for year in (benchmarkHydroYear - 1, benchmarkHydroYear)]
+    eventList = []
+    labDuplicateList = []
+    siteIDList = []
+
+    visitTypeList = ["Standard"] * recordCounts['Standard'] + ["Extra Sample"] * recordCounts['Extra Sample'] + ["Pilot - Spatial"] * recordCounts['Pilot - Spatial']
+    for siteNumber, (siteID, siteName) in enumerate(siteList):
+        eventDate = (startDate + timedelta(days=siteNumber % 200)).strftime("%Y-%m-%d")
+        eventList.append(("EV-HY" + str(benchmarkHydroYear) + "-" + str(siteNumber), "EG-HY" + str(benchmarkHydroYear), siteID, eventDate, visitTypeList[siteNumber], None))
+        eventList.append(("EV-HY" + str(benchmarkHydroYear - 1) + "-" + str(siteNumber), "EG-HY" + str(benchmarkHydroYear - 1), siteID, eventDate, "Standard", None))
+        siteIDList.append(siteName)
+
+    #QAQC Events - joined on 'Site_IDLab_QCExtra'
+    for qaqcNumber in range(recordCounts['QAQC']):
+        siteID = siteList[qaqcNumber % siteCount][0]
+        qcExtra = "QC" + str(qaqcNumber)
+        eventList.append(("EV-QC-" + str(qaqcNumber), "EG-HY" + str(benchmarkHydroYear), siteID, startDate.strftime("%Y-%m-%d"), "QAQC", qcExtra))
+        siteIDList.append(qcExtra)
+
+    #Lab Duplicates of the Standard Events - joined on 'LabSiteID'
+    for duplicateNumber in range(recordCounts['Lab Duplicate']):
+        siteNumber = duplicateNumber % recordCounts['Standard']
+        labSiteID = siteList[siteNumber][1] + "-LD" + str(duplicateNumber // recordCounts['Standard'])
+        labDuplicateList.append(("EV-HY" + str(benchmarkHydroYear) + "-" + str(siteNumber), labSiteID, etl.labDuplicateType))
+        siteIDList.append(labSiteID)
+
+    engine = sa.create_engine("sqlite:///" + dbPath)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE tbl_Site (Site_ID TEXT PRIMARY KEY, Site_Name TEXT)")
+        conn.exec_driver_sql("CREATE TABLE tbl_Event_Group (Event_Group_ID TEXT PRIMARY KEY, Hydrologic_Year INTEGER)")
+        conn.exec_driver_sql("CREATE TABLE tbl_Event (Event_ID TEXT PRIMARY KEY, Event_Group_ID TEXT, Site_ID TEXT, Start_Date TEXT, Visit_Type TEXT,"
+                             " Site_IDLab_QCExtra TEXT)")
+        conn.exec_driver_sql("CREATE TABLE tbl_LabDuplicates (Event_ID TEXT, LabSiteID TEXT, Type TEXT)")
+        conn.exec_driver_sql("CREATE TABLE " + etl.phosphorusTable + " (TotalPhosphorus_Data_ID TEXT PRIMARY KEY, Event_ID TEXT, TP_Lab_Name TEXT,"
+                             " TP_Lab_SOP TEXT, TP_Lab_ID TEXT, TP_Lab_MDL TEXT, Bottle_Weight_g REAL, Plant_Weight_g REAL, Sample_Wet_Weight_g REAL,"
+                             " Total_Phosphorus TEXT, DuplicateRecord TEXT, Notes TEXT)")
+        #Indexes on the '*ID' fields (i.e. as created by the Access 'AutoIndex on Import/Create' default)
+        conn.exec_driver_sql("CREATE INDEX idx_Event_Event_Group_ID ON tbl_Event (Event_Group_ID)")
+        conn.exec_driver_sql("CREATE INDEX idx_Event_Site_ID ON tbl_Event (Site_ID)")
+        conn.exec_driver_sql("CREATE INDEX idx_LabDuplicates_Event_ID ON tbl_LabDuplicates (Event_ID)")
+        conn.exec_driver_sql("CREATE INDEX idx_TP_Event_ID ON " + etl.phosphorusTable + " (Event_ID)")
+        conn.exec_driver_sql("INSERT INTO tbl_Site VALUES (?, ?)", siteList)
+        conn.exec_driver_sql("INSERT INTO tbl_Event_Group VALUES (?, ?)", eventGroupList)
+        conn.exec_driver_sql("INSERT INTO tbl_Event VALUES (?, ?, ?, ?, ?, ?)", eventList)
+        if len(labDuplicateList) > 0:
+            conn.exec_driver_sql("INSERT INTO tbl_LabDuplicates VALUES (?, ?, ?)", labDuplicateList)
+    engine.dispose()
+
+    return siteIDList
+
+
+#Record count by Visit Type/Lab Duplicate for 'size' EDD records - the remainder of the 'recordMix' fractions are Standard records
+def mixCounts(size):
+    recordCounts = {mixName: int(size * mixFraction) for mixName, mixFraction in recordMix.items() if mixName != "Standard"}
+    recordCounts['Standard'] = size - sum(recordCounts.values())
+    if recordCounts['Standard'] < 1:
+        raise ValueError("recordMix leaves no Standard records for size: " + str(size))
+    return recordCounts
+
+
+#Create the Benchmark EDD (.xlsx) - lab header rows, the 'firstRow' row with the 'fieldCrossWalk1' names and one record per 'Site ID' (shuffled)
+def createBenchmarkEDD(eddPath, siteIDList):
+    randomGen = random.Random(randomSeed)
+    siteIDList = list(siteIDList)
+    randomGen.shuffle(siteIDList)
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(etl.rawDataSheet)
+    sheet.append(["Florida International University - Southeast Environmental Research Center"])
+    sheet.append(["Periphyton Total Phosphorus - Hydro Year " + str(benchmarkHydroYear)])
+    sheet.append([])
+    sheet.append([etl.firstRow] + etl.fieldCrossWalk1[1:])
+
+    sampleDate = datetime(benchmarkHydroYear, 11, 15)
+    for siteID in siteIDList:
+        bottleWeight = round(randomGen.uniform(9.0, 11.0), 4)
+        wetWeight = round(randomGen.uniform(0.5, 5.0), 4)
+        sheet.append(["BICY", siteID, sampleDate, round(bottleWeight + wetWeight, 4), bottleWeight, wetWeight,
+                      round(randomGen.uniform(50, 1500), 2), round(randomGen.uniform(0.1, 2.0), 4)])
+
+    workbook.save(eddPath)
+
+
+#Print the stage times with the ratio to the previous run of the same size and stage (regressions flagged)
+def reportResults(resultDf, resultsFile):
+    previousDf = None
+    if os.path.exists(resultsFile):
+        previousDf = pd.read_csv(resultsFile)
+        previousDf = previousDf[previousDf['runTime'] == previousDf['runTime'].max()].set_index(['size', 'stage'])
+
+    for result in resultDf.itertuples(index=False):
+        scriptMsg = "Size: " + str(result.size) + " - Stage: " + result.stage + " - Seconds: " + str(result.seconds) + " - Records/Second: " + str(result.recordsPerSecond)
+        if previousDf is not None and (result.size, result.stage) in previousDf.index:
+            previousSeconds = previousDf.loc[(result.size, result.stage), 'seconds']
+            ratio = result.seconds / previousSeconds if previousSeconds > 0 else 1.0
+            scriptMsg = scriptMsg + " - Previous: " + str(previousSeconds) + " (x" + str(round(ratio, 2)) + ")"
+            if ratio > regressionThreshold:
+                scriptMsg = "REGRESSION - " + scriptMsg
+        print(scriptMsg)
+
+
+#Git revision of the script folder - None when not a git repository
+def sourceRevision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+#Parse the command line arguments - arguments not passed keep the parameter values at the top of the script
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the SFCN_TP_ETL stages against a synthetic EDD and a SQLite stand-in for the Periphyton database")
+    parser.add_argument("--sizes", dest="benchmarkSizes", type=int, nargs="+", help="Number of EDD records for each benchmark run")
+    parser.add_argument("--workspace", dest="benchmarkWorkspace", help="Benchmark workspace folder")
+    parser.add_argument("--results", dest="benchmarkResults", help="Benchmark results .csv file (appended to)")
+
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+
+    arguments = parseArguments()
+    for parameterName, parameterValue in vars(arguments).items():
+        if parameterValue is not None:
+            globals()[parameterName] = parameterValue
+
+    os.makedirs(benchmarkWorkspace, exist_ok=True)
+    benchmarkMain(benchmarkSizes)
@@ -0,0 +1,49 @@
+#Test fixtures - the ETL is run against the SQLite benchmark database and EDD (see 'SFCN_TP_ETL_Benchmark') in the test folder
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import SFCN_TP_ETL as etl
+import SFCN_TP_ETL_Benchmark as benchmark
+
+#Records of the benchmark database and EDD
+benchmarkSize = 200
+
+
+#Script parameters restored after each test - the shared Periphyton DB Session and the Run Logger are closed
+@pytest.fixture(autouse=True)
+def etlParameters():
+    baseParameters = etl.currentParameters()
+    yield
+    etl.closeSession()
+    etl.closeRunLogger()
+    etl.applyTargetParameters(baseParameters, {})
+
+
+#Benchmark database and EDD - Returns function configuring the ETL for a workspace (a copy of the database and EDD) in the test folder
+@pytest.fixture
+def benchmarkWorkspace(tmp_path):
+    sourceFolder = tmp_path / "Source"
+    sourceFolder.mkdir()
+    siteIDList = benchmark.createBenchmarkDB(str(sourceFolder / "Periphyton.sqlite"), benchmarkSize)
+    benchmark.createBenchmarkEDD(str(sourceFolder / "EDD.xlsx"), siteIDList)
+
+    #workspaceName - Workspace folder name
+    #parameters - Script parameters of the run (see 'configure')
+    def configureWorkspace(workspaceName, **parameters):
+        workspace = tmp_path / workspaceName
+        if not workspace.exists():
+            workspace.mkdir()
+            for fileName in ["Periphyton.sqlite", "EDD.xlsx"]:
+                (workspace / fileName).write_bytes((sourceFolder / fileName).read_bytes())
+
+        etl.closeSession()
+        etl.closeRunLogger()
+        etl.configure(inputFile=str(workspace / "EDD.xlsx"), inDB=str(workspace / "Periphyton.sqlite"), workspace=str(workspace), dbBackend="sqlite",
+                      hydroYear=benchmark.benchmarkHydroYear, interactive=False, **parameters)
+        return workspace
+
+    return configureWorkspace
@@ -0,0 +1,42 @@
+#Load Journal - an interrupted journaled load is resumed after the last committed batch
+import contextlib
+import os
+import sqlite3
+
+import SFCN_TP_ETL as etl
+from conftest import benchmarkSize
+
+
+#Records in the Target table
+def tableCount(workspace):
+    with sqlite3.connect(str(workspace / "Periphyton.sqlite")) as conn:
+        return conn.execute("SELECT Count(*) FROM " + etl.phosphorusTable).fetchone()[0]
+
+
+def test_resumeAfterBatchFailure(benchmarkWorkspace, monkeypatch):
+    workspace = benchmarkWorkspace("Journal", loadJournal=True, appendChunkSize=50)
+
+    #Fail the third append batch - the batch is rolled back and the load stops
+    transaction = etl.DBSession.transaction
+    batchCount = {'batches': 0}
+
+    @contextlib.contextmanager
+    def failingTransaction(session):
+        batchCount['batches'] += 1
+        with transaction(session) as trans:
+            if batchCount['batches'] == 3:
+                raise RuntimeError("Injected batch failure")
+            yield trans
+
+    monkeypatch.setattr(etl.DBSession, "transaction", failingTransaction)
+    assert etl.main() == "failed function"
+    assert tableCount(workspace) == 100
+    journalFile = etl.LoadJournal.latest(etl.loadJournalFolder())
+    assert journalFile is not None
+
+    #Resume - the remaining batches are appended and the completed Load Journal is removed
+    monkeypatch.setattr(etl.DBSession, "transaction", transaction)
+    assert etl.resumeMain(True) == "success function"
+    assert tableCount(workspace) == benchmarkSize
+    assert not os.path.exists(journalFile)
+    assert etl.resumeMain(True) == "failed function"
@@ -0,0 +1,46 @@
+#Streaming Mode - the records loaded and the reports are those of the in memory load, and a rerun skips the records already loaded
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import SFCN_TP_ETL as etl
+from conftest import benchmarkSize
+
+
+#Records in the Target table ordered by the record key
+def tableRecords(workspace):
+    with sqlite3.connect(str(workspace / "Periphyton.sqlite")) as conn:
+        tableDf = pd.read_sql("SELECT * FROM " + etl.phosphorusTable, conn)
+    return tableDf.sort_values(etl.recordKeyField).reset_index(drop=True)
+
+
+#Appended records .csv file (see 'appendRecords') ordered by the record key
+def appendedRecords(workspace):
+    appendedDf = pd.read_csv(workspace / "DataFrameAppended.csv", dtype=str)
+    return appendedDf.sort_values(etl.recordKeyField).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("chunkSize", [1000, 37])
+def test_streamParity(benchmarkWorkspace, chunkSize):
+    memoryWorkspace = benchmarkWorkspace("Memory")
+    assert etl.main() == "success function"
+
+    streamWorkspace = benchmarkWorkspace("Stream", streamChunkSize=chunkSize)
+    assert etl.streamMain() == "success function"
+
+    assert len(tableRecords(streamWorkspace)) == benchmarkSize
+    pd.testing.assert_frame_equal(tableRecords(streamWorkspace), tableRecords(memoryWorkspace))
+    pd.testing.assert_frame_equal(appendedRecords(streamWorkspace), appendedRecords(memoryWorkspace))
+
+
+@pytest.mark.parametrize("chunkSize", [None, 37])
+def test_rerunSkipsLoadedRecords(benchmarkWorkspace, chunkSize):
+    runMain = etl.main if chunkSize is None else etl.streamMain
+    workspace = benchmarkWorkspace("Rerun", streamChunkSize=chunkSize)
+    assert runMain() == "success function"
+    assert appendedRecords(workspace)['LoadAction'].value_counts().to_dict() == {"Insert": benchmarkSize}
+
+    assert runMain() == "success function"
+    assert appendedRecords(workspace)['LoadAction'].value_counts().to_dict() == {"Skip": benchmarkSize}
+    assert len(tableRecords(workspace)) == benchmarkSize